@@ -1,16 +1,77 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, Query, HTTPException, WebSocket, WebSocketDisconnect, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, JSONResponse
 import uvicorn
-import tempfile
 import os
-import shutil
+import time
+import asyncio
 import logging
-import requests
-from audio_command_detector import AudioCommandDetector
+import metrics
+from audio_io import AudioDecodeError, AudioTooShortError, UnsupportedAudioType, PCM_TYPES, is_supported_audio_type, media_type
+from worker_pool import PoolSaturatedError, batch_size_for
+from streaming import StreamingSegmenter
+from audio_gate import thresholds_from_env
+from command_router import DISPATCH_THRESHOLD, CommandRouter, load_routing_table
 from pydantic import BaseModel
+from typing import Optional
 
 # ESP32 IP CONFIG
-ESP32_IP = "10.42.0.120"
+ESP32_IP = os.getenv("ESP32_IP", "10.42.0.120")
+ESP32_TIMEOUT = float(os.getenv("ESP32_TIMEOUT", "1.5"))
+ESP32_RETRIES = int(os.getenv("ESP32_RETRIES", "2"))
+# "background": reply before the device acknowledges; "wait": reply with the device result
+ESP32_DISPATCH_MODE = os.getenv("ESP32_DISPATCH_MODE", "background")
+# Multi-device routing table, inline JSON or a file path (see command_router.py); ESP32_IP only when unset
+DEVICE_ROUTES = os.getenv("DEVICE_ROUTES", "")
+# A repeat of the command being sent, or delivered within this many seconds, is dropped
+COMMAND_COALESCE_WINDOW = float(os.getenv("COMMAND_COALESCE_WINDOW", "1.0"))
+COMMAND_QUEUE_SIZE = int(os.getenv("COMMAND_QUEUE_SIZE", "32"))
+
+
+# Spectrogram resize backend: "numpy" (default) or "tensorflow"
+RESIZE_BACKEND = os.getenv("RESIZE_BACKEND", "numpy")
+# Mel extraction: "frontend" (precomputed, vectorized) or "librosa"
+MEL_BACKEND = os.getenv("MEL_BACKEND", "frontend")
+
+# Model runtime: eager, torchscript, onnx, int8-dynamic or int8-static (see model_runtime.py)
+MODEL_RUNTIME = os.getenv("MODEL_RUNTIME", "eager")
+# Optional file written by `python model_runtime.py export`; built in memory when unset
+MODEL_ARTIFACT = os.getenv("MODEL_ARTIFACT") or None
+
+# Worker pool for CPU-bound inference: "thread", "process", or "shared" (one inference
+# process behind several HTTP workers; set by serve.py)
+INFERENCE_EXECUTOR = os.getenv("INFERENCE_EXECUTOR", "thread")
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "2"))
+# Requests allowed to run or wait for a worker before we answer 503
+INFERENCE_MAX_PENDING = int(os.getenv("INFERENCE_MAX_PENDING", str(INFERENCE_WORKERS * 4)))
+RETRY_AFTER_SECONDS = int(os.getenv("RETRY_AFTER_SECONDS", "1"))
+
+# Micro-batching of concurrent model calls; by default a batch holds one request per
+# inference thread (batching is off in process mode, where each process runs one call)
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "0")) or batch_size_for(INFERENCE_EXECUTOR, INFERENCE_WORKERS)
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "5"))
+
+# Result cache for repeated uploads (RESULT_CACHE_SIZE=0 disables it)
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "256"))
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "300"))
+# Whether a cached result (a resent clip) triggers the ESP32 command again
+CACHE_REDISPATCH = os.getenv("CACHE_REDISPATCH", "false").lower() == "true"
+
+# Per-device noise profiles for denoising (NOISE_PROFILE_DEVICES=0 disables them)
+NOISE_PROFILE_DEVICES = int(os.getenv("NOISE_PROFILE_DEVICES", "64"))
+
+# Early rejection of silence / noise / clipped uploads before the full pipeline
+GATE_ENABLED = os.getenv("GATE_ENABLED", "true").lower() != "false"
+GATE_THRESHOLDS = thresholds_from_env()
+
+# Run the pipeline once on a synthetic clip before reporting ready
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() != "false"
+
+# Minimum upload size: 1.5 seconds of 16 kHz mono int16
+MIN_AUDIO_BYTES = 16000 * 2 * 1.5
+MIN_AUDIO_SECONDS = 1.5
+# Largest upload /predict and /predict/raw read before answering 413
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(2 * 1024 * 1024)))
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -31,96 +92,426 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize detector
-detector = AudioCommandDetector()
+# Initialize detector and worker pool
+detector_kwargs = {
+    "max_batch_size": BATCH_MAX_SIZE,
+    "max_batch_wait_ms": BATCH_MAX_WAIT_MS,
+    "resize_backend": RESIZE_BACKEND,
+    "mel_backend": MEL_BACKEND,
+    "cache_size": RESULT_CACHE_SIZE,
+    "cache_ttl": RESULT_CACHE_TTL,
+    "runtime": MODEL_RUNTIME,
+    "runtime_artifact": MODEL_ARTIFACT,
+    "noise_profiles": NOISE_PROFILE_DEVICES,
+    "early_rejection": GATE_ENABLED,
+    "gate_thresholds": GATE_THRESHOLDS,
+}
+# Built in the background at startup so /health answers immediately; /ready tells when serving
+detector = None
+inference_pool = None
+startup_state = {"status": "starting", "phase": None, "timings": {}, "error": None}
+
+def load_models():
+    """Import the heavy modules, load the model(s) and warm up, recording each phase's duration"""
+    global detector, inference_pool
+    started = time.perf_counter()
+
+    def phase(name, fn):
+        startup_state["phase"] = name
+        start = time.perf_counter()
+        result = fn()
+        startup_state["timings"][name] = round(time.perf_counter() - start, 3)
+        return result
+
+    def import_detector():
+        from audio_command_detector import AudioCommandDetector
+        from worker_pool import InferencePool
+        return AudioCommandDetector, InferencePool
+
+    if INFERENCE_EXECUTOR == "shared":
+        # The model lives in serve.py's inference process; wait until it is ready
+        from shared_inference import connect
+        pool = connect(retry_after=RETRY_AFTER_SECONDS)
+        phase("warm_up", pool.warm_up)
+    else:
+        AudioCommandDetector, InferencePool = phase("import", import_detector)
+        # In process mode each pool process loads its own model
+        if INFERENCE_EXECUTOR != "process":
+            detector = phase("model_load", lambda: AudioCommandDetector(**detector_kwargs))
+        pool = phase("pool_start", lambda: InferencePool(
+            workers=INFERENCE_WORKERS,
+            mode=INFERENCE_EXECUTOR,
+            max_pending=INFERENCE_MAX_PENDING,
+            retry_after=RETRY_AFTER_SECONDS,
+            detector=detector,
+            detector_kwargs=detector_kwargs,
+        ))
+        # Process workers load and warm up their own detector on first use
+        if WARMUP_ENABLED or INFERENCE_EXECUTOR == "process":
+            phase("warm_up", pool.warm_up)
+    inference_pool = pool
+    startup_state["timings"]["total"] = round(time.perf_counter() - started, 3)
+    startup_state.update(status="ready", phase=None)
+    logger.info(f"🚀 Ready to serve, startup timings: {startup_state['timings']}")
+
+def get_pool():
+    """The inference pool, or a 503 while startup is still running or after it failed"""
+    if startup_state["status"] == "failed":
+        # Not transient: no Retry-After, /ready has the same details
+        raise HTTPException(
+            status_code=503,
+            detail=f"Model failed to load during {startup_state['phase']}: {startup_state['error']}",
+        )
+    if inference_pool is None:
+        raise HTTPException(
+            status_code=503,
+            detail="Model is still loading",
+            headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+        )
+    return inference_pool
+
+router_kwargs = {
+    "table": load_routing_table(DEVICE_ROUTES, f"http://{ESP32_IP}"),
+    "timeout": ESP32_TIMEOUT,
+    "retries": ESP32_RETRIES,
+    "coalesce_window": COMMAND_COALESCE_WINDOW,
+    "max_queue": COMMAND_QUEUE_SIZE,
+}
+if INFERENCE_EXECUTOR == "shared":
+    # serve.py runs the one router in the inference process, so every worker shares each device's queue
+    from shared_inference import SharedCommandRouter
+    esp32 = SharedCommandRouter(router_kwargs["table"])
+else:
+    esp32 = CommandRouter(**router_kwargs)
+
+# Queue gauges are read when /metrics is scraped
+metrics.REGISTRY.gauge("inference_pool_pending", "Requests running or waiting for an inference worker",
+                       callback=lambda: inference_pool.stats()["pending"] if inference_pool else None)
+metrics.REGISTRY.gauge("inference_batch_queue_depth", "Spectrograms waiting for the batching engine",
+                       callback=lambda: detector.inference_engine.stats()["queue_depth"] if detector else None)
+
+@app.middleware("http")
+async def count_requests(request: Request, call_next):
+    response = await call_next(request)
+    # Route template (/commands/{command_id}) keeps label cardinality bounded
+    route = request.scope.get("route")
+    metrics.REQUESTS.inc(path=getattr(route, "path", "unmatched"), status=response.status_code)
+    return response
+
+@app.on_event("startup")
+async def startup():
+    async def run():
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, load_models)
+        except Exception as e:
+            startup_state.update(status="failed", error=str(e))
+            logger.error(f"❌ Startup failed during {startup_state['phase']}: {str(e)}")
+    app.state.startup_task = asyncio.create_task(run())
+
+@app.on_event("shutdown")
+async def shutdown():
+    await esp32.close()
+    if inference_pool is not None:
+        inference_pool.shutdown()
+    if detector is not None:
+        detector.close()
 
 class CommandRequest(BaseModel):
     command: str
+    # Explicit device name; otherwise routed like a prediction from `client`
+    device: Optional[str] = None
+    client: Optional[str] = None
 
-def send_command_to_esp32(command: str):
-    try:
-        url = f"http://{ESP32_IP}/command"
-        payload = {"cmd": command}
-        res = requests.post(url, json=payload, timeout=1.5)
-        res.raise_for_status()
-        logger.info(f"✅ Successfully sent command '{command}' to ESP32.")
-        return True
-    except requests.RequestException as e:
-        logger.error(f"❌ Error sending command to ESP32: {e}")
-        raise
+async def handle_prediction(result, device_id=None):
+    """Forward confident predictions to the routed ESP32 and build the response data"""
+    predicted_class = result["data"]["predicted_class"]
+    confidence = float(result["data"]["confidence"])
+    rejected = result.get("rejected")
+
+    command_status = "not_sent"
+    command_error = None
+    command_reason = None
+    command_id = None
+
+    if rejected:
+        logger.info(f"🔇 Rejected before inference: {rejected}")
+        metrics.REJECTIONS.inc(reason=f"gate_{rejected}")
+    else:
+        logger.info(f"🎧 Prediction: {predicted_class} (confidence: {confidence:.2f})")
+        metrics.PREDICTIONS.inc(predicted_class=predicted_class)
+        metrics.CONFIDENCE.observe(confidence)
+
+    if rejected:
+        command_reason = f"Rejected before inference ({rejected.replace('_', ' ')})"
+    elif predicted_class == "unknown":
+        metrics.REJECTIONS.inc(reason="unknown")
+        command_reason = "Command not recognized"
+        logger.warning("⚠️ Unknown command detected, not sending to ESP32")
+    elif confidence < DISPATCH_THRESHOLD:
+        metrics.REJECTIONS.inc(reason="low_confidence")
+        command_reason = f"Low confidence ({confidence:.2f})"
+        logger.warning(f"⚠️ Low confidence, not sending command")
+    elif result.get("cached") and not CACHE_REDISPATCH:
+        metrics.REJECTIONS.inc(reason="duplicate")
+        command_reason = "Duplicate upload (cached result)"
+        logger.info("♻️ Cached result, not sending command again")
+    elif ESP32_DISPATCH_MODE == "wait":
+        record = await esp32.send(predicted_class, client=device_id)
+        command_id = record["id"]
+        command_status = record["status"]
+        command_error = record["error"]
+    else:
+        # Fire and forget; the outcome is available from /commands/{command_id}
+        command_id = await esp32.submit(predicted_class, client=device_id)
+        record = await esp32.result(command_id)
+        command_status = record["status"]
+        command_error = record["error"]
+
+    return {
+        "predicted_class": predicted_class,
+        "confidence": confidence,
+        "top3_predictions": result["data"]["top3_predictions"],
+        "waveform": result["data"]["waveform"],
+        "command_status": command_status,
+        "command_error": command_error,
+        "command_reason": command_reason,
+        "command_id": command_id,
+        "cached": bool(result.get("cached"))
+    }
 
 @app.get("/")
 def read_root():
     return {"message": "Hello from FastAPI"}
 
+async def run_prediction(method, *args, device_id=None):
+    """Run a detector prediction method on the pool and build the /predict response"""
+    try:
+        result = await get_pool().call(method, *args)
+    except PoolSaturatedError as e:
+        metrics.REJECTIONS.inc(reason="busy")
+        logger.warning("⚠️ Inference queue full, rejecting request")
+        raise HTTPException(
+            status_code=503,
+            detail="Server busy, please retry later",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    except AudioTooShortError:
+        # Checked on the decoded samples, so it holds for every container and sample rate
+        metrics.REJECTIONS.inc(reason="too_short")
+        raise HTTPException(status_code=400, detail="Audio file too short. Minimum 1.5 seconds required.")
+    except UnsupportedAudioType as e:
+        metrics.REJECTIONS.inc(reason="invalid_audio")
+        raise HTTPException(status_code=415, detail=str(e))
+    except AudioDecodeError as e:
+        metrics.REJECTIONS.inc(reason="invalid_audio")
+        raise HTTPException(status_code=400, detail=f"Invalid audio file: {e}")
+
+    return {
+        "status": "success",
+        "data": await handle_prediction(result, device_id)
+    }
+
+async def read_body(request: Request, limit):
+    """Read the request body, answering 413 as soon as it grows past `limit` bytes"""
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > limit:
+        raise HTTPException(status_code=413, detail=f"Body larger than {limit} bytes")
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > limit:
+            raise HTTPException(status_code=413, detail=f"Body larger than {limit} bytes")
+    return body
+
+async def read_upload(upload: UploadFile, limit):
+    """Read a multipart upload (spooled to disk by Starlette), answering 413 past `limit` bytes"""
+    if upload.size is not None and upload.size > limit:
+        raise HTTPException(status_code=413, detail=f"Upload larger than {limit} bytes")
+    data = await upload.read(limit + 1)
+    if len(data) > limit:
+        raise HTTPException(status_code=413, detail=f"Upload larger than {limit} bytes")
+    return data
+
+def header_int(request: Request, name, default, minimum, maximum):
+    value = request.headers.get(name)
+    if value is None:
+        return default
+    if not value.strip().isdigit() or not minimum <= int(value) <= maximum:
+        raise HTTPException(status_code=400, detail=f"{name} must be an integer between {minimum} and {maximum}")
+    return int(value)
+
+# ?waveform=preview returns a min/max envelope, ?waveform=full the samples as base64 int16
+WaveformOption = Query(None, pattern="^(preview|full)$")
+WaveformBuckets = Query(256, ge=8, le=4096)
+
 @app.post("/predict")
-async def predict(audio_file: UploadFile = File(...)):
-    temp_file_path = None
+async def predict(audio_file: UploadFile = File(...), device_id: Optional[str] = Form(None),
+                  waveform: Optional[str] = WaveformOption, waveform_buckets: int = WaveformBuckets):
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmp:
-            shutil.copyfileobj(audio_file.file, tmp)
-            temp_file_path = tmp.name
+        audio_bytes = await read_upload(audio_file, MAX_UPLOAD_BYTES)
 
-        if os.path.getsize(temp_file_path) < 16000 * 2 * 1.5:
+        if len(audio_bytes) < MIN_AUDIO_BYTES:
+            metrics.REJECTIONS.inc(reason="too_short")
             raise HTTPException(status_code=400, detail="Audio file too short. Minimum 1.5 seconds required.")
 
-        result = detector.predict(temp_file_path)
-        predicted_class = result["data"]["predicted_class"]
-        confidence = float(result["data"]["confidence"])
-        logger.info(f"🎧 Prediction: {predicted_class} (confidence: {confidence:.2f})")
-
-        command_status = "not_sent"
-        command_error = None
-        command_reason = None
-
-        if predicted_class == "unknown":
-            command_reason = "Command not recognized"
-            logger.warning("⚠️ Unknown command detected, not sending to ESP32")
-        elif confidence < 0.8:
-            command_reason = f"Low confidence ({confidence:.2f})"
-            logger.warning(f"⚠️ Low confidence, not sending command")
-        else:
-            try:
-                send_command_to_esp32(predicted_class)
-                command_status = "sent"
-            except Exception as e:
-                command_status = "error"
-                command_error = str(e)
-
-        return {
-            "status": "success",
-            "data": {
-                "predicted_class": predicted_class,
-                "confidence": confidence,
-                "top3_predictions": result["data"]["top3_predictions"],
-                # "waveform": result["data"]["waveform"],
-                "command_status": command_status,
-                "command_error": command_error,
-                "command_reason": command_reason
-            }
-        }
+        return await run_prediction("predict", audio_bytes, device_id, waveform, waveform_buckets,
+                                    MIN_AUDIO_SECONDS, device_id=device_id)
 
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"❌ Error in predict endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
-    finally:
-        if temp_file_path and os.path.exists(temp_file_path):
-            os.unlink(temp_file_path)
 
-@app.post("/send-command")
-async def send_command(command_request: CommandRequest):
+@app.post("/predict/raw")
+async def predict_raw(request: Request, device_id: Optional[str] = None,
+                      waveform: Optional[str] = WaveformOption, waveform_buckets: int = WaveformBuckets):
+    """Prediction from a bare request body instead of multipart form data.
+
+    Content-Type application/octet-stream (or audio/L16) is little-endian
+    int16 PCM described by the X-Sample-Rate (default 16000) and X-Channels
+    (default 1) headers; audio/wav, audio/flac and audio/ogg (Opus/Vorbis)
+    bodies are decoded from their container. Same response as /predict.
+    """
     try:
-        send_command_to_esp32(command_request.command)
-        return {"status": "success", "message": f"Command '{command_request.command}' sent successfully"}
+        content_type = request.headers.get("content-type", "application/octet-stream")
+        if not is_supported_audio_type(content_type):
+            raise HTTPException(status_code=415, detail=f"Unsupported Content-Type: {content_type}")
+        sample_rate = header_int(request, "x-sample-rate", 16000, 8000, 48000)
+        channels = header_int(request, "x-channels", 1, 1, 8)
+
+        body = await read_body(request, MAX_UPLOAD_BYTES)
+        if media_type(content_type) in PCM_TYPES and len(body) < MIN_AUDIO_SECONDS * sample_rate * 2 * channels:
+            metrics.REJECTIONS.inc(reason="too_short")
+            raise HTTPException(status_code=400, detail="Audio file too short. Minimum 1.5 seconds required.")
+
+        return await run_prediction("predict_encoded", body, content_type, sample_rate, channels, device_id,
+                                    waveform, waveform_buckets, MIN_AUDIO_SECONDS, device_id=device_id)
+
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"❌ Error sending command: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
+        logger.error(f"❌ Error in predict/raw endpoint: {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+@app.websocket("/stream")
+async def stream(websocket: WebSocket, device_id: Optional[str] = None):
+    """Live recognition: binary messages carry 16 kHz little-endian int16 PCM.
+
+    Each utterance found by the incremental VAD is announced with
+    speech_start / speech_end messages, classified as soon as it ends and
+    answered with a {"type": "prediction"} message; one with too little
+    speech ends with "discarded": true and is not classified. Sending the
+    text message "flush" ends the current utterance early. The optional
+    ?device_id= query parameter selects the microphone's noise profile.
+    """
+    await websocket.accept()
+    segmenter = StreamingSegmenter(sr=16000)
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("bytes"):
+                events = segmenter.feed_events(message["bytes"])
+            elif message.get("text") == "flush":
+                events = [e for e in [segmenter.flush_event()] if e is not None]
+            else:
+                continue
+
+            # In stream order, so an utterance's end always precedes the next start
+            for kind, utterance in events:
+                if kind == "start":
+                    await websocket.send_json({"type": "speech_start"})
+                    continue
+                await websocket.send_json({"type": "speech_end", "duration": len(utterance) / 16000,
+                                           "discarded": kind == "discarded"})
+                if kind == "discarded":
+                    # Too little speech to classify
+                    continue
+                try:
+                    result = await get_pool().call("predict_samples", utterance, 16000, device_id)
+                except PoolSaturatedError as e:
+                    metrics.REJECTIONS.inc(reason="busy")
+                    await websocket.send_json({"type": "error", "detail": "Server busy", "retry_after": e.retry_after})
+                    continue
+                except HTTPException as e:
+                    retry_after = (e.headers or {}).get("Retry-After")
+                    await websocket.send_json({"type": "error", "detail": e.detail,
+                                               "retry_after": int(retry_after) if retry_after else None})
+                    continue
+                await websocket.send_json({"type": "prediction", "data": await handle_prediction(result, device_id)})
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.error(f"❌ Error in stream endpoint: {str(e)}")
+        await websocket.close(code=1011)
+
+@app.post("/send-command")
+async def send_command(command_request: CommandRequest):
+    if command_request.device is not None and command_request.device not in esp32.table.devices:
+        raise HTTPException(status_code=404, detail=f"Unknown device '{command_request.device}'")
+    record = await esp32.send(command_request.command, client=command_request.client,
+                              device=command_request.device)
+    if record["status"] == "error":
+        logger.error(f"❌ Error sending command: {record['error']}")
+        raise HTTPException(status_code=500, detail=record["error"])
+    return {"status": "success", "message": f"Command '{command_request.command}' {record['status']}",
+            "command": record}
+
+@app.get("/commands/{command_id}")
+async def command_result(command_id: str):
+    record = await esp32.result(command_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Unknown command id")
+    return record
 
 @app.get("/health")
 async def health_check():
+    """Liveness: the process is up, whether or not the model has loaded"""
     return {"status": "healthy"}
 
+@app.get("/ready")
+async def readiness_check():
+    """Readiness: 200 once the model is loaded and warmed up, 503 before that"""
+    body = {
+        "status": startup_state["status"],
+        "phase": startup_state["phase"],
+        "startup_timings": startup_state["timings"],
+        "error": startup_state["error"],
+    }
+    if startup_state["status"] != "ready":
+        return JSONResponse(status_code=503, content=body)
+    return body
+
+async def detector_stats():
+    """Batching, cache, noise profile and gate stats, from the inference process in shared mode"""
+    if detector is not None:
+        return detector.stats()
+    if INFERENCE_EXECUTOR == "shared" and inference_pool is not None:
+        return await inference_pool.call("stats")
+    return dict.fromkeys(("inference", "result_cache", "noise_profiles", "gate"))
+
+@app.get("/stats")
+async def stats():
+    return {
+        "startup": startup_state,
+        "pool": inference_pool.stats() if inference_pool is not None else None,
+        **(await detector_stats()),
+        "esp32": await esp32.stats(),
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Prometheus text exposition of this process's metrics, plus the inference process's in shared mode"""
+    if INFERENCE_EXECUTOR == "shared" and inference_pool is not None:
+        text = metrics.render_families(
+            metrics.REGISTRY.families([("process", f"worker-{inference_pool.worker}")]),
+            await inference_pool.call("metrics"),
+        )
+    else:
+        text = metrics.render()
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4; charset=utf-8")
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -1,83 +1,188 @@
 import os
+import time
+import hashlib
 import numpy as np
 import webrtcvad
-import noisereduce as nr
-from scipy.io import wavfile
-from pydub import AudioSegment
-import librosa
 import torch
 import torch.nn as nn
-import tensorflow as tf
 from pathlib import Path
 import logging
+import metrics
+from audio_io import AudioTooShortError, decode_audio_bytes, decode_wav_bytes, read_audio_source, waveform_base64, waveform_preview
+from inference_engine import BatchingInferenceEngine
+from features import MEL_BACKENDS, MelFrontend, librosa_mel_features
+from result_cache import ResultCache, audio_cache_key
+from audio_gate import AudioGate
+from noise_profile import NoiseProfileCache, spectrum, stationary_gate
+from model_runtime import build_runtime, check_parity, reference_features
 
 logger = logging.getLogger(__name__)
 
+def sliding_window_energy(audio, window_len, stride, include_last=True):
+    """Energy of every stride-spaced window along the last axis, in O(N) via a cumulative sum.
+
+    Works on a single clip or a (B, N) batch. Returns (energies, starts).
+    """
+    audio = np.asarray(audio)
+    n = audio.shape[-1]
+    stop = n - window_len + 1 if include_last else n - window_len
+    starts = np.arange(0, max(stop, 0), stride)
+    squared = np.square(audio, dtype=np.float64)
+    cumulative = np.zeros(audio.shape[:-1] + (n + 1,), dtype=np.float64)
+    np.cumsum(squared, axis=-1, out=cumulative[..., 1:])
+    return cumulative[..., starts + window_len] - cumulative[..., starts], starts
+
+def best_energy_offsets(audio, window_len, stride, include_last=True, rtol=1e-7):
+    """Start of the first highest-energy window, per clip (0 when nothing fits or all windows are silent).
+
+    Windows within `rtol` (about float32 resolution) of the maximum count as
+    tied so the earliest one wins, as it did with the original float32
+    running-max loop.
+    """
+    energies, starts = sliding_window_energy(audio, window_len, stride, include_last)
+    if len(starts) == 0:
+        return np.zeros(np.shape(audio)[:-1], dtype=np.int64)
+    peak = energies.max(axis=-1, keepdims=True)
+    return starts[np.argmax(energies >= peak * (1 - rtol), axis=-1)]
+
+def take_windows(audio, offsets, length):
+    """Slice `length` samples at `offsets` from a clip or a (B, N) batch, zero-padding short clips"""
+    audio = np.asarray(audio)
+    if audio.shape[-1] < length:
+        pad = [(0, 0)] * (audio.ndim - 1) + [(0, length - audio.shape[-1])]
+        audio = np.pad(audio, pad)
+    if audio.ndim == 1:
+        return audio[int(offsets):int(offsets) + length]
+    index = np.asarray(offsets)[:, np.newaxis] + np.arange(length)
+    return np.take_along_axis(audio, index, axis=-1)
+
+def speech_segments(flags, frame_length, hangover_frames=0):
+    """Merge per-frame speech flags into (start, end) sample ranges.
+
+    Gaps of up to `hangover_frames` non-speech frames are bridged and each
+    segment is held open for `hangover_frames` after its last speech frame.
+    """
+    speech = np.flatnonzero(flags)
+    if len(speech) == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(speech) > hangover_frames + 1)
+    starts = speech[np.r_[0, breaks + 1]]
+    ends = np.minimum(speech[np.r_[breaks, len(speech) - 1]] + 1 + hangover_frames, len(flags))
+    return [(int(start) * frame_length, int(end) * frame_length) for start, end in zip(starts, ends)]
+
 class AudioPreprocessor:
-    def __init__(self):
+    def __init__(self, vad_hangover_ms=300, vad_prefilter_db=-65.0):
         self.vad = webrtcvad.Vad(2)
         self.target_sr = 16000
         self.frame_duration_ms = 30
+        # Speech segments stay open this long after the last speech frame
+        self.vad_hangover_ms = vad_hangover_ms
+        # Frames this far below the loudest frame skip webrtcvad entirely
+        self.vad_prefilter_db = vad_prefilter_db
         
-    def load_audio(self, input_path):
-        """Load and convert audio to mono 16kHz"""
-        audio = AudioSegment.from_wav(input_path).set_channels(1).set_frame_rate(self.target_sr)
-        raw_audio = np.array(audio.get_array_of_samples())
-        rate = audio.frame_rate
-        return raw_audio, rate
+    def load_audio(self, source):
+        """Load and convert audio to mono 16kHz.
+
+        `source` may be a file path, raw WAV bytes or a binary file object.
+        """
+        return decode_wav_bytes(read_audio_source(source), self.target_sr)
         
-    def denoise(self, audio, sr):
-        """Apply noise reduction"""
+    def denoise(self, audio, sr, noise_profile=None, spec=None):
+        """Apply noise reduction.
+
+        With a ready device noise profile this is a stationary gate against
+        the cached noise statistics; otherwise noisereduce estimates the
+        noise from the clip itself.
+        """
+        if noise_profile is not None and noise_profile.ready and sr == self.target_sr:
+            return stationary_gate(audio, sr, noise_profile.threshold(), spec=spec), sr
+        import noisereduce as nr
         denoised = nr.reduce_noise(y=audio.astype(np.float32), sr=sr)
         if sr != self.target_sr:
+            import librosa
             denoised = librosa.resample(denoised, orig_sr=sr, target_sr=self.target_sr)
         return denoised, self.target_sr
         
-    def apply_vad(self, audio, sr):
-        """Apply Voice Activity Detection"""
+    def detect_speech(self, audio, sr):
+        """Run VAD over 30 ms frames.
+
+        Returns per-frame speech flags and the hangover-smoothed speech
+        segments as (start, end) sample indices. Frames far below the loudest
+        one are marked silent by a vectorized energy check without calling
+        webrtcvad.
+        """
         frame_length = int(sr * self.frame_duration_ms / 1000)
-        frames = [audio[i:i+frame_length] for i in range(0, len(audio) - frame_length, frame_length)]
+        # Same frames as range(0, len(audio) - frame_length, frame_length)
+        n_frames = max(0, (len(audio) - 1) // frame_length)
+        frames = np.asarray(audio[:n_frames * frame_length]).reshape(n_frames, frame_length)
 
-        def is_speech(frame):
-            int16_frame = (frame * 32768).astype(np.int16)
-            return self.vad.is_speech(int16_frame.tobytes(), sr)
+        flags = np.zeros(n_frames, dtype=bool)
+        if n_frames:
+            energy = np.mean(np.square(frames, dtype=np.float64), axis=1)
+            candidates = np.flatnonzero(energy > energy.max() * 10 ** (self.vad_prefilter_db / 10))
+            int16_frames = (frames[candidates] * 32768).astype(np.int16)
+            for i, frame in zip(candidates, int16_frames):
+                flags[i] = self.vad.is_speech(frame.tobytes(), sr)
 
-        flags = [is_speech(frame) for frame in frames]
+        hangover_frames = int(self.vad_hangover_ms / self.frame_duration_ms)
+        return flags, speech_segments(flags, frame_length, hangover_frames)
+
+    def noise_frames(self, audio, flags, frame_length, quantile=25):
+        """Frames to learn the noise profile from: VAD non-speech frames among the quietest ones.
+
+        When VAD flags every frame (broadband noise), fall back to the quietest
+        frames alone; a command clip is mostly background.
+        """
+        frames = np.asarray(audio[:len(flags) * frame_length], dtype=np.float64).reshape(len(flags), frame_length)
+        if not len(flags):
+            return flags
+        energy = np.mean(np.square(frames), axis=1)
+        quiet = energy <= np.percentile(energy, quantile)
+        return quiet & ~flags if (~flags).any() else quiet
+
+    def mask_speech(self, audio, flags, sr):
+        """Zero out samples of non-speech frames"""
+        frame_length = int(sr * self.frame_duration_ms / 1000)
         speech_mask = np.repeat(flags, frame_length)
         speech_mask = np.pad(speech_mask, (0, len(audio) - len(speech_mask)), mode='constant')
         return audio * speech_mask
+
+    def apply_vad(self, audio, sr):
+        """Apply Voice Activity Detection"""
+        flags, _ = self.detect_speech(audio, sr)
+        return self.mask_speech(audio, flags, sr)
+
+    def speech_region(self, segments, length, sr, min_sec=1.0):
+        """Sample range covering all speech segments, widened to at least `min_sec`.
+
+        The range grows to the left first, so speech shorter than a second
+        lands at the end of the 1 s window, where the full-length search
+        used to put it. With no speech the whole clip is returned.
+        """
+        if not segments:
+            return 0, length
+        min_len = int(min_sec * sr)
+        start, end = segments[0][0], min(segments[-1][1], length)
+        start = max(0, min(start, end - min_len))
+        end = min(length, max(end, start + min_len))
+        return start, end
         
     def extract_high_energy_segment(self, audio, sr, window_sec=1.5, stride_ratio=0.2):
-        """Extract segment with highest energy"""
+        """Extract segment with highest energy (clip or (B, N) batch)"""
         window_len = int(window_sec * sr)
         stride = int(stride_ratio * sr)
-
-        max_energy = 0
-        best_segment = None
-        for i in range(0, len(audio) - window_len, stride):
-            window = audio[i:i+window_len]
-            energy = np.sum(window.astype(np.float32)**2)
-            if energy > max_energy:
-                max_energy = energy
-                best_segment = window
-                
-        return best_segment
+        if np.shape(audio)[-1] <= window_len:
+            # Too short to search; the whole clip is the segment
+            return audio
+        offsets = best_energy_offsets(audio, window_len, stride, include_last=False)
+        return take_windows(audio, offsets, window_len)
         
     def extract_one_second(self, audio, sr):
-        """Extract 1 second with highest energy"""
+        """Extract 1 second with highest energy (clip or (B, N) batch), zero-padding short clips"""
         segment_len = int(1.0 * sr)
         stride = int(0.02 * sr)
-
-        max_energy = 0
-        best_start = 0
-        for i in range(0, len(audio) - segment_len + 1, stride):
-            window = audio[i:i + segment_len]
-            energy = np.sum(window.astype(np.float32) ** 2)
-            if energy > max_energy:
-                max_energy = energy
-                best_start = i
-
-        return audio[best_start:best_start + segment_len]
+        offsets = best_energy_offsets(audio, segment_len, stride)
+        return take_windows(audio, offsets, segment_len)
         
     def normalize_audio(self, audio):
         """Apply peak normalization"""
@@ -86,42 +191,74 @@ class AudioPreprocessor:
             audio = audio / max_val * 0.99
         return (audio * 32767).astype(np.int16)
         
-    def process_audio_file(self, input_path, output_path=None):
-        """Main processing pipeline"""
+    def process_audio_file(self, source, output_path=None):
+        """Main processing pipeline (source: path, WAV bytes or file object)"""
         # Load audio
-        raw_audio, rate = self.load_audio(input_path)
-        
+        raw_audio, rate = self.load_audio(source)
+        return self.process_audio(raw_audio, rate, output_path)
+
+    def process_audio(self, raw_audio, rate, output_path=None, noise_profile=None):
+        """Processing pipeline for already decoded mono samples.
+
+        `noise_profile` (a device's NoiseProfile) is used for denoising once
+        ready and is updated from the clip's non-speech frames.
+        """
+        if rate != self.target_sr:
+            noise_profile = None
+
         # Denoise
-        denoised_audio, rate = self.denoise(raw_audio, rate)
+        with metrics.timer("denoise"):
+            spec = spectrum(raw_audio) if noise_profile is not None else None
+            denoised_audio, rate = self.denoise(raw_audio, rate, noise_profile, spec)
         
-        # VAD
-        speech_audio = self.apply_vad(denoised_audio, rate)
-        
-        # Extract high energy segment
-        best_segment = self.extract_high_energy_segment(speech_audio, rate)
+        # VAD, then narrow the search to the speech region
+        with metrics.timer("vad"):
+            flags, segments = self.detect_speech(denoised_audio, rate)
+
+        if noise_profile is not None:
+            frame_length = int(rate * self.frame_duration_ms / 1000)
+            noise_flags = self.noise_frames(raw_audio, flags, frame_length)
+            noise_profile.update_from_clip(spec, noise_flags, frame_length, len(raw_audio))
         
-        # Get 1 second segment
-        one_sec_segment = self.extract_one_second(best_segment, rate)
+        with metrics.timer("energy_search"):
+            start, end = self.speech_region(segments, len(denoised_audio), rate)
+            speech_audio = self.mask_speech(denoised_audio, flags, rate)[start:end]
+            
+            # Extract high energy segment
+            best_segment = self.extract_high_energy_segment(speech_audio, rate)
+            
+            # Get 1 second segment
+            one_sec_segment = self.extract_one_second(best_segment, rate)
         
         # Normalize
         final_output = self.normalize_audio(one_sec_segment)
         
         # Save if output path is provided
         if output_path:
+            from scipy.io import wavfile
             os.makedirs(os.path.dirname(output_path), exist_ok=True)
             wavfile.write(output_path, rate, final_output)
         
         return final_output, rate
 
 class AudioCommandDetector:
-    def __init__(self):
+    def __init__(self, max_batch_size=8, max_batch_wait_ms=5.0, resize_backend="numpy", mel_backend="frontend",
+                 cache_size=256, cache_ttl=300.0, runtime="eager", runtime_artifact=None, noise_profiles=64,
+                 early_rejection=True, gate_thresholds=None):
+        if mel_backend not in MEL_BACKENDS:
+            raise ValueError(f"Unknown mel backend: {mel_backend} (expected one of {MEL_BACKENDS})")
         # Load the model
         model_path = Path(__file__).parent / "audio_classifier_best.pth"
-        self.model = self._init_model()
-        self.model.load_state_dict(torch.load(model_path, map_location='cpu'))
-        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-        self.model = self.model.to(self.device)
-        self.model.eval()
+        with open(model_path, "rb") as f:
+            weights_hash = hashlib.blake2b(f.read(), digest_size=8).hexdigest()
+        self.eager_model = self._init_model()
+        self.eager_model.load_state_dict(torch.load(model_path, map_location='cpu'))
+        self.eager_model.eval()
+        # Các runtime tối ưu hoá chỉ chạy trên CPU
+        if runtime != "eager" or not torch.cuda.is_available():
+            self.device = torch.device('cpu')
+        else:
+            self.device = torch.device('cuda')
         
         # Định nghĩa classes
         self.classes = ['bat_den', 'bat_dieu_hoa', 'bat_quat', 'bat_tv',
@@ -129,9 +266,49 @@ class AudioCommandDetector:
                         'tat_den', 'tat_dieu_hoa', 'tat_quat', 'tat_tv', 
                         'unknown']
         
+        # "numpy" (mặc định) hoặc "tensorflow" để đối chiếu với tf.image.resize
+        self.resize_backend = resize_backend
+
+        # "frontend" dùng MelFrontend dựng sẵn filterbank; "librosa" là pipeline gốc
+        self.mel_backend = mel_backend
+        self.mel_frontend = MelFrontend() if mel_backend == "frontend" else None
+
+        # Runtime của model: eager, torchscript, onnx, int8-dynamic, int8-static
+        self.runtime = runtime
+        self.model = self._load_runtime(runtime, runtime_artifact)
+
+        # Kết quả được cache theo nội dung PCM + phiên bản model/cấu hình
+        self.model_version = f"{weights_hash}-{runtime}-{mel_backend}-{resize_backend}"
+        self.result_cache = ResultCache(max_entries=cache_size, ttl_seconds=cache_ttl)
+
         # Khởi tạo AudioPreprocessor
         self.audio_processor = AudioPreprocessor()
 
+        # Loại sớm im lặng / nhiễu / clip trước khi chạy toàn bộ pipeline
+        self.gate = AudioGate(**(gate_thresholds or {})) if early_rejection else None
+
+        # Noise profile theo từng thiết bị (device_id), giới hạn số thiết bị
+        self.noise_profiles = NoiseProfileCache(max_devices=noise_profiles)
+
+        # Gom các request đồng thời thành batch cho model
+        self.inference_engine = BatchingInferenceEngine(
+            self.model, self.device, max_batch_size=max_batch_size, max_wait_ms=max_batch_wait_ms
+        )
+
+    def _load_runtime(self, runtime, artifact=None):
+        """Build the selected runtime and check it against the eager model on the reference set"""
+        self.runtime_parity = None
+        if runtime == "eager":
+            return self.eager_model.to(self.device)
+
+        calibration = reference_features(self.extract_mel_batch, seed=1) if runtime == "int8-static" else None
+        model = build_runtime(runtime, self.eager_model, artifact=artifact, calibration=calibration)
+        self.runtime_parity = check_parity(runtime, model, self.eager_model, reference_features(self.extract_mel_batch))
+        if not self.runtime_parity["ok"]:
+            raise RuntimeError(f"Model runtime '{runtime}' failed the parity check: {self.runtime_parity}")
+        logger.info(f"✅ Model runtime '{runtime}' parity: {self.runtime_parity}")
+        return model
+
     def _init_model(self):
         """Khởi tạo model ConvMixer"""
         class Residual(nn.Module):
@@ -163,50 +340,165 @@ class AudioCommandDetector:
         
         return ConvMixer(dim=256, depth=8, n_classes=13)
 
-    def preprocess_audio(self, input_path, output_path=None):
+    def preprocess_audio(self, source, output_path=None):
         """Tiền xử lý âm thanh sử dụng AudioPreprocessor"""
-        return self.audio_processor.process_audio_file(input_path, output_path)
+        return self.audio_processor.process_audio_file(source, output_path)
 
     def extract_mel_spectrogram(self, audio_data, sr=16000, n_mels=128, n_fft=2048, hop_length=128):
-        mel_spec = librosa.feature.melspectrogram(
-            y=audio_data.astype(np.float32), 
-            sr=sr,
-            n_mels=n_mels,
-            n_fft=n_fft,
-            hop_length=hop_length,
-            fmin=20,
-            fmax=sr/2,
-            power=2.0
-        )
-        mel_spec_db = librosa.power_to_db(mel_spec, ref=np.max)
-        mel_spec_norm = (mel_spec_db - mel_spec_db.min()) / (mel_spec_db.max() - mel_spec_db.min())
-        mel_spec_norm = tf.image.resize(mel_spec_norm[..., np.newaxis], (128, 32))
-        mel_spec_norm = mel_spec_norm.numpy()
-        mel_spec_norm = mel_spec_norm[..., 0]
-        return mel_spec_norm
-
-    def predict(self, audio_file_path):
+        frontend = self.mel_frontend
+        if frontend is not None and (sr, n_mels, n_fft, hop_length) == (
+                frontend.sr, frontend.n_mels, frontend.n_fft, frontend.hop_length):
+            return frontend(audio_data)[0, 0]
+        return librosa_mel_features(audio_data, sr, n_mels, n_fft, hop_length, resize_backend=self.resize_backend)
+
+    def extract_mel_batch(self, clips, sr=16000):
+        """Batch of equal-length 1 s clips -> (B, 1, 128, 32) features"""
+        if self.mel_frontend is not None and sr == self.mel_frontend.sr:
+            return self.mel_frontend(clips)
+        return np.stack([self.extract_mel_spectrogram(clip, sr) for clip in clips])[:, np.newaxis]
+
+    def format_prediction(self, probabilities):
+        """Turn one row of softmax probabilities into class / confidence / top-3"""
+        probabilities = torch.as_tensor(probabilities)
+        predicted_class = int(torch.argmax(probabilities).item())
+        confidence = probabilities[predicted_class].item()
+        top3_prob, top3_indices = torch.topk(probabilities, 3)
+        top3_predictions = [(self.classes[idx], prob.item()) for idx, prob in zip(top3_indices, top3_prob)]
+        return self.classes[predicted_class], confidence, top3_predictions
+
+    def predict(self, audio_source, device_id=None, waveform=None, waveform_buckets=256, min_seconds=None):
+        """Predict a command from a WAV path, WAV bytes or binary file object"""
+        with metrics.timer("decode"):
+            raw_audio, sr = self.audio_processor.load_audio(audio_source)
+        return self.predict_samples(raw_audio, sr, device_id, waveform, waveform_buckets, min_seconds)
+
+    def predict_encoded(self, data, content_type, sample_rate=16000, channels=1, device_id=None,
+                        waveform=None, waveform_buckets=256, min_seconds=None):
+        """Predict from an upload body of the given Content-Type (raw PCM, WAV, FLAC, Ogg/Opus)"""
+        with metrics.timer("decode"):
+            raw_audio, sr = decode_audio_bytes(data, content_type, sample_rate, channels,
+                                               self.audio_processor.target_sr)
+        return self.predict_samples(raw_audio, sr, device_id, waveform, waveform_buckets, min_seconds)
+
+    def predict_samples(self, raw_audio, sr=16000, device_id=None, waveform=None, waveform_buckets=256,
+                        min_seconds=None):
+        """Predict a command from decoded mono int16 samples.
+
+        Identical audio seen recently is answered from the result cache;
+        the result then carries cached=True. `device_id` selects the
+        microphone's cached noise profile. Clips the early-rejection gate
+        flags as non-speech skip the pipeline and come back with
+        status "rejected".
+
+        The preprocessed clip is only returned on request: waveform="preview"
+        gives a min/max envelope of `waveform_buckets` points, "full" the
+        int16 samples as base64. Audio shorter than `min_seconds` raises
+        AudioTooShortError.
+        """
+        if min_seconds and len(raw_audio) < min_seconds * sr:
+            raise AudioTooShortError(f"Audio is {len(raw_audio) / sr:.2f}s, minimum {min_seconds:g}s")
         try:
-            preprocessed_audio, sr = self.preprocess_audio(audio_file_path)
-            mel_spec = self.extract_mel_spectrogram(preprocessed_audio, sr)
-            features = torch.FloatTensor(mel_spec).unsqueeze(0).unsqueeze(0).to(self.device)
-            with torch.no_grad():
-                outputs = self.model(features)
-                probabilities = torch.softmax(outputs, dim=1)
-                predicted_class = torch.argmax(outputs, dim=1).item()
-                confidence = probabilities[0][predicted_class].item()
-            top3_prob, top3_indices = torch.topk(probabilities[0], 3)
-            top3_predictions = [(self.classes[idx], prob.item()) for idx, prob in zip(top3_indices, top3_prob)]
-            waveform_data = preprocessed_audio.tolist()
-            return {
-                'status': 'success',
-                'data': {
-                    'predicted_class': self.classes[predicted_class],
-                    'confidence': confidence,
-                    'top3_predictions': top3_predictions,
-                    'waveform': waveform_data
-                }
-            }
+            if self.gate is not None:
+                reason, gate_stats = self.gate.check(raw_audio, sr)
+                if reason is not None:
+                    return self._rejected_result(reason, gate_stats)
+
+            cache_key = audio_cache_key(raw_audio, sr, f"{self.model_version}|{device_id or ''}")
+            cached = self.result_cache.get(cache_key)
+            if cached is not None:
+                return self._build_result(*cached, cached=True, waveform=waveform, waveform_buckets=waveform_buckets)
+
+            # Tell the batching engine a spectrogram is on its way
+            with self.inference_engine.expect() as token:
+                noise_profile = self.noise_profiles.get(device_id)
+                preprocessed_audio, sr = self.audio_processor.process_audio(raw_audio, sr,
+                                                                            noise_profile=noise_profile)
+                with metrics.timer("mel"):
+                    mel_spec = self.extract_mel_spectrogram(preprocessed_audio, sr)
+                probabilities = self.inference_engine.infer(mel_spec, token)
+            prediction = (preprocessed_audio, *self.format_prediction(probabilities))
+            self.result_cache.put(cache_key, prediction)
+            return self._build_result(*prediction, waveform=waveform, waveform_buckets=waveform_buckets)
         except Exception as e:
             logger.error(f"Error in prediction: {str(e)}")
             raise e
+
+    def warm_up(self, duration=1.5):
+        """Run every stage once on a synthetic clip before serving.
+
+        Triggers the lazy imports, FFT planning and TorchScript profiling
+        runs so the first real request sees normal latency. Bypasses the
+        result cache. Returns per-stage seconds.
+        """
+        import synthetic_audio
+        from audio_io import encode_wav
+
+        timings = {}
+        start = time.perf_counter()
+        raw_audio, sr = self.audio_processor.load_audio(encode_wav(synthetic_audio.speech_like(duration)))
+        timings["decode"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        preprocessed_audio, sr = self.audio_processor.process_audio(raw_audio, sr)
+        timings["preprocess"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        mel_spec = self.extract_mel_spectrogram(preprocessed_audio, sr)
+        timings["mel"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        # A few calls per batch size: TorchScript specializes on the first runs
+        for batch_size in sorted({1, self.inference_engine.max_batch_size}):
+            batch = np.repeat(mel_spec[np.newaxis], batch_size, axis=0)
+            for _ in range(3):
+                self.inference_engine.run_batch(batch)
+        timings["model"] = time.perf_counter() - start
+        self.format_prediction(self.inference_engine.run_batch(mel_spec[np.newaxis])[0])
+        return timings
+
+    def _build_result(self, preprocessed_audio, predicted_class, confidence, top3_predictions, cached=False,
+                      waveform=None, waveform_buckets=256):
+        if waveform == "preview":
+            waveform_data = waveform_preview(preprocessed_audio, waveform_buckets, self.audio_processor.target_sr)
+        elif waveform == "full":
+            waveform_data = waveform_base64(preprocessed_audio, self.audio_processor.target_sr)
+        elif waveform is None:
+            waveform_data = None
+        else:
+            raise ValueError(f"Unknown waveform option: {waveform} (expected 'preview' or 'full')")
+        return {
+            'status': 'success',
+            'cached': cached,
+            'data': {
+                'predicted_class': predicted_class,
+                'confidence': confidence,
+                'top3_predictions': top3_predictions,
+                'waveform': waveform_data
+            }
+        }
+
+    def _rejected_result(self, reason, gate_stats):
+        return {
+            'status': 'rejected',
+            'cached': False,
+            'rejected': reason,
+            'gate': gate_stats,
+            'data': {
+                'predicted_class': 'unknown',
+                'confidence': 0.0,
+                'top3_predictions': [],
+                'waveform': None
+            }
+        }
+
+    def stats(self):
+        return {
+            "inference": self.inference_engine.stats(),
+            "result_cache": self.result_cache.stats(),
+            "noise_profiles": self.noise_profiles.stats(),
+            "gate": self.gate.stats() if self.gate is not None else None,
+        }
+
+    def close(self):
+        """Stop background inference workers"""
+        self.inference_engine.close()
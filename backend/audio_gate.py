@@ -0,0 +1,106 @@
+"""Cheap checks that reject clearly non-speech uploads before the full pipeline.
+
+Everything is a handful of vectorized passes over the int16 samples. The
+thresholds are deliberately loose so only clips that would come back as
+"unknown" or low confidence anyway are rejected.
+"""
+import os
+import threading
+import numpy as np
+
+REASONS = ("silence", "clipped", "noise", "no_speech")
+
+
+def thresholds_from_env():
+    """AudioGate keyword arguments from the GATE_* environment variables"""
+    return {
+        "min_rms_dbfs": float(os.getenv("GATE_MIN_RMS_DBFS", "-60")),
+        "min_peak_dbfs": float(os.getenv("GATE_MIN_PEAK_DBFS", "-40")),
+        "max_clipping_ratio": float(os.getenv("GATE_MAX_CLIPPING_RATIO", "0.25")),
+        "max_zcr": float(os.getenv("GATE_MAX_ZCR", "0.35")),
+        "min_speech_ratio": float(os.getenv("GATE_MIN_SPEECH_RATIO", "0.05")),
+    }
+
+
+def frame_view(samples, frame_length):
+    n_frames = len(samples) // frame_length
+    return np.asarray(samples[:n_frames * frame_length]).reshape(n_frames, frame_length)
+
+
+def to_dbfs(value):
+    return float(20 * np.log10(max(value, 1e-9) / 32768))
+
+
+class AudioGate:
+    """Rejects silence, clipped audio, broadband noise and clips without a speech-like burst.
+
+    A frame counts as active when its energy is `speech_margin_db` above the
+    quietest frames (the clip's own noise floor); `speech_ratio` is the
+    fraction of active frames and `zcr` the zero-crossing rate over them.
+    """
+
+    def __init__(self, min_rms_dbfs=-60.0, min_peak_dbfs=-40.0, max_clipping_ratio=0.25, max_zcr=0.35,
+                 min_speech_ratio=0.05, speech_margin_db=6.0, frame_ms=30):
+        self.min_rms_dbfs = min_rms_dbfs
+        self.min_peak_dbfs = min_peak_dbfs
+        self.max_clipping_ratio = max_clipping_ratio
+        self.max_zcr = max_zcr
+        self.min_speech_ratio = min_speech_ratio
+        self.speech_margin_db = speech_margin_db
+        self.frame_ms = frame_ms
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.rejected = dict.fromkeys(REASONS, 0)
+
+    def measure(self, samples, sr=16000):
+        """RMS/peak level, clipping ratio, active-frame ratio and their zero-crossing rate"""
+        samples = np.asarray(samples)
+        if not len(samples):
+            return {"rms_dbfs": to_dbfs(0), "peak_dbfs": to_dbfs(0), "clipping_ratio": 0.0,
+                    "speech_ratio": 0.0, "zcr": 0.0}
+        frames = frame_view(samples, max(1, int(sr * self.frame_ms / 1000))).astype(np.float32)
+        energy = np.mean(np.square(frames), axis=1) if len(frames) else np.zeros(1, dtype=np.float32)
+        floor = max(float(np.percentile(energy, 10)), 1.0)
+        active = energy > floor * 10 ** (self.speech_margin_db / 10)
+
+        if active.any():
+            signs = np.signbit(frames[active])
+            zcr = float(np.mean(signs[:, 1:] != signs[:, :-1]))
+        else:
+            zcr = 0.0
+        peak = int(np.max(np.abs(samples.astype(np.int32))))
+        return {
+            "rms_dbfs": to_dbfs(float(np.sqrt(np.mean(energy)))),
+            "peak_dbfs": to_dbfs(peak),
+            "clipping_ratio": float(np.mean(np.abs(samples.astype(np.int32)) >= 32700)),
+            "speech_ratio": float(np.mean(active)),
+            "zcr": zcr,
+        }
+
+    def check(self, samples, sr=16000):
+        """Returns (reason or None, measurements)"""
+        stats = self.measure(samples, sr)
+        if stats["rms_dbfs"] < self.min_rms_dbfs or stats["peak_dbfs"] < self.min_peak_dbfs:
+            reason = "silence"
+        elif stats["clipping_ratio"] > self.max_clipping_ratio:
+            reason = "clipped"
+        elif stats["speech_ratio"] < self.min_speech_ratio:
+            reason = "no_speech"
+        elif stats["zcr"] > self.max_zcr:
+            reason = "noise"
+        else:
+            reason = None
+        with self._lock:
+            self.checked += 1
+            if reason is not None:
+                self.rejected[reason] += 1
+        return reason, stats
+
+    def stats(self):
+        with self._lock:
+            rejected = sum(self.rejected.values())
+            return {
+                "checked": self.checked,
+                "rejected": dict(self.rejected),
+                "rejection_rate": rejected / self.checked if self.checked else 0.0,
+            }
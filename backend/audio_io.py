@@ -0,0 +1,224 @@
+import io
+import struct
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+# Media types accepted by decode_audio_bytes()
+PCM_TYPES = ("application/octet-stream", "audio/l16", "audio/pcm")
+WAV_TYPES = ("audio/wav", "audio/wave", "audio/x-wav", "audio/vnd.wave")
+COMPRESSED_TYPES = ("audio/flac", "audio/x-flac", "audio/ogg", "audio/opus", "application/ogg")
+
+
+class AudioDecodeError(ValueError):
+    """Raised when an upload cannot be decoded as audio"""
+
+
+class UnsupportedAudioType(AudioDecodeError):
+    """Raised for a Content-Type decode_audio_bytes() does not handle"""
+
+
+class AudioTooShortError(AudioDecodeError):
+    """Raised when decoded audio is shorter than the caller's minimum duration"""
+
+
+def parse_wav_header(data):
+    """Parse a RIFF/WAVE header.
+
+    Returns (format_tag, channels, sample_rate, bits_per_sample, data_offset, data_size).
+    """
+    view = memoryview(data)
+    if len(view) < 12 or bytes(view[0:4]) != b"RIFF" or bytes(view[8:12]) != b"WAVE":
+        raise AudioDecodeError("Not a RIFF/WAVE file")
+
+    fmt = None
+    offset = 12
+    while offset + 8 <= len(view):
+        chunk_id = bytes(view[offset:offset + 4])
+        chunk_size = struct.unpack_from("<I", view, offset + 4)[0]
+        body = offset + 8
+        if chunk_id == b"fmt ":
+            if chunk_size < 16:
+                raise AudioDecodeError("Invalid fmt chunk")
+            format_tag, channels, sample_rate, _, _, bits = struct.unpack_from("<HHIIHH", view, body)
+            if format_tag == WAVE_FORMAT_EXTENSIBLE and chunk_size >= 40:
+                # The real format tag is the first two bytes of the SubFormat GUID
+                format_tag = struct.unpack_from("<H", view, body + 24)[0]
+            fmt = (format_tag, channels, sample_rate, bits)
+        elif chunk_id == b"data":
+            if fmt is None:
+                raise AudioDecodeError("data chunk before fmt chunk")
+            # Browsers sometimes write a streaming size (0 or 0xFFFFFFFF); clamp to what we got
+            data_size = min(chunk_size, len(view) - body)
+            return (*fmt, body, data_size)
+        # Chunks are word aligned
+        offset = body + chunk_size + (chunk_size & 1)
+
+    raise AudioDecodeError("No data chunk found")
+
+
+def pcm_to_int16(data, format_tag, bits, offset=0, size=None):
+    """View PCM bytes as int16 samples, converting only when the format is not int16"""
+    if size is None:
+        size = len(data) - offset
+    if format_tag == WAVE_FORMAT_PCM and bits == 16:
+        count = size // 2
+        # Zero-copy: the array is a read-only view over the request body
+        return np.frombuffer(data, dtype="<i2", count=count, offset=offset)
+    if format_tag == WAVE_FORMAT_PCM and bits == 8:
+        samples = np.frombuffer(data, dtype=np.uint8, count=size, offset=offset)
+        return ((samples.astype(np.int16) - 128) << 8).astype(np.int16)
+    if format_tag == WAVE_FORMAT_PCM and bits == 24:
+        raw = np.frombuffer(data, dtype=np.uint8, count=size - size % 3, offset=offset).reshape(-1, 3)
+        samples = (raw[:, 0].astype(np.int32) | (raw[:, 1].astype(np.int32) << 8)
+                   | (raw[:, 2].astype(np.int8).astype(np.int32) << 16))
+        return (samples >> 8).astype(np.int16)
+    if format_tag == WAVE_FORMAT_PCM and bits == 32:
+        samples = np.frombuffer(data, dtype="<i4", count=size // 4, offset=offset)
+        return (samples >> 16).astype(np.int16)
+    if format_tag == WAVE_FORMAT_IEEE_FLOAT and bits in (32, 64):
+        dtype = "<f4" if bits == 32 else "<f8"
+        samples = np.frombuffer(data, dtype=dtype, count=size // (bits // 8), offset=offset)
+        return (np.clip(samples, -1.0, 1.0) * 32767).astype(np.int16)
+    raise AudioDecodeError(f"Unsupported WAV encoding (format={format_tag}, bits={bits})")
+
+
+def to_mono(samples, channels):
+    """Down-mix interleaved samples by averaging channels"""
+    if channels == 1:
+        return samples
+    frames = len(samples) // channels
+    interleaved = samples[:frames * channels].reshape(frames, channels)
+    return interleaved.mean(axis=1).astype(np.int16)
+
+
+def resample(samples, orig_sr, target_sr):
+    """Resample int16 audio with soxr, falling back to a polyphase filter"""
+    if orig_sr == target_sr:
+        return samples
+    try:
+        import soxr
+        resampled = soxr.resample(samples.astype(np.float32), orig_sr, target_sr, quality="HQ")
+    except ImportError:
+        from math import gcd
+        from scipy.signal import resample_poly
+        g = gcd(orig_sr, target_sr)
+        resampled = resample_poly(samples.astype(np.float32), target_sr // g, orig_sr // g)
+    return np.clip(np.round(resampled), -32768, 32767).astype(np.int16)
+
+
+def decode_with_pydub(data, target_sr):
+    """Slow path for anything the RIFF parser does not understand"""
+    from pydub import AudioSegment
+    audio = AudioSegment.from_file(io.BytesIO(bytes(data))).set_channels(1).set_frame_rate(target_sr)
+    return np.array(audio.get_array_of_samples()), audio.frame_rate
+
+
+def decode_wav_bytes(data, target_sr=16000):
+    """Decode an in-memory WAV file to mono int16 samples at target_sr"""
+    try:
+        format_tag, channels, sample_rate, bits, offset, size = parse_wav_header(data)
+        samples = pcm_to_int16(data, format_tag, bits, offset, size)
+    except AudioDecodeError as e:
+        logger.debug(f"Falling back to pydub decoding: {e}")
+        try:
+            return decode_with_pydub(data, target_sr)
+        except Exception as pydub_error:
+            raise AudioDecodeError(f"Could not decode audio: {pydub_error}") from e
+
+    samples = to_mono(samples, channels)
+    samples = resample(samples, sample_rate, target_sr)
+    return samples, target_sr
+
+
+def decode_pcm_bytes(data, sample_rate, channels=1, target_sr=16000):
+    """Headerless little-endian int16 PCM; zero-copy for mono at target_sr"""
+    if len(data) % (2 * channels):
+        raise AudioDecodeError(f"PCM body is not a whole number of {channels}-channel int16 frames")
+    samples = pcm_to_int16(data, WAVE_FORMAT_PCM, 16)
+    return resample(to_mono(samples, channels), sample_rate, target_sr), target_sr
+
+
+def decode_compressed(data, target_sr=16000):
+    """FLAC or Ogg (Opus/Vorbis) through libsndfile"""
+    import soundfile as sf
+    try:
+        samples, sample_rate = sf.read(io.BytesIO(data), dtype="int16", always_2d=True)
+    except RuntimeError as e:
+        raise AudioDecodeError(f"Could not decode compressed audio: {e}") from e
+    return resample(to_mono(samples.reshape(-1), samples.shape[1]), sample_rate, target_sr), target_sr
+
+
+def media_type(content_type):
+    return (content_type or "").split(";")[0].strip().lower()
+
+
+def is_supported_audio_type(content_type):
+    return media_type(content_type) in PCM_TYPES + WAV_TYPES + COMPRESSED_TYPES
+
+
+def decode_audio_bytes(data, content_type, sample_rate=16000, channels=1, target_sr=16000):
+    """Decode an upload by Content-Type: raw int16 PCM (needs sample_rate), WAV, FLAC or Ogg/Opus"""
+    kind = media_type(content_type)
+    if kind in PCM_TYPES:
+        return decode_pcm_bytes(data, sample_rate, channels, target_sr)
+    if kind in WAV_TYPES:
+        return decode_wav_bytes(data, target_sr)
+    if kind in COMPRESSED_TYPES:
+        return decode_compressed(data, target_sr)
+    raise UnsupportedAudioType(f"Unsupported audio type: {content_type}")
+
+
+def encode_wav(samples, sr=16000):
+    """Wrap mono int16 samples in a 44-byte RIFF header (the layout the frontend sends)"""
+    pcm = np.asarray(samples, dtype="<i2").tobytes()
+    header = struct.pack("<4sI4s4sIHHIIHH4sI", b"RIFF", 36 + len(pcm), b"WAVE", b"fmt ", 16,
+                         WAVE_FORMAT_PCM, 1, sr, sr * 2, 2, 16, b"data", len(pcm))
+    return header + pcm
+
+
+def waveform_preview(samples, buckets=256, sr=16000):
+    """Min/max envelope of int16 samples in `buckets` equal slices, scaled to [-1, 1]"""
+    samples = np.asarray(samples)
+    buckets = max(1, min(int(buckets), len(samples)))
+    if not len(samples):
+        return {"type": "preview", "sample_rate": sr, "length": 0, "min": [], "max": []}
+    starts = np.linspace(0, len(samples), buckets, endpoint=False).astype(np.int64)
+    lows = np.minimum.reduceat(samples, starts) / 32768
+    highs = np.maximum.reduceat(samples, starts) / 32768
+    return {
+        "type": "preview",
+        "sample_rate": sr,
+        "length": len(samples),
+        "min": np.round(lows, 4).tolist(),
+        "max": np.round(highs, 4).tolist(),
+    }
+
+
+def waveform_base64(samples, sr=16000):
+    """Full-resolution int16 samples as base64 little-endian bytes"""
+    import base64
+    pcm = np.ascontiguousarray(samples, dtype="<i2")
+    return {
+        "type": "full",
+        "sample_rate": sr,
+        "length": len(pcm),
+        "encoding": "base64-int16le",
+        "data": base64.b64encode(memoryview(pcm).cast("B")).decode("ascii"),
+    }
+
+
+def read_audio_source(source):
+    """Return the raw bytes of a path, bytes-like object or binary file object"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return source
+    if hasattr(source, "read"):
+        return source.read()
+    with open(source, "rb") as f:
+        return f.read()
@@ -0,0 +1,236 @@
+"""Per-stage latency benchmark for the preprocessing and inference pipeline.
+
+Runs offline on CPU with the checked-in audio_classifier_best.pth:
+
+    python benchmark.py --durations 1.5 3 6 --max-batch 8 --out bench.json
+    python benchmark.py --save-baseline benchmarks/baseline.json
+    python benchmark.py --baseline benchmarks/baseline.json --fail-on-regression --require-baseline
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+import synthetic_audio
+from audio_io import encode_wav
+from model_runtime import RUNTIMES
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks", "baseline.json")
+
+
+def summarize(samples_ms, items_per_call=1):
+    samples = np.asarray(samples_ms, dtype=np.float64)
+    total_sec = samples.sum() / 1000
+    return {
+        "n": int(len(samples)),
+        "mean_ms": float(samples.mean()),
+        "p50_ms": float(np.percentile(samples, 50)),
+        "p95_ms": float(np.percentile(samples, 95)),
+        "p99_ms": float(np.percentile(samples, 99)),
+        "throughput_per_s": float(len(samples) * items_per_call / total_sec) if total_sec > 0 else None,
+    }
+
+
+def timed(fn, repeats, warmup=1):
+    """Call fn() repeats times after warm-up; returns (last result, per-call ms)"""
+    for _ in range(warmup):
+        result = fn()
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return result, times
+
+
+def bench_pipeline(detector, kind, duration, repeats, seed=0):
+    """Time each stage of the single-clip pipeline on one synthetic input"""
+    processor = detector.audio_processor
+    wav = encode_wav(synthetic_audio.make_clip(kind, duration, seed))
+    results = {}
+
+    (raw, sr), times = timed(lambda: processor.load_audio(wav), repeats)
+    results["decode"] = times
+    (denoised, sr), times = timed(lambda: processor.denoise(raw, sr), repeats)
+    results["denoise"] = times
+    (flags, segments), times = timed(lambda: processor.detect_speech(denoised, sr), repeats)
+    results["vad"] = times
+
+    def energy_search():
+        start, end = processor.speech_region(segments, len(denoised), sr)
+        speech = processor.mask_speech(denoised, flags, sr)[start:end]
+        return processor.extract_one_second(processor.extract_high_energy_segment(speech, sr), sr)
+    one_second, times = timed(energy_search, repeats)
+    results["energy_search"] = times
+    clip, times = timed(lambda: processor.normalize_audio(one_second), repeats)
+    results["normalize"] = times
+    mel, times = timed(lambda: detector.extract_mel_spectrogram(clip, sr), repeats)
+    results["mel"] = times
+    _, times = timed(lambda: detector.inference_engine.run_batch(mel[np.newaxis]), repeats)
+    results["model"] = times
+    _, times = timed(lambda: detector.predict(wav), repeats)
+    results["predict"] = times
+    return results
+
+
+def bench_gate_rejection(detector, kind, duration, repeats, seed=0):
+    """predict() with the early-rejection gate on, for clips the gate turns away; None if it lets the clip through"""
+    from audio_gate import AudioGate
+    wav = encode_wav(synthetic_audio.make_clip(kind, duration, seed))
+    pipeline_gate, detector.gate = detector.gate, AudioGate()
+    try:
+        if detector.predict(wav)["status"] != "rejected":
+            return None
+        _, times = timed(lambda: detector.predict(wav), repeats)
+        return times
+    finally:
+        detector.gate = pipeline_gate
+
+
+def bench_model_batches(detector, batch_sizes, repeats):
+    """Forward-pass latency per batch size"""
+    mel = detector.extract_mel_spectrogram(synthetic_audio.speech_like(1.0), 16000)
+    results = {}
+    for size in batch_sizes:
+        batch = np.repeat(mel[np.newaxis], size, axis=0)
+        _, times = timed(lambda: detector.inference_engine.run_batch(batch), repeats)
+        results[f"model:batch={size}"] = summarize(times, items_per_call=size)
+    return results
+
+
+def bench_concurrent_predict(batch_sizes, repeats, duration=3.0, runtime="eager"):
+    """End-to-end predict() with N concurrent callers sharing one batching engine"""
+    from audio_command_detector import AudioCommandDetector
+    clips = [encode_wav(synthetic_audio.speech_like(duration, seed=i)) for i in range(max(batch_sizes))]
+    results = {}
+    for size in batch_sizes:
+        detector = AudioCommandDetector(max_batch_size=size, cache_size=0, runtime=runtime, early_rejection=False)
+        try:
+            with ThreadPoolExecutor(max_workers=size) as pool:
+                def one_call(clip):
+                    start = time.perf_counter()
+                    detector.predict(clip)
+                    return (time.perf_counter() - start) * 1000
+                list(pool.map(one_call, clips[:size]))  # warm-up
+                calls = [clips[i % size] for i in range(repeats * size)]
+                wall_start = time.perf_counter()
+                times = list(pool.map(one_call, calls))
+                wall = time.perf_counter() - wall_start
+            summary = summarize(times)
+            summary["throughput_per_s"] = len(calls) / wall
+            summary["avg_batch_size"] = detector.inference_engine.stats()["avg_batch_size"]
+            results[f"predict:concurrency={size}"] = summary
+        finally:
+            detector.close()
+    return results
+
+
+def compare(current, baseline, tolerance, metrics=("p50_ms", "p95_ms")):
+    """List metrics that got slower than baseline by more than `tolerance` (fraction)"""
+    regressions = []
+    for name, stats in current.items():
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+        for metric in metrics:
+            old, new = reference.get(metric), stats.get(metric)
+            if old and new and new > old * (1 + tolerance):
+                regressions.append({"benchmark": name, "metric": metric, "baseline": old,
+                                    "current": new, "change": new / old - 1})
+    return regressions
+
+
+def run(args):
+    from audio_command_detector import AudioCommandDetector
+    import torch
+
+    # Gate off so predict:noise / predict:silence time the whole pipeline; rejections are gate_reject:*
+    detector = AudioCommandDetector(max_batch_size=1, cache_size=0, runtime=args.runtime, early_rejection=False)
+    benchmarks = {}
+    for kind in args.kinds:
+        for duration in args.durations:
+            stage_times = bench_pipeline(detector, kind, duration, args.repeats)
+            for stage, times in stage_times.items():
+                benchmarks[f"{stage}:{kind}:{duration:g}s"] = summarize(times)
+            times = bench_gate_rejection(detector, kind, duration, args.repeats)
+            if times is not None:
+                benchmarks[f"gate_reject:{kind}:{duration:g}s"] = summarize(times)
+
+    batch_sizes = sorted({1, *[2 ** i for i in range(1, 8) if 2 ** i <= args.max_batch], args.max_batch})
+    benchmarks.update(bench_model_batches(detector, batch_sizes, args.repeats))
+    detector.close()
+    benchmarks.update(bench_concurrent_predict(batch_sizes, args.repeats, runtime=args.runtime))
+
+    report = {
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "torch": torch.__version__,
+            "torch_threads": torch.get_num_threads(),
+        },
+        "config": {"durations": args.durations, "kinds": args.kinds, "repeats": args.repeats,
+                   "max_batch": args.max_batch, "runtime": args.runtime},
+        "benchmarks": benchmarks,
+    }
+
+    if args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)["benchmarks"]
+        report["baseline"] = args.baseline
+        report["regressions"] = compare(benchmarks, baseline, args.tolerance)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the audio command pipeline")
+    parser.add_argument("--durations", type=float, nargs="+", default=[1.5, 3.0, 6.0])
+    parser.add_argument("--kinds", nargs="+", default=list(synthetic_audio.KINDS), choices=synthetic_audio.KINDS)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--max-batch", type=int, default=8)
+    parser.add_argument("--runtime", default="eager", choices=RUNTIMES)
+    parser.add_argument("--out", help="Write the JSON report here (default: stdout)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline report to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown before flagging (0.25 = 25%%)")
+    parser.add_argument("--save-baseline", metavar="PATH", help="Store this run as the new baseline")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    parser.add_argument("--require-baseline", action="store_true", help="Exit with an error if --baseline is missing")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    if args.baseline and not os.path.exists(args.baseline):
+        if args.require_baseline:
+            print(f"Baseline {args.baseline} not found", file=sys.stderr)
+            return 2
+        logger.warning(f"⚠️ Baseline {args.baseline} not found, skipping the regression check "
+                       f"(create one with --save-baseline)")
+    report = run(args)
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.save_baseline) or ".", exist_ok=True)
+        with open(args.save_baseline, "w") as f:
+            f.write(text)
+
+    for regression in report.get("regressions", []):
+        print(f"REGRESSION {regression['benchmark']} {regression['metric']}: "
+              f"{regression['baseline']:.2f} -> {regression['current']:.2f} ms "
+              f"(+{regression['change']:.0%})", file=sys.stderr)
+    if args.fail_on_regression and report.get("regressions"):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
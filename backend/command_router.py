@@ -0,0 +1,338 @@
+"""Routes device commands to one or more ESP32s through per-device queues.
+
+The routing table is JSON, given inline or as a file path in DEVICE_ROUTES:
+
+    {
+      "devices": {"living_room": "http://10.42.0.120", "bedroom": "http://10.42.0.121"},
+      "routes": [
+        {"client": "bedroom-mic", "device": "bedroom"},
+        {"command": "*_dieu_hoa", "device": "bedroom"}
+      ],
+      "default": "living_room"
+    }
+
+Rules are tried in order; `client` is the device_id the audio came from and
+`command` an fnmatch pattern on the command class. A rule without one of the
+keys matches anything for it. Without DEVICE_ROUTES every command goes to
+the single device at ESP32_IP, as before.
+
+Each device has one worker delivering its queue in order, so a burst never
+hits a device with parallel requests. A command still waiting in the queue is
+dropped when a newer command for the same target arrives (bat_den then tat_den
+only sends tat_den), and a new command is dropped as a duplicate when the
+same command is queued, being sent or was delivered within the coalesce window.
+"""
+import json
+import time
+import uuid
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from fnmatch import fnmatchcase
+import metrics
+from esp32_dispatcher import ESP32Dispatcher, DispatchError
+
+logger = logging.getLogger(__name__)
+
+# Confidence a prediction needs before its command is sent to a device
+DISPATCH_THRESHOLD = 0.8
+# Prefix pairs that switch the same target on and off (bat_den / tat_den)
+TOGGLE_PREFIXES = (("bat_", "tat_"), ("mo_", "dong_"))
+
+QUEUE_DEPTH = metrics.REGISTRY.gauge(
+    "esp32_queue_depth", "Commands waiting in a device queue", ("device",))
+COMMAND_LATENCY = metrics.REGISTRY.histogram(
+    "esp32_command_latency_seconds", "Time from enqueue to the device's answer", ("device",))
+
+
+class QueueFullError(DispatchError):
+    """Raised when a device queue already holds max_queue commands"""
+
+
+def command_target(command):
+    """What a command acts on: 'den' for bat_den and tat_den, the command itself otherwise"""
+    for prefixes in TOGGLE_PREFIXES:
+        for prefix in prefixes:
+            if command.startswith(prefix) and len(command) > len(prefix):
+                return command[len(prefix):]
+    return command
+
+
+def public_record(record):
+    return {k: v for k, v in record.items() if not k.startswith("_")}
+
+
+class RoutingTable:
+    """Maps (client, command) to a device name"""
+
+    def __init__(self, devices, routes=(), default=None):
+        if not devices:
+            raise ValueError("Routing table needs at least one device")
+        self.devices = {name: url.rstrip("/") for name, url in devices.items()}
+        self.routes = [dict(rule) for rule in routes]
+        self.default = default
+        for rule in self.routes:
+            if rule.get("device") not in self.devices:
+                raise ValueError(f"Route {rule} points at unknown device {rule.get('device')!r}")
+        if default is not None and default not in self.devices:
+            raise ValueError(f"Unknown default device {default!r}")
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config.get("devices", {}), config.get("routes", ()), config.get("default"))
+
+    @classmethod
+    def single(cls, url, name="esp32"):
+        return cls({name: url}, default=name)
+
+    def resolve(self, command, client=None):
+        """Device name for a command, or None when no rule matches and there is no default"""
+        for rule in self.routes:
+            if "client" in rule and rule["client"] != client:
+                continue
+            if "command" in rule and not fnmatchcase(command, rule["command"]):
+                continue
+            return rule["device"]
+        return self.default
+
+
+def load_routing_table(value, default_url):
+    """Routing table from inline JSON or a JSON file path; a single device at default_url when empty"""
+    if not value:
+        return RoutingTable.single(default_url)
+    if not value.lstrip().startswith("{"):
+        with open(value) as f:
+            value = f.read()
+    return RoutingTable.from_config(json.loads(value))
+
+
+class DeviceQueue:
+    """FIFO of commands for one device, delivered by a single worker task"""
+
+    def __init__(self, name, dispatcher, coalesce_window=1.0, max_queue=32):
+        self.name = name
+        self.dispatcher = dispatcher
+        self.coalesce_window = coalesce_window
+        self.max_queue = max_queue
+        self._pending = deque()
+        self._wakeup = asyncio.Event()
+        # Set while nothing is queued or being sent
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._worker = None
+        self.in_flight = None
+        self.delivered = 0
+        self.failed = 0
+        self.coalesced = 0
+        self.duplicates = 0
+        self.dropped = 0
+        # target -> (record, finished) of the last command the device accepted
+        self._last_sent = {}
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+
+    def duplicate_of(self, command, target, now):
+        """The queued, in-flight or recently delivered record this command repeats, or None"""
+        for record, _ in self._pending:
+            if record["command"] == command:
+                return record
+        if self.in_flight is not None and self.in_flight["command"] == command:
+            return self.in_flight
+        last = self._last_sent.get(target)
+        if last is not None and last[0]["command"] == command and now - last[1] <= self.coalesce_window:
+            return last[0]
+        return None
+
+    def put(self, record, future):
+        """Queue a record, superseding every queued command for the same target.
+
+        Returns (superseded, duplicate_of): the queued items that were dropped,
+        and the record this one repeats, in which case it is not queued.
+        """
+        now = time.perf_counter()
+        target = command_target(record["command"])
+        record["target"] = target
+        record["_enqueued"] = now
+        duplicate = self.duplicate_of(record["command"], target, now)
+        # A queued copy of the same command stays where it is
+        superseded = [item for item in self._pending
+                      if item[0]["target"] == target and item[0] is not duplicate]
+        # Superseding frees a slot, so a full queue only rejects commands for a new target
+        if not superseded and duplicate is None and len(self._pending) >= self.max_queue:
+            self.dropped += 1
+            raise QueueFullError(f"Queue for {self.name} is full ({self.max_queue} commands)", attempts=0)
+        for item in superseded:
+            self._pending.remove(item)
+            self.coalesced += 1
+        if duplicate is not None:
+            self.duplicates += 1
+            self._publish_depth()
+            return superseded, duplicate
+
+        self._pending.append((record, future))
+        self._idle.clear()
+        self._publish_depth()
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+        self._wakeup.set()
+        return superseded, None
+
+    def _publish_depth(self):
+        QUEUE_DEPTH.set(len(self._pending), device=self.name)
+
+    async def _run(self):
+        while True:
+            if not self._pending:
+                # Also reached when everything queued was superseded before the worker ran
+                self._idle.set()
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            record, future = self._pending.popleft()
+            self._publish_depth()
+            self.in_flight = record
+            started = time.perf_counter()
+            record["status"] = "sending"
+            record["queue_ms"] = (started - record["_enqueued"]) * 1000
+            try:
+                record["attempts"] = await self.dispatcher.send(record["command"])
+                record["status"] = "sent"
+                self.delivered += 1
+                self._last_sent[record["target"]] = (record, time.perf_counter())
+            except DispatchError as e:
+                record["attempts"] = e.attempts
+                record["status"] = "error"
+                record["error"] = str(e)
+                self.failed += 1
+            finally:
+                self.in_flight = None
+            latency = time.perf_counter() - record["_enqueued"]
+            record["latency_ms"] = latency * 1000
+            self._latency_total += latency
+            self._latency_max = max(self._latency_max, latency)
+            COMMAND_LATENCY.observe(latency, device=self.name)
+            if not future.done():
+                future.set_result(record)
+
+    async def drain(self):
+        """Wait until every queued command has been attempted"""
+        await self._idle.wait()
+
+    async def close(self):
+        await self.drain()
+        if self._worker is not None:
+            self._worker.cancel()
+            await asyncio.gather(self._worker, return_exceptions=True)
+        await self.dispatcher.close()
+
+    def stats(self):
+        finished = self.delivered + self.failed
+        return {
+            "base_url": self.dispatcher.base_url,
+            "queue_depth": len(self._pending),
+            "in_flight": self.in_flight["command"] if self.in_flight else None,
+            "delivered": self.delivered,
+            "failed": self.failed,
+            "coalesced": self.coalesced,
+            "duplicates": self.duplicates,
+            "dropped": self.dropped,
+            "retries": self.dispatcher.stats()["retries"],
+            "avg_latency_ms": self._latency_total / finished * 1000 if finished else None,
+            "max_latency_ms": self._latency_max * 1000 if finished else None,
+        }
+
+
+class CommandRouter:
+    """Resolves each command to a device and queues it there.
+
+    submit() returns a dispatch id without waiting for the device; send() waits
+    for the device's answer (or for the command to be coalesced away) and
+    returns its record. Every public method is a coroutine so that
+    shared_inference.SharedCommandRouter, which forwards them to the one
+    router in the inference process, is a drop-in replacement.
+    """
+
+    def __init__(self, table, timeout=1.5, retries=2, coalesce_window=1.0, max_queue=32, history_size=256):
+        self.table = table
+        self.history_size = history_size
+        self.queues = {
+            name: DeviceQueue(name, ESP32Dispatcher(url, timeout=timeout, retries=retries),
+                              coalesce_window=coalesce_window, max_queue=max_queue)
+            for name, url in table.devices.items()
+        }
+        self._results = OrderedDict()
+        self.unrouted = 0
+
+    def _enqueue(self, command, client=None, device=None):
+        device = device or self.table.resolve(command, client)
+        dispatch_id = uuid.uuid4().hex[:12]
+        record = {"id": dispatch_id, "command": command, "device": device, "client": client,
+                  "status": "queued", "error": None, "attempts": 0, "queue_ms": None, "latency_ms": None,
+                  "superseded_by": None}
+        future = asyncio.get_running_loop().create_future()
+        self._remember(dispatch_id, record)
+
+        queue = self.queues.get(device)
+        if queue is None:
+            self.unrouted += 1
+            metrics.ESP32_COMMANDS.inc(status="unrouted")
+            record.update(status="error", error=f"No device for command '{command}' (client {client!r})")
+            logger.error(f"❌ {record['error']}")
+            future.set_result(record)
+            return record, future
+        try:
+            superseded, duplicate = queue.put(record, future)
+        except QueueFullError as e:
+            metrics.ESP32_COMMANDS.inc(status="dropped")
+            record.update(status="error", error=str(e))
+            logger.error(f"❌ {e}")
+            future.set_result(record)
+            return record, future
+
+        for old, old_future in superseded:
+            old.update(status="coalesced", superseded_by=dispatch_id)
+            metrics.ESP32_COMMANDS.inc(status="coalesced")
+            logger.info(f"🔀 '{old['command']}' for {device} superseded by '{command}'")
+            if not old_future.done():
+                old_future.set_result(old)
+        if duplicate is not None:
+            record.update(status="duplicate", superseded_by=duplicate["id"])
+            metrics.ESP32_COMMANDS.inc(status="duplicate")
+            logger.info(f"🔀 '{command}' for {device} dropped, already {duplicate['status']}")
+            future.set_result(record)
+        return record, future
+
+    async def submit(self, command, client=None, device=None):
+        """Queue a command; returns a dispatch id for result()"""
+        record, _ = self._enqueue(command, client, device)
+        return record["id"]
+
+    async def send(self, command, client=None, device=None):
+        """Queue a command and wait for its outcome; returns the record"""
+        _, future = self._enqueue(command, client, device)
+        return public_record(await future)
+
+    def _remember(self, dispatch_id, record):
+        self._results[dispatch_id] = record
+        while len(self._results) > self.history_size:
+            self._results.popitem(last=False)
+
+    async def result(self, dispatch_id):
+        """Outcome of a command, or None if unknown or already evicted"""
+        record = self._results.get(dispatch_id)
+        return None if record is None else public_record(record)
+
+    async def stats(self):
+        return {
+            "devices": {name: queue.stats() for name, queue in self.queues.items()},
+            "default": self.table.default,
+            "routes": len(self.table.routes),
+            "unrouted": self.unrouted,
+        }
+
+    async def drain(self):
+        await asyncio.gather(*(queue.drain() for queue in self.queues.values()))
+
+    async def close(self):
+        """Deliver what is queued, then close every device's connections"""
+        await asyncio.gather(*(queue.close() for queue in self.queues.values()))
@@ -0,0 +1,89 @@
+import random
+import asyncio
+import logging
+import httpx
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class DispatchError(RuntimeError):
+    """Raised when a command could not be delivered after all retries"""
+
+    def __init__(self, message, attempts=1):
+        super().__init__(message)
+        self.attempts = attempts
+
+
+class ESP32Dispatcher:
+    """Async ESP32 command sender with a keep-alive connection pool.
+
+    Failed deliveries (transport errors, timeouts, 5xx) are retried up to
+    `retries` times with jittered exponential backoff; 4xx answers are not
+    retried. Queueing, background delivery and result lookup live in
+    command_router.py.
+    """
+
+    def __init__(self, base_url, timeout=1.5, connect_timeout=0.5, retries=2, backoff=0.1,
+                 max_connections=4):
+        self.base_url = base_url.rstrip("/")
+        self.retries = max(0, int(retries))
+        self.backoff = backoff
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+        self._sent = 0
+        self._failed = 0
+        self._retried = 0
+
+    async def send(self, command):
+        """Deliver a command and wait for the device; raises DispatchError on failure"""
+        with metrics.timer("esp32_dispatch"):
+            try:
+                attempts = await self._send(command)
+            except DispatchError:
+                metrics.ESP32_COMMANDS.inc(status="error")
+                raise
+        metrics.ESP32_COMMANDS.inc(status="sent")
+        return attempts
+
+    async def _send(self, command):
+        url = f"{self.base_url}/command"
+        last_error = None
+        attempts = 0
+        for attempt in range(self.retries + 1):
+            attempts = attempt + 1
+            if attempt:
+                self._retried += 1
+                delay = self.backoff * (2 ** (attempt - 1))
+                await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+            try:
+                res = await self.client.post(url, json={"cmd": command})
+                if res.status_code < 500:
+                    res.raise_for_status()
+                    self._sent += 1
+                    logger.info(f"✅ Successfully sent command '{command}' to ESP32.")
+                    return attempts
+                last_error = f"ESP32 answered {res.status_code}"
+            except httpx.HTTPStatusError as e:
+                # 4xx: the device rejected the command, retrying will not help
+                last_error = f"ESP32 answered {e.response.status_code}"
+                break
+            except httpx.HTTPError as e:
+                last_error = f"{type(e).__name__}: {e}" if str(e) else type(e).__name__
+        self._failed += 1
+        logger.error(f"❌ Error sending command to ESP32: {last_error}")
+        raise DispatchError(last_error, attempts)
+
+    def stats(self):
+        return {
+            "base_url": self.base_url,
+            "sent": self._sent,
+            "failed": self._failed,
+            "retries": self._retried,
+        }
+
+    async def close(self):
+        """Close pooled connections"""
+        await self.client.aclose()
@@ -0,0 +1,122 @@
+"""Local stand-in for the ESP32 firmware's HTTP API, for tests and load runs.
+
+    python esp32_stub.py --port 8081 --latency-ms 50 --failure-rate 0.1
+"""
+import json
+import time
+import random
+import argparse
+import threading
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+
+class StubESP32Server:
+    """Answers POST /command like the firmware, with configurable latency and failures.
+
+    Every received command is recorded in `commands` as (timestamp, cmd).
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency_ms=0.0, jitter_ms=0.0, failure_rate=0.0,
+                 failure_status=500, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.commands = []
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread = None
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                if self.path != "/command":
+                    return self._reply(404, "Not Found")
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                try:
+                    cmd = json.loads(body)["cmd"]
+                except (ValueError, KeyError, TypeError):
+                    return self._reply(400, "Invalid JSON")
+                status = stub._handle(cmd)
+                if status != 200:
+                    return self._reply(status, "Simulated failure")
+                self._reply(200, f"Command processed: {cmd}")
+
+            def do_GET(self):
+                if self.path == "/version":
+                    return self._reply(200, json.dumps({"version": "stub"}), "application/json")
+                self._reply(404, "Not Found")
+
+            def _reply(self, status, text, content_type="text/plain"):
+                payload = text.encode()
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+
+    @property
+    def address(self):
+        host, port = self.httpd.server_address[:2]
+        return f"{host}:{port}"
+
+    @property
+    def url(self):
+        return f"http://{self.address}"
+
+    def _handle(self, cmd):
+        with self._lock:
+            delay = max(0.0, self.latency_ms + self._random.uniform(-self.jitter_ms, self.jitter_ms))
+            fail = self._random.random() < self.failure_rate
+        time.sleep(delay / 1000)
+        with self._lock:
+            self.commands.append((time.time(), cmd))
+        return self.failure_status if fail else 200
+
+    def start(self):
+        """Serve in a background thread; returns self"""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="esp32-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stub ESP32 command server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = StubESP32Server(args.host, args.port, args.latency_ms, args.jitter_ms, args.failure_rate)
+    print(f"Stub ESP32 listening on {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.httpd.server_close()
@@ -0,0 +1,432 @@
+"""Offline evaluation over a labeled directory tree (one folder per class).
+
+    python evaluate.py data/ --out results.csv --summary summary.json
+    python evaluate.py data/ --runtime int8-dynamic     # reuses the cached features
+
+Decoding, the early-rejection gate, preprocessing and mel extraction run in
+a process pool; the model runs in the main process in large batches as
+features arrive. Per-clip results stream to CSV or JSONL (by extension).
+
+Features are cached as a memory-mapped .npy under --cache-dir, keyed by the
+file list (path, size, mtime), the feature settings and the source of the
+preprocessing modules. A re-run with only a different model or runtime
+skips preprocessing entirely; any preprocessing change gets a new cache.
+"""
+import os
+import csv
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import logging
+import multiprocessing
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+
+from model_runtime import RUNTIMES
+from command_router import DISPATCH_THRESHOLD
+from audio_gate import thresholds_from_env
+
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = Path(__file__).resolve().parent
+CONTENT_TYPES = {".wav": "audio/wav", ".flac": "audio/flac", ".ogg": "audio/ogg", ".opus": "audio/ogg"}
+FEATURE_SHAPE = (128, 32)
+# Modules whose code decides the features; editing any of them invalidates the cache
+PREPROCESSING_SOURCES = ("audio_command_detector.py", "audio_io.py", "audio_gate.py", "features.py",
+                         "noise_profile.py")
+
+
+def find_clips(root, classes):
+    """(path, label) for every audio file under root/<class>/, sorted"""
+    root = Path(root)
+    clips = []
+    for folder in sorted(p for p in root.iterdir() if p.is_dir()):
+        if folder.name not in classes:
+            logger.warning(f"⚠️ Skipping {folder}: not one of the model's classes")
+            continue
+        clips.extend((path, folder.name) for path in sorted(folder.rglob("*"))
+                     if path.suffix.lower() in CONTENT_TYPES)
+    return clips
+
+
+def cache_key(clips, settings):
+    digest = hashlib.blake2b(digest_size=10)
+    digest.update(json.dumps(settings, sort_keys=True).encode())
+    for name in PREPROCESSING_SOURCES:
+        digest.update((BACKEND_DIR / name).read_bytes())
+    for path, label in clips:
+        stat = path.stat()
+        digest.update(f"{path}|{label}|{stat.st_size}|{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+
+class Featurizer:
+    """Decode -> gate -> preprocess -> mel for one file, as AudioCommandDetector.predict_samples does it"""
+
+    def __init__(self, mel_backend="frontend", resize_backend="numpy", gate=True, gate_thresholds=None):
+        from audio_command_detector import AudioPreprocessor
+        from audio_gate import AudioGate
+        from features import MelFrontend
+        self.processor = AudioPreprocessor()
+        self.gate = AudioGate(**(gate_thresholds or {})) if gate else None
+        self.frontend = MelFrontend() if mel_backend == "frontend" else None
+        self.resize_backend = resize_backend
+
+    def __call__(self, path):
+        """Returns (features or None, status): status is "ok", "rejected:<reason>" or "error:<message>" """
+        from audio_io import decode_audio_bytes, read_audio_source
+        from features import librosa_mel_features
+        try:
+            raw_audio, sr = decode_audio_bytes(read_audio_source(path), CONTENT_TYPES[Path(path).suffix.lower()],
+                                               target_sr=self.processor.target_sr)
+            if self.gate is not None:
+                reason, _ = self.gate.check(raw_audio, sr)
+                if reason is not None:
+                    return None, f"rejected:{reason}"
+            audio, sr = self.processor.process_audio(raw_audio, sr)
+            if self.frontend is not None and sr == self.frontend.sr:
+                return self.frontend(audio)[0, 0], "ok"
+            return librosa_mel_features(audio, sr, resize_backend=self.resize_backend), "ok"
+        except Exception as e:
+            return None, f"error:{type(e).__name__}: {e}"
+
+
+_featurizer = None
+
+
+def _init_worker(settings):
+    global _featurizer
+    os.environ["OMP_NUM_THREADS"] = "1"
+    from worker_pool import configure_threads
+    configure_threads(1)
+    logging.basicConfig(level=logging.WARNING)
+    _featurizer = Featurizer(**settings)
+
+
+def _featurize_chunk(indices, paths):
+    features = np.zeros((len(paths), *FEATURE_SHAPE), dtype=np.float32)
+    statuses = []
+    for i, path in enumerate(paths):
+        feature, status = _featurizer(path)
+        if feature is not None:
+            features[i] = feature
+        statuses.append(status)
+    return indices, features, statuses
+
+
+class FeatureCache:
+    """features.npy (memory-mapped, N x 128 x 32 float32) plus index.json with per-clip status"""
+
+    def __init__(self, root, key):
+        self.path = Path(root) / key
+        self.partial = Path(root) / f"{key}.partial"
+
+    @property
+    def complete(self):
+        return (self.path / "index.json").exists()
+
+    def load(self):
+        with open(self.path / "index.json") as f:
+            index = json.load(f)
+        return np.load(self.path / "features.npy", mmap_mode="r"), index["statuses"]
+
+    def create(self, n_clips):
+        shutil.rmtree(self.partial, ignore_errors=True)
+        self.partial.mkdir(parents=True)
+        return np.lib.format.open_memmap(self.partial / "features.npy", mode="w+", dtype=np.float32,
+                                         shape=(n_clips, *FEATURE_SHAPE))
+
+    def commit(self, features, statuses, clips, settings):
+        features.flush()
+        with open(self.partial / "index.json", "w") as f:
+            json.dump({"settings": settings, "clips": [str(path) for path, _ in clips],
+                       "statuses": statuses}, f)
+        shutil.rmtree(self.path, ignore_errors=True)
+        self.partial.rename(self.path)
+
+
+def featurize_in_pool(clips, settings, workers, chunk_size, into):
+    """Yield (indices, statuses) per finished chunk, writing features into `into`"""
+    paths = [str(path) for path, _ in clips]
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_worker, initargs=(settings,)) as executor:
+        futures = [executor.submit(_featurize_chunk, list(range(i, min(i + chunk_size, len(paths)))),
+                                   paths[i:i + chunk_size])
+                   for i in range(0, len(paths), chunk_size)]
+        for future in as_completed(futures):
+            indices, features, statuses = future.result()
+            into[indices] = features
+            yield indices, statuses
+
+
+class ResultWriter:
+    """Streams one row per clip to .csv or .jsonl"""
+
+    FIELDS = ("path", "label", "predicted", "confidence", "correct", "dispatched", "status", "top3")
+
+    def __init__(self, path):
+        self.path = path
+        self.jsonl = path is not None and path.endswith(".jsonl")
+        self._file = open(path, "w", newline="") if path else None
+        self._csv = None
+        if self._file is not None and not self.jsonl:
+            self._csv = csv.DictWriter(self._file, fieldnames=self.FIELDS)
+            self._csv.writeheader()
+
+    def write(self, row):
+        if self._file is None:
+            return
+        if self.jsonl:
+            self._file.write(json.dumps(row) + "\n")
+        else:
+            self._csv.writerow({**row, "top3": " ".join(f"{c}:{p:.4f}" for c, p in row["top3"])})
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+class Evaluation:
+    """Accumulates predictions and turns them into the summary report"""
+
+    def __init__(self, classes, threshold=DISPATCH_THRESHOLD):
+        self.classes = classes
+        self.threshold = threshold
+        self.labels = []
+        self.predicted = []
+        self.confidence = []
+        self.statuses = []
+        self.rejected = []
+        self.errors = 0
+
+    def add(self, label, predicted, confidence, status):
+        self.labels.append(self.classes.index(label))
+        self.predicted.append(self.classes.index(predicted))
+        self.confidence.append(confidence)
+        self.statuses.append(status)
+        self.rejected.append(status.startswith("rejected:"))
+
+    def dispatched(self, predicted, confidence):
+        return predicted != "unknown" and confidence >= self.threshold
+
+    def summary(self, n_bins=10):
+        labels = np.asarray(self.labels, dtype=np.int64)
+        predicted = np.asarray(self.predicted, dtype=np.int64)
+        confidence = np.asarray(self.confidence, dtype=np.float64)
+        n_classes = len(self.classes)
+        correct = labels == predicted
+
+        confusion = np.zeros((n_classes, n_classes), dtype=np.int64)
+        np.add.at(confusion, (labels, predicted), 1)
+        per_class = {}
+        for i, name in enumerate(self.classes):
+            tp, support, predicted_count = confusion[i, i], confusion[i].sum(), confusion[:, i].sum()
+            precision = tp / predicted_count if predicted_count else None
+            recall = tp / support if support else None
+            if precision is None or recall is None:
+                f1 = None
+            else:
+                f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+            per_class[name] = {"precision": precision, "recall": recall, "f1": f1, "support": int(support)}
+
+        unknown = self.classes.index("unknown")
+        dispatched = (predicted != unknown) & (confidence >= self.threshold)
+        commands = labels != unknown
+        # Calibration only covers clips the model scored; gate rejections carry no confidence
+        scored = ~np.asarray(self.rejected, dtype=bool)
+        bins = np.minimum((confidence * n_bins).astype(np.int64), n_bins - 1)
+        reliability = []
+        ece = 0.0
+        for b in range(n_bins):
+            in_bin = (bins == b) & scored
+            if not in_bin.any():
+                continue
+            accuracy, mean_confidence = correct[in_bin].mean(), confidence[in_bin].mean()
+            ece += in_bin.sum() / scored.sum() * abs(accuracy - mean_confidence)
+            reliability.append({"bin": [b / n_bins, (b + 1) / n_bins], "count": int(in_bin.sum()),
+                                "accuracy": float(accuracy), "mean_confidence": float(mean_confidence)})
+
+        statuses = {}
+        for status in self.statuses:
+            statuses[status] = statuses.get(status, 0) + 1
+        return {
+            "clips": int(len(labels)),
+            "errors": self.errors,
+            "rejected": int((~scored).sum()),
+            "accuracy": float(correct.mean()) if len(labels) else None,
+            "statuses": statuses,
+            "classes": self.classes,
+            "confusion_matrix": confusion.tolist(),
+            "per_class": per_class,
+            "dispatch": {
+                "threshold": self.threshold,
+                "dispatched": int(dispatched.sum()),
+                # Of the commands sent, how many were the right one
+                "precision": float(correct[dispatched].mean()) if dispatched.any() else None,
+                "wrong_commands": int((dispatched & ~correct).sum()),
+                "from_unknown_audio": int((dispatched & ~commands).sum()),
+                # Of the clips that were commands, how many got the right one sent
+                "coverage": float((dispatched & correct & commands).sum() / commands.sum()) if commands.any() else None,
+                "correct_below_threshold": int((~dispatched & correct & commands).sum()),
+            },
+            "calibration": {"clips": int(scored.sum()), "ece": float(ece) if scored.any() else None,
+                            "bins": reliability},
+        }
+
+
+def run(args):
+    from audio_command_detector import AudioCommandDetector
+
+    # Batches go straight to run_batch(); no batching thread needed
+    detector = AudioCommandDetector(max_batch_size=1, cache_size=0, noise_profiles=0,
+                                    runtime=args.runtime, runtime_artifact=args.runtime_artifact,
+                                    mel_backend=args.mel_backend, resize_backend=args.resize_backend)
+    clips = find_clips(args.data, detector.classes)
+    if args.limit:
+        clips = clips[:args.limit]
+    if not clips:
+        detector.close()
+        raise SystemExit(f"No labeled audio under {args.data}")
+    # Same GATE_* settings as the server, so rejections match what app.py would do
+    settings = {"mel_backend": args.mel_backend, "resize_backend": args.resize_backend, "gate": not args.no_gate,
+                "gate_thresholds": thresholds_from_env()}
+
+    evaluation = Evaluation(detector.classes, args.threshold)
+    writer = ResultWriter(args.out)
+    timings = {"model_sec": 0.0}
+    start = time.perf_counter()
+
+    def classify(indices, features, statuses):
+        model_start = time.perf_counter()
+        ok = [i for i, status in zip(indices, statuses) if status == "ok"]
+        probabilities = detector.inference_engine.run_batch(np.asarray(features[ok])) if ok else []
+        timings["model_sec"] += time.perf_counter() - model_start
+        rows = dict(zip(ok, probabilities))
+        for i, status in zip(indices, statuses):
+            path, label = clips[i]
+            if status.startswith("error:"):
+                evaluation.errors += 1
+                logger.warning(f"⚠️ {path}: {status[6:]}")
+                predicted, confidence, top3 = None, None, []
+            elif status == "ok":
+                predicted, confidence, top3 = detector.format_prediction(rows[i])
+            else:
+                # Rejected by the gate: the server answers "unknown" without running the model
+                predicted, confidence, top3 = "unknown", 0.0, []
+            if predicted is not None:
+                evaluation.add(label, predicted, confidence, status)
+            writer.write({"path": str(path), "label": label, "predicted": predicted, "confidence": confidence,
+                          "correct": predicted == label,
+                          "dispatched": predicted is not None and evaluation.dispatched(predicted, confidence),
+                          "status": status, "top3": top3})
+
+    cache = FeatureCache(args.cache_dir, cache_key(clips, settings)) if not args.no_cache else None
+    cached = cache is not None and cache.complete and not args.rebuild_cache
+    try:
+        if cached:
+            logger.info(f"♻️ Using cached features from {cache.path}")
+            features, statuses = cache.load()
+            for i in range(0, len(clips), args.batch_size):
+                indices = list(range(i, min(i + args.batch_size, len(clips))))
+                classify(indices, features, statuses[i:i + args.batch_size])
+        else:
+            if cache is not None:
+                features = cache.create(len(clips))
+            else:
+                features = np.zeros((len(clips), *FEATURE_SHAPE), dtype=np.float32)
+            statuses = [None] * len(clips)
+            pending = []
+            for indices, chunk_statuses in featurize_in_pool(clips, settings, args.workers, args.chunk_size,
+                                                             features):
+                for i, status in zip(indices, chunk_statuses):
+                    statuses[i] = status
+                pending.extend(indices)
+                # The model catches up whenever a full batch of features is ready
+                if len(pending) >= args.batch_size:
+                    classify(pending, features, [statuses[i] for i in pending])
+                    pending = []
+            if pending:
+                classify(pending, features, [statuses[i] for i in pending])
+            if cache is not None:
+                cache.commit(features, statuses, clips, settings)
+    finally:
+        writer.close()
+        detector.close()
+
+    elapsed = time.perf_counter() - start
+    report = evaluation.summary()
+    report["config"] = {"data": str(args.data), "runtime": args.runtime, "workers": args.workers,
+                        "batch_size": args.batch_size, "features_cached": cached, **settings}
+    report["throughput"] = {
+        "elapsed_sec": elapsed,
+        "clips_per_sec": len(clips) / elapsed,
+        "model_sec": timings["model_sec"],
+        "model_clips_per_sec": len(clips) / timings["model_sec"] if timings["model_sec"] else None,
+    }
+    return report
+
+
+def format_report(report):
+    classes = report["classes"]
+    width = max(len(name) for name in classes)
+    accuracy = "-" if report["accuracy"] is None else f"{report['accuracy']:.4f}"
+    lines = [f"Clips: {report['clips']} (errors: {report['errors']}, rejected by the gate: {report['rejected']})  "
+             f"accuracy: {accuracy}", ""]
+    lines.append(" " * (width + 2) + " ".join(f"{i:>4}" for i in range(len(classes))))
+    for i, (name, row) in enumerate(zip(classes, report["confusion_matrix"])):
+        lines.append(f"{name:>{width}} {i:>2}" + "".join(f"{v:>5}" for v in row))
+    lines.append("")
+    lines.append(f"{'class':>{width}}  precision  recall     f1  support")
+    for name, stats in report["per_class"].items():
+        cells = ["-" if stats[k] is None else f"{stats[k]:.3f}" for k in ("precision", "recall", "f1")]
+        lines.append(f"{name:>{width}}  {cells[0]:>9} {cells[1]:>7} {cells[2]:>6} {stats['support']:>8}")
+    dispatch = report["dispatch"]
+    precision = "-" if dispatch["precision"] is None else f"{dispatch['precision']:.4f}"
+    lines.append("")
+    lines.append(f"Dispatch at confidence >= {dispatch['threshold']}: {dispatch['dispatched']} sent, "
+                 f"precision {precision}, "
+                 f"{dispatch['wrong_commands']} wrong ({dispatch['from_unknown_audio']} from unknown audio), "
+                 f"{dispatch['correct_below_threshold']} correct but below threshold")
+    calibration = report["calibration"]
+    ece = "-" if calibration["ece"] is None else f"{calibration['ece']:.4f}"
+    lines.append(f"Calibration ECE: {ece} over {calibration['clips']} clips scored by the model")
+    throughput = report["throughput"]
+    lines.append(f"Throughput: {throughput['clips_per_sec']:.1f} clips/s over {throughput['elapsed_sec']:.1f}s "
+                 f"(model {throughput['model_sec']:.2f}s"
+                 f"{', features from cache' if report['config']['features_cached'] else ''})")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate the model on a labeled directory (one folder per class)")
+    parser.add_argument("data", help="Directory with one sub-folder per class")
+    parser.add_argument("--out", help="Per-clip results, .csv or .jsonl")
+    parser.add_argument("--summary", help="Write the JSON summary here")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=16, help="Clips per preprocessing task")
+    parser.add_argument("--batch-size", type=int, default=256, help="Clips per model forward pass")
+    parser.add_argument("--runtime", default="eager", choices=RUNTIMES)
+    parser.add_argument("--runtime-artifact")
+    parser.add_argument("--mel-backend", default="frontend", choices=("frontend", "librosa"))
+    parser.add_argument("--resize-backend", default="numpy", choices=("numpy", "tensorflow"))
+    parser.add_argument("--no-gate", action="store_true", help="Run every clip through the model")
+    parser.add_argument("--threshold", type=float, default=DISPATCH_THRESHOLD)
+    parser.add_argument("--cache-dir", default=str(BACKEND_DIR / ".eval_cache"))
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--rebuild-cache", action="store_true")
+    parser.add_argument("--limit", type=int, help="Only the first N clips")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    report = run(args)
+    if args.summary:
+        with open(args.summary, "w") as f:
+            json.dump(report, f, indent=2)
+    print(format_report(report))
+
+
+if __name__ == "__main__":
+    main()
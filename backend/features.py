@@ -0,0 +1,205 @@
+import sys
+import logging
+from functools import lru_cache
+from pathlib import Path
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+REFERENCE_DIR = Path(__file__).parent / "reference"
+RESIZE_REFERENCE_PATH = REFERENCE_DIR / "resize_reference.npz"
+
+RESIZE_BACKENDS = ("numpy", "tensorflow")
+MEL_BACKENDS = ("frontend", "librosa")
+
+
+@lru_cache(maxsize=32)
+def bilinear_weights(in_size, out_size):
+    """(out_size, in_size) interpolation matrix matching tf.image.resize(method="bilinear").
+
+    TF2 uses half-pixel centers and, with antialias=False, plain two-tap
+    interpolation even when downscaling; source coordinates are clamped
+    to the edge of the input.
+    """
+    scale = in_size / out_size
+    centers = (np.arange(out_size) + 0.5) * scale - 0.5
+    floor = np.floor(centers)
+    lower = np.maximum(floor, 0).astype(np.int64)
+    upper = np.minimum(np.ceil(centers), in_size - 1).astype(np.int64)
+    lerp = centers - floor
+
+    weights = np.zeros((out_size, in_size), dtype=np.float64)
+    rows = np.arange(out_size)
+    np.add.at(weights, (rows, lower), 1.0 - lerp)
+    np.add.at(weights, (rows, upper), lerp)
+    weights.setflags(write=False)
+    return weights
+
+
+def resize_bilinear(image, size):
+    """Resize the last two axes of `image` to `size` (height, width).
+
+    Separable bilinear resize as two small matrix products; works on a single
+    2-D spectrogram or a (..., H, W) batch.
+    """
+    image = np.asarray(image)
+    height, width = size
+    rows = bilinear_weights(image.shape[-2], height)
+    cols = bilinear_weights(image.shape[-1], width)
+    out = image.astype(np.float64)
+    if image.shape[-2] != height:
+        out = rows @ out
+    if image.shape[-1] != width:
+        out = out @ cols.T
+    return out.astype(np.float32)
+
+
+def resize_tensorflow(image, size):
+    """Reference implementation using tf.image.resize (requires TensorFlow)"""
+    import tensorflow as tf
+    resized = tf.image.resize(np.asarray(image)[..., np.newaxis], size)
+    return resized.numpy()[..., 0]
+
+
+def resize_spectrogram(image, size, backend="numpy"):
+    if backend == "numpy":
+        return resize_bilinear(image, size)
+    if backend == "tensorflow":
+        return resize_tensorflow(image, size)
+    raise ValueError(f"Unknown resize backend: {backend} (expected one of {RESIZE_BACKENDS})")
+
+
+class MelFrontend:
+    """Vectorized log-mel frontend equivalent to the librosa path in AudioCommandDetector.
+
+    The hann window, mel filterbank and resize matrices are built once; each
+    call frames a whole batch of clips with a strided view, runs one real FFT
+    over all frames and returns normalized (B, 1, 128, 32) float32 features
+    (torch.from_numpy wraps them without a copy).
+    """
+
+    def __init__(self, sr=16000, n_mels=128, n_fft=2048, hop_length=128, fmin=20, fmax=None,
+                 output_size=(128, 32), top_db=80.0, amin=1e-10, fft_workers=1):
+        import librosa
+        self.sr = sr
+        self.n_mels = n_mels
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.output_size = output_size
+        self.top_db = top_db
+        self.amin = amin
+        self.fft_workers = fft_workers
+        # Periodic hann, as librosa.stft uses get_window("hann", n_fft, fftbins=True)
+        self.window = (0.5 - 0.5 * np.cos(2 * np.pi * np.arange(n_fft) / n_fft)).astype(np.float32)
+        self.mel_basis = librosa.filters.mel(
+            sr=sr, n_fft=n_fft, n_mels=n_mels, fmin=fmin, fmax=sr / 2 if fmax is None else fmax
+        ).astype(np.float32)
+
+    def power_mel(self, clips):
+        """(B, N) samples -> (B, n_mels, frames) mel power spectrogram"""
+        from scipy import fft
+        clips = np.asarray(clips, dtype=np.float32)
+        pad = self.n_fft // 2
+        # center=True with zero padding, like librosa.stft(pad_mode="constant")
+        padded = np.pad(clips, ((0, 0), (pad, pad)))
+        frames = np.lib.stride_tricks.sliding_window_view(padded, self.n_fft, axis=-1)[:, ::self.hop_length]
+        spectrum = fft.rfft(frames * self.window, axis=-1, workers=self.fft_workers)
+        power = spectrum.real ** 2 + spectrum.imag ** 2
+        return np.matmul(self.mel_basis, power.transpose(0, 2, 1))
+
+    def normalize(self, mel_power):
+        """power_to_db(ref=max, top_db=80) followed by per-clip min-max scaling"""
+        log_spec = 10.0 * np.log10(np.maximum(self.amin, mel_power))
+        ref = 10.0 * np.log10(np.maximum(self.amin, mel_power.max(axis=(1, 2), keepdims=True)))
+        log_spec -= ref
+        log_spec = np.maximum(log_spec, log_spec.max(axis=(1, 2), keepdims=True) - self.top_db)
+        low = log_spec.min(axis=(1, 2), keepdims=True)
+        span = log_spec.max(axis=(1, 2), keepdims=True) - low
+        # Silent clips have no dynamic range; map them to zeros instead of NaN
+        return np.divide(log_spec - low, span, out=np.zeros_like(log_spec), where=span > 0)
+
+    def __call__(self, clips):
+        """Batch of equal-length clips (B, N) -> (B, 1, 128, 32) features"""
+        clips = np.asarray(clips)
+        if clips.ndim == 1:
+            clips = clips[np.newaxis]
+        features = resize_bilinear(self.normalize(self.power_mel(clips)), self.output_size)
+        return features[:, np.newaxis]
+
+
+def librosa_mel_features(audio, sr=16000, n_mels=128, n_fft=2048, hop_length=128, resize_backend="numpy"):
+    """The original per-clip librosa pipeline, kept as the parity reference"""
+    import librosa
+    mel_spec = librosa.feature.melspectrogram(
+        y=np.asarray(audio).astype(np.float32),
+        sr=sr,
+        n_mels=n_mels,
+        n_fft=n_fft,
+        hop_length=hop_length,
+        fmin=20,
+        fmax=sr/2,
+        power=2.0
+    )
+    mel_spec_db = librosa.power_to_db(mel_spec, ref=np.max)
+    mel_spec_norm = (mel_spec_db - mel_spec_db.min()) / (mel_spec_db.max() - mel_spec_db.min())
+    return resize_spectrogram(mel_spec_norm, (128, 32), backend=resize_backend)
+
+
+def check_mel_parity(clips=None, frontend=None, atol=1e-4, seed=0):
+    """Compare MelFrontend against the librosa pipeline on a batch of clips.
+
+    Defaults to deterministic tone-plus-noise clips. Returns the largest
+    absolute difference; raises AssertionError above atol.
+    """
+    if clips is None:
+        rng = np.random.default_rng(seed)
+        t = np.arange(16000) / 16000
+        clips = np.stack([
+            (8000 * np.sin(2 * np.pi * f * t) * np.hanning(16000) + rng.normal(0, 300, 16000)).astype(np.int16)
+            for f in (180, 440, 1200, 3000)
+        ])
+    frontend = frontend or MelFrontend()
+    batched = frontend(clips)[:, 0]
+    max_diff = 0.0
+    for clip, features in zip(clips, batched):
+        expected = librosa_mel_features(clip)
+        max_diff = max(max_diff, float(np.max(np.abs(features - expected))))
+    if max_diff > atol:
+        raise AssertionError(f"Mel parity failed: max abs diff {max_diff:.3g} > {atol:.3g}")
+    return max_diff
+
+
+def write_resize_reference(path=RESIZE_REFERENCE_PATH, seed=0):
+    """Regenerate the stored TensorFlow reference outputs (needs TensorFlow installed)"""
+    rng = np.random.default_rng(seed)
+    # 1 s clips give 126 frames; also cover shorter and longer inputs
+    inputs = {f"input_{w}": rng.random((128, w), dtype=np.float32) for w in (126, 94, 257)}
+    outputs = {name.replace("input", "output"): resize_tensorflow(x, (128, 32)) for name, x in inputs.items()}
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    np.savez_compressed(path, **inputs, **outputs)
+
+
+def check_resize_parity(path=RESIZE_REFERENCE_PATH, atol=1e-5):
+    """Compare the NumPy resize against stored tf.image.resize outputs.
+
+    Returns the largest absolute difference; raises AssertionError above atol.
+    """
+    reference = np.load(path)
+    max_diff = 0.0
+    for name in reference.files:
+        if not name.startswith("input_"):
+            continue
+        expected = reference[name.replace("input", "output")]
+        actual = resize_bilinear(reference[name], expected.shape)
+        max_diff = max(max_diff, float(np.max(np.abs(actual - expected))))
+    if max_diff > atol:
+        raise AssertionError(f"Resize parity failed: max abs diff {max_diff:.3g} > {atol:.3g}")
+    return max_diff
+
+
+if __name__ == "__main__":
+    if "--write-reference" in sys.argv:
+        write_resize_reference()
+        print(f"Wrote {RESIZE_REFERENCE_PATH}")
+    print(f"Resize parity OK (max abs diff {check_resize_parity():.3g})")
+    print(f"Mel frontend parity OK (max abs diff {check_mel_parity():.3g})")
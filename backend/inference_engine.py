@@ -0,0 +1,200 @@
+import threading
+import time
+import logging
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import Future
+import numpy as np
+import torch
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class BatchingInferenceEngine:
+    """Micro-batching wrapper around the classifier.
+
+    Callers submit one mel spectrogram each; a single worker thread groups
+    pending requests into a batch, runs one forward pass and hands each
+    caller its row of softmax probabilities. A batch is flushed when
+    `max_batch_size` items are queued, when `max_wait_ms` has passed since
+    the first one arrived, or as soon as the queue is empty and no other
+    caller is inside expect() (still preprocessing), so a lone request never
+    waits.
+    """
+
+    def __init__(self, model, device, max_batch_size=8, max_wait_ms=5.0):
+        self.model = model
+        self.device = device
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+
+        self._queue = deque()
+        self._cond = threading.Condition()
+        # Callers inside expect() that have not submitted yet
+        self._upcoming = 0
+        self._stats_lock = threading.Lock()
+        self._reset_stats()
+
+        self._worker = None
+        self._closed = False
+        if self.max_batch_size > 1:
+            self._worker = threading.Thread(target=self._run, name="batching-inference", daemon=True)
+            self._worker.start()
+
+    def _reset_stats(self):
+        self._batches = 0
+        self._requests = 0
+        self._batch_size_counts = {}
+        self._queue_wait_total = 0.0
+        self._queue_wait_max = 0.0
+        self._forward_total = 0.0
+        self._flush_reasons = {"full": 0, "idle": 0, "timeout": 0}
+
+    def run_batch(self, features):
+        """Run a (B, 128, 32) or (B, 1, 128, 32) batch and return (B, n_classes) probabilities"""
+        batch = torch.as_tensor(np.asarray(features, dtype=np.float32))
+        if batch.dim() == 3:
+            batch = batch.unsqueeze(1)
+        batch = batch.to(self.device)
+        metrics.BATCH_SIZE.observe(batch.shape[0])
+        with metrics.timer("model"), torch.inference_mode():
+            outputs = self.model(batch)
+            probabilities = torch.softmax(outputs, dim=1)
+        return probabilities.cpu().numpy()
+
+    @contextmanager
+    def expect(self):
+        """Announce a submit() to come, so the worker holds a partial batch for it.
+
+        Wrap the caller's preprocessing and pass the yielded token to
+        submit()/infer(); leaving the block without submitting withdraws it.
+        """
+        token = {"pending": self._worker is not None}
+        if token["pending"]:
+            with self._cond:
+                self._upcoming += 1
+        try:
+            yield token
+        finally:
+            self._withdraw(token)
+
+    def _withdraw(self, token):
+        if token is not None and token["pending"]:
+            with self._cond:
+                token["pending"] = False
+                self._upcoming -= 1
+                self._cond.notify()
+
+    def submit(self, features, token=None):
+        """Queue one (128, 32) spectrogram; the returned Future resolves to its probabilities"""
+        future = Future()
+        if self._worker is None:
+            # Batching disabled: run inline in the caller's thread
+            start = time.perf_counter()
+            try:
+                future.set_result(self.run_batch(features[np.newaxis])[0])
+            except Exception as e:
+                future.set_exception(e)
+            self._record([0.0], time.perf_counter() - start)
+            return future
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Inference engine is closed")
+            self._queue.append((features, future, time.perf_counter()))
+            # Enqueue and withdraw together, so the worker never sees neither
+            if token is not None and token["pending"]:
+                token["pending"] = False
+                self._upcoming -= 1
+            self._cond.notify()
+        return future
+
+    def infer(self, features, token=None):
+        """Blocking helper around submit()"""
+        return self.submit(features, token).result()
+
+    def _collect(self):
+        with self._cond:
+            while not self._queue:
+                self._cond.wait()
+            item = self._queue.popleft()
+            if item is None:
+                return None
+            batch = [item]
+            deadline = time.perf_counter() + self.max_wait
+            reason = "full"
+            while len(batch) < self.max_batch_size:
+                if self._queue:
+                    if self._queue[0] is None:
+                        # Flush what we have; the next call stops
+                        reason = "idle"
+                        break
+                    batch.append(self._queue.popleft())
+                    continue
+                if not self._upcoming:
+                    reason = "idle"
+                    break
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    reason = "timeout"
+                    break
+                self._cond.wait(remaining)
+        with self._stats_lock:
+            self._flush_reasons[reason] += 1
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                break
+            dequeued = time.perf_counter()
+            features = np.stack([features for features, _, _ in batch])
+            try:
+                probabilities = self.run_batch(features)
+            except Exception as e:
+                logger.error(f"Batched inference failed: {e}")
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            self._record([dequeued - enqueued for _, _, enqueued in batch], time.perf_counter() - dequeued)
+            for row, (_, future, _) in zip(probabilities, batch):
+                future.set_result(row)
+
+    def _record(self, queue_waits, forward_time):
+        with self._stats_lock:
+            size = len(queue_waits)
+            self._batches += 1
+            self._requests += size
+            self._batch_size_counts[size] = self._batch_size_counts.get(size, 0) + 1
+            self._queue_wait_total += sum(queue_waits)
+            self._queue_wait_max = max(self._queue_wait_max, max(queue_waits))
+            self._forward_total += forward_time
+
+    def stats(self):
+        """Batch-size and queue-wait statistics since startup"""
+        with self._stats_lock:
+            batches = self._batches or 1
+            requests = self._requests or 1
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000,
+                "batches": self._batches,
+                "requests": self._requests,
+                "queue_depth": len(self._queue),
+                "avg_batch_size": self._requests / batches,
+                "batch_size_counts": dict(sorted(self._batch_size_counts.items())),
+                "avg_queue_wait_ms": self._queue_wait_total / requests * 1000,
+                "max_queue_wait_ms": self._queue_wait_max * 1000,
+                "avg_forward_ms": self._forward_total / batches * 1000,
+                "flush_reasons": dict(self._flush_reasons),
+            }
+
+    def close(self):
+        """Stop the worker thread after draining queued requests"""
+        if self._worker is not None and not self._closed:
+            with self._cond:
+                self._closed = True
+                self._queue.append(None)
+                self._cond.notify()
+            self._worker.join()
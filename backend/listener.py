@@ -0,0 +1,152 @@
+"""Hands-free listening: audio sources feeding StreamingSegmenter.
+
+A source is an iterable of raw little-endian int16 mono chunks at 16 kHz.
+MicrophoneSource reads a sounddevice callback stream; ReplaySource plays WAV
+files (or every WAV in a directory) either paced like a microphone or as
+fast as the pipeline can take them, so the loop can be benchmarked and
+tested without a microphone.
+"""
+import time
+import queue
+import logging
+from pathlib import Path
+import numpy as np
+from audio_io import decode_wav_bytes, read_audio_source
+from streaming import StreamingSegmenter
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+
+
+class MicrophoneSource:
+    """Chunks from a sounddevice input stream.
+
+    The audio callback only copies the block into a bounded queue; blocks
+    that arrive while the queue is full (classification fell behind) are
+    dropped and counted in `overruns`.
+    """
+
+    def __init__(self, sr=SAMPLE_RATE, block_ms=30, device=None, max_blocks=200):
+        self.sr = sr
+        self.blocksize = int(sr * block_ms / 1000)
+        self.device = device
+        self._queue = queue.Queue(maxsize=max_blocks)
+        self._stream = None
+        self.overruns = 0
+
+    def _callback(self, indata, frames, time_info, status):
+        if status:
+            logger.debug(f"Input status: {status}")
+        try:
+            self._queue.put_nowait(bytes(indata))
+        except queue.Full:
+            self.overruns += 1
+
+    def start(self):
+        import sounddevice as sd
+        self._stream = sd.RawInputStream(samplerate=self.sr, blocksize=self.blocksize, device=self.device,
+                                         channels=1, dtype="int16", callback=self._callback)
+        self._stream.start()
+        return self
+
+    def close(self):
+        if self._stream is not None:
+            self._stream.stop()
+            self._stream.close()
+            self._stream = None
+
+    def __iter__(self):
+        if self._stream is None:
+            self.start()
+        try:
+            while True:
+                yield self._queue.get()
+        finally:
+            self.close()
+
+
+class ReplaySource:
+    """Chunks from WAV files, with `gap_sec` of silence after each file.
+
+    realtime=True sleeps so chunks arrive at the rate a microphone would
+    deliver them (paced against the start time, so sleeps do not drift);
+    otherwise chunks are yielded back to back.
+    """
+
+    def __init__(self, paths, sr=SAMPLE_RATE, block_ms=30, realtime=True, gap_sec=1.0, loop=False):
+        self.paths = [Path(p) for p in paths]
+        self.sr = sr
+        self.blocksize = int(sr * block_ms / 1000)
+        self.realtime = realtime
+        self.gap = np.zeros(int(sr * gap_sec), dtype=np.int16)
+        self.loop = loop
+        self.current = None
+
+    @classmethod
+    def from_path(cls, path, **kwargs):
+        """A single WAV file, or every *.wav under a directory in sorted order"""
+        path = Path(path)
+        paths = sorted(path.rglob("*.wav")) if path.is_dir() else [path]
+        if not paths:
+            raise FileNotFoundError(f"No WAV files under {path}")
+        return cls(paths, **kwargs)
+
+    def __iter__(self):
+        start = time.perf_counter()
+        sent = 0
+        while True:
+            for path in self.paths:
+                self.current = path
+                samples, _ = decode_wav_bytes(read_audio_source(path), self.sr)
+                samples = np.concatenate([np.asarray(samples, dtype=np.int16), self.gap])
+                for i in range(0, len(samples), self.blocksize):
+                    chunk = samples[i:i + self.blocksize]
+                    if self.realtime:
+                        delay = start + sent / self.sr - time.perf_counter()
+                        if delay > 0:
+                            time.sleep(delay)
+                    sent += len(chunk)
+                    yield chunk.astype("<i2").tobytes()
+            if not self.loop:
+                return
+
+    def close(self):
+        pass
+
+
+def open_source(spec, realtime=True, block_ms=30, device=None, loop=False):
+    """'mic' for the default microphone, otherwise a WAV file or directory to replay"""
+    if spec in (None, "mic"):
+        return MicrophoneSource(block_ms=block_ms, device=device)
+    return ReplaySource.from_path(spec, realtime=realtime, block_ms=block_ms, loop=loop)
+
+
+def listen(detector, source, device_id=None, segmenter=None):
+    """Yield one event per utterance: the prediction plus where and how fast it was produced.
+
+    `stream_sec` is the position in the stream where the utterance was
+    endpointed and `latency_ms` the time from then to the prediction.
+    """
+    segmenter = segmenter or StreamingSegmenter(sr=SAMPLE_RATE)
+
+    def classify(utterance):
+        endpointed = time.perf_counter()
+        result = detector.predict_samples(utterance, SAMPLE_RATE, device_id)
+        return {
+            "stream_sec": segmenter.ring.total / SAMPLE_RATE,
+            "duration_sec": len(utterance) / SAMPLE_RATE,
+            "latency_ms": (time.perf_counter() - endpointed) * 1000,
+            "source": str(getattr(source, "current", None) or "mic"),
+            "result": result,
+        }
+
+    try:
+        for chunk in source:
+            for utterance in segmenter.feed(chunk):
+                yield classify(utterance)
+        utterance = segmenter.flush()
+        if utterance is not None:
+            yield classify(utterance)
+    finally:
+        source.close()
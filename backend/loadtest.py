@@ -0,0 +1,407 @@
+"""End-to-end load test of the API against a stub ESP32.
+
+    python loadtest.py --rates 1 2 4 8 --duration 20 --out load.json
+    python loadtest.py --concurrency 1 2 4 8                   # closed loop
+    MODEL_RUNTIME=torchscript python loadtest.py --rates 2 4 8
+    python loadtest.py --serve-workers 2 --rates 2 4 8          # serve.py mode
+    python loadtest.py --url http://10.42.0.5:8000 --rates 1 2  # existing server
+
+Unless --url is given, a StubESP32Server and the API (uvicorn app:app, or
+serve.py with --serve-workers) are started locally; the server inherits this
+process's environment, so runtime / pool / dispatch settings are compared by
+setting the usual variables. Each level runs for --duration seconds, open
+loop at a Poisson arrival rate (--rates) or closed loop with N clients
+(--concurrency), and the ramp stops at the first saturated level.
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import platform
+import subprocess
+import logging
+from collections import Counter
+from pathlib import Path
+import numpy as np
+import httpx
+
+import synthetic_audio
+from audio_io import encode_wav, decode_wav_bytes, read_audio_source
+from esp32_stub import StubESP32Server
+
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = Path(__file__).resolve().parent
+SAMPLE_RATE = 16000
+# "command": the checked-in recording (gain/noise varied), "short": the same at the 1.5 s minimum,
+# "too_short": 1 s, which the API answers with 400
+CLIP_KINDS = ("command", "short", "silence", "noise", "too_short")
+DEFAULT_MIX = "command=0.5,short=0.1,silence=0.2,noise=0.2"
+DEVICE_COMMANDS = ("bat_den", "tat_den", "bat_quat", "tat_quat", "bat_tv", "tat_tv")
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        kind, _, weight = part.partition("=")
+        if kind not in CLIP_KINDS:
+            raise argparse.ArgumentTypeError(f"Unknown clip kind {kind!r} (expected {', '.join(CLIP_KINDS)})")
+        mix[kind] = float(weight or 1)
+    return mix
+
+
+def command_recording():
+    path = BACKEND_DIR / "temp_audio.wav"
+    if path.exists():
+        samples, _ = decode_wav_bytes(read_audio_source(path), SAMPLE_RATE)
+        return np.asarray(samples, dtype=np.int16)
+    return synthetic_audio.speech_like(3.0)
+
+
+def make_clips(mix, variants, seed=0):
+    """`variants` acoustically different WAV bodies per kind"""
+    rng = np.random.default_rng(seed)
+    recording = command_recording()
+    clips = {}
+    for kind in mix:
+        bodies = []
+        for i in range(variants):
+            if kind in ("command", "short", "too_short"):
+                duration = {"command": len(recording) / SAMPLE_RATE, "short": 1.5, "too_short": 1.0}[kind]
+                n = int(duration * SAMPLE_RATE)
+                speech = int(np.argmax(np.abs(recording) > 0.3 * np.max(np.abs(recording))))
+                start = int(np.clip(speech - rng.integers(0, max(1, n // 3)), 0, max(0, len(recording) - n)))
+                clip = recording[start:start + n] * rng.uniform(0.5, 1.2) + rng.normal(0, 50, n)
+            else:
+                clip = synthetic_audio.make_clip(kind, 3.0, seed=seed * 1000 + i)
+            bodies.append(encode_wav(np.clip(clip, -32768, 32767).astype(np.int16)))
+        clips[kind] = bodies
+    return clips
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port, esp32_address, serve_workers=0):
+    env = dict(os.environ, ESP32_IP=esp32_address, PYTHONPATH=str(BACKEND_DIR))
+    if serve_workers:
+        cmd = [sys.executable, "serve.py", "--host", "127.0.0.1", "--port", str(port),
+               "--workers", str(serve_workers), "--log-level", "warning"]
+    else:
+        cmd = [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port),
+               "--log-level", "warning"]
+    return subprocess.Popen(cmd, cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL, start_new_session=True)
+
+
+def stop_server(process):
+    import signal
+    try:
+        os.killpg(process.pid, signal.SIGINT)
+        process.wait(timeout=30)
+    except (ProcessLookupError, subprocess.TimeoutExpired):
+        process.kill()
+        process.wait()
+
+
+def wait_ready(url, timeout=300.0, process=None):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode} before becoming ready")
+        try:
+            if httpx.get(f"{url}/ready", timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"{url} not ready after {timeout:.0f}s")
+
+
+class LoadGenerator:
+    """Sends /predict and /send-command requests and records one sample per request"""
+
+    def __init__(self, url, clips, mix, command_ratio=0.0, timeout=30.0, seed=0, unique=True):
+        self.url = url.rstrip("/")
+        self.clips = clips
+        self.kinds = list(mix)
+        weights = np.asarray([mix[kind] for kind in self.kinds], dtype=np.float64)
+        self.weights = weights / weights.sum()
+        self.command_ratio = command_ratio
+        self.timeout = timeout
+        self.unique = unique
+        self.random = random.Random(seed)
+
+    def pick(self):
+        if self.random.random() < self.command_ratio:
+            return "send_command", self.random.choice(DEVICE_COMMANDS)
+        kind = self.random.choices(self.kinds, self.weights)[0]
+        body = self.random.choice(self.clips[kind])
+        if self.unique:
+            # Randomize the last two samples so the result cache never answers
+            body = body[:-4] + self.random.randbytes(4)
+        return kind, body
+
+    async def request(self, client, kind, payload):
+        start = time.perf_counter()
+        sample = {"kind": kind, "status": None, "error": None, "command_status": None}
+        try:
+            if kind == "send_command":
+                res = await client.post(f"{self.url}/send-command", json={"command": payload})
+            else:
+                res = await client.post(f"{self.url}/predict",
+                                        files={"audio_file": ("clip.wav", payload, "audio/wav")})
+            sample["status"] = res.status_code
+            if res.status_code == 200 and kind != "send_command":
+                sample["command_status"] = res.json()["data"]["command_status"]
+        except httpx.HTTPError as e:
+            sample["error"] = type(e).__name__
+        sample["latency_ms"] = (time.perf_counter() - start) * 1000
+        return sample
+
+    def client(self, max_connections):
+        return httpx.AsyncClient(timeout=self.timeout,
+                                 limits=httpx.Limits(max_connections=max_connections,
+                                                     max_keepalive_connections=max_connections))
+
+    async def open_loop(self, rate, duration, max_in_flight):
+        """Poisson arrivals at `rate`/s; arrivals while max_in_flight requests are open are counted as shed"""
+        samples, tasks, shed = [], set(), 0
+        async with self.client(max_in_flight) as client:
+            start = time.perf_counter()
+            next_arrival = start
+            while True:
+                next_arrival += self.random.expovariate(rate)
+                if next_arrival - start >= duration:
+                    break
+                await asyncio.sleep(max(0.0, next_arrival - time.perf_counter()))
+                if len(tasks) >= max_in_flight:
+                    shed += 1
+                    continue
+                task = asyncio.create_task(self.request(client, *self.pick()))
+                task.add_done_callback(lambda t: samples.append(t.result()))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+            elapsed = time.perf_counter() - start
+        return samples, elapsed, shed
+
+    async def closed_loop(self, concurrency, duration):
+        """`concurrency` clients each sending the next request as soon as the previous one returns"""
+        samples = []
+        async with self.client(concurrency) as client:
+            start = time.perf_counter()
+
+            async def user():
+                while time.perf_counter() - start < duration:
+                    samples.append(await self.request(client, *self.pick()))
+
+            await asyncio.gather(*(user() for _ in range(concurrency)))
+            elapsed = time.perf_counter() - start
+        return samples, elapsed, 0
+
+
+def percentiles(values):
+    if not values:
+        return None
+    values = np.asarray(values, dtype=np.float64)
+    return {"p50": float(np.percentile(values, 50)), "p95": float(np.percentile(values, 95)),
+            "p99": float(np.percentile(values, 99)), "mean": float(values.mean()), "max": float(values.max())}
+
+
+def summarize_level(samples, elapsed, shed, offered_rps=None, concurrency=None, duration=None):
+    statuses = Counter(sample["status"] for sample in samples if sample["status"] is not None)
+    transport_errors = Counter(sample["error"] for sample in samples if sample["error"] is not None)
+    ok = [sample for sample in samples if sample["status"] == 200]
+    total = len(samples) + shed
+    by_kind = {}
+    for kind in sorted({sample["kind"] for sample in samples}):
+        of_kind = [sample for sample in samples if sample["kind"] == kind]
+        by_kind[kind] = {
+            "requests": len(of_kind),
+            "ok": sum(sample["status"] == 200 for sample in of_kind),
+            "latency_ms": percentiles([sample["latency_ms"] for sample in of_kind if sample["status"] == 200]),
+        }
+    n_4xx = sum(count for status, count in statuses.items() if 400 <= status < 500)
+    n_5xx = sum(count for status, count in statuses.items() if status >= 500)
+    return {
+        "offered_rps": offered_rps,
+        # Poisson arrivals actually generated; short levels can be well off the nominal rate
+        "arrival_rps": total / duration if offered_rps and duration else None,
+        "concurrency": concurrency,
+        "duration_sec": elapsed,
+        "requests": len(samples),
+        "shed_by_client": shed,
+        "throughput_rps": len(ok) / elapsed if elapsed else 0.0,
+        "latency_ms": percentiles([sample["latency_ms"] for sample in ok]),
+        "error_rate": (total - len(ok)) / total if total else 0.0,
+        "rate_4xx": n_4xx / total if total else 0.0,
+        "rate_5xx": n_5xx / total if total else 0.0,
+        "status_counts": {str(status): count for status, count in sorted(statuses.items())},
+        "transport_errors": dict(transport_errors),
+        "command_status": dict(Counter(sample["command_status"] for sample in ok if sample["command_status"])),
+        "by_kind": by_kind,
+    }
+
+
+def saturation_reason(level, previous, args):
+    """Why this level counts as saturated, or None"""
+    if level["rate_5xx"] > args.max_error_rate or level["transport_errors"]:
+        return f"5xx/transport error rate {level['rate_5xx']:.3f} above {args.max_error_rate}"
+    if level["shed_by_client"]:
+        return f"{level['shed_by_client']} arrivals found {args.max_in_flight} requests already open"
+    p95 = (level["latency_ms"] or {}).get("p95")
+    if args.slo_ms and p95 is not None and p95 > args.slo_ms:
+        return f"p95 {p95:.0f} ms above the {args.slo_ms:.0f} ms SLO"
+    expected = (level["arrival_rps"] or 0.0) * (1 - level["rate_4xx"])
+    if level["offered_rps"] and level["throughput_rps"] < 0.9 * expected:
+        return f"throughput {level['throughput_rps']:.2f}/s below 90% of the {expected:.2f}/s valid arrivals"
+    if level["concurrency"] and previous and level["throughput_rps"] < previous["throughput_rps"] * 1.05:
+        return f"throughput grew less than 5% over concurrency {previous['concurrency']}"
+    return None
+
+
+async def run_levels(generator, args):
+    levels = []
+    saturation = None
+    steps = [("rate", rate) for rate in args.rates] if args.rates else [("concurrency", c) for c in args.concurrency]
+    for kind, value in steps:
+        logger.info(f"▶️ {kind} {value} for {args.duration:g}s")
+        if kind == "rate":
+            samples, elapsed, shed = await generator.open_loop(value, args.duration, args.max_in_flight)
+            level = summarize_level(samples, elapsed, shed, offered_rps=value, duration=args.duration)
+        else:
+            samples, elapsed, shed = await generator.closed_loop(value, args.duration)
+            level = summarize_level(samples, elapsed, shed, concurrency=value)
+        reason = saturation_reason(level, levels[-1] if levels else None, args)
+        level["saturated"] = reason
+        levels.append(level)
+        latency = level["latency_ms"] or {}
+        logger.info(f"   {level['throughput_rps']:.2f} ok/s, p50 {latency.get('p50', float('nan')):.0f} ms, "
+                    f"p95 {latency.get('p95', float('nan')):.0f} ms, 5xx {level['rate_5xx']:.1%}"
+                    + (f"  ⚠️ saturated: {reason}" if reason else ""))
+        if reason and saturation is None:
+            saturation = {kind: value, "reason": reason}
+            if not args.keep_going:
+                break
+        if args.cooldown:
+            await asyncio.sleep(args.cooldown)
+
+    sustainable = [level for level in levels if not level["saturated"]]
+    if saturation is not None:
+        saturation["max_sustainable_throughput_rps"] = max(
+            (level["throughput_rps"] for level in sustainable), default=0.0)
+    return levels, saturation
+
+
+def run(args):
+    mix = parse_mix(args.mix)
+    clips = make_clips(mix, args.variants, args.seed)
+    stub = server = None
+    url = args.url
+    try:
+        if url is None:
+            stub = StubESP32Server(latency_ms=args.esp32_latency_ms, jitter_ms=args.esp32_jitter_ms,
+                                   failure_rate=args.esp32_failure_rate, seed=args.seed).start()
+            port = free_port()
+            url = f"http://127.0.0.1:{port}"
+            server = start_server(port, stub.address, args.serve_workers)
+        started = time.perf_counter()
+        wait_ready(url, process=server)
+        startup_sec = time.perf_counter() - started
+        if args.warmup:
+            asyncio.run(LoadGenerator(url, clips, mix, seed=args.seed + 1).closed_loop(1, args.warmup))
+
+        generator = LoadGenerator(url, clips, mix, args.send_command_ratio, args.timeout, args.seed,
+                                  unique=not args.cache_hits)
+        levels, saturation = asyncio.run(run_levels(generator, args))
+        try:
+            server_stats = httpx.get(f"{url}/stats", timeout=10).json()
+        except (httpx.HTTPError, ValueError):
+            server_stats = None
+    finally:
+        if server is not None:
+            stop_server(server)
+        if stub is not None:
+            stub.stop()
+
+    return {
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "server_env": {key: os.environ[key] for key in sorted(os.environ)
+                           if key.startswith(("MODEL_", "INFERENCE_", "BATCH_", "ESP32_", "RESULT_CACHE",
+                                              "GATE_", "MEL_", "RESIZE_", "COMMAND_"))},
+        },
+        "config": {
+            "url": args.url or "local",
+            "serve_workers": args.serve_workers,
+            "mix": mix,
+            "variants": args.variants,
+            "cache_hits": args.cache_hits,
+            "send_command_ratio": args.send_command_ratio,
+            "duration_sec": args.duration,
+            "esp32": None if args.url else {"latency_ms": args.esp32_latency_ms, "jitter_ms": args.esp32_jitter_ms,
+                                            "failure_rate": args.esp32_failure_rate},
+        },
+        "startup_sec": startup_sec if args.url is None else None,
+        "levels": levels,
+        "saturation": saturation,
+        "esp32_commands_received": len(stub.commands) if stub is not None else None,
+        "server_stats": {key: server_stats.get(key) for key in ("pool", "inference", "result_cache", "gate", "esp32")}
+        if server_stats else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test /predict and /send-command")
+    load = parser.add_mutually_exclusive_group()
+    load.add_argument("--rates", type=float, nargs="+", help="Open-loop arrival rates (requests/s) to step through")
+    load.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8],
+                      help="Closed-loop client counts to step through (default when --rates is not given)")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds per level")
+    parser.add_argument("--warmup", type=float, default=3.0, help="Seconds of single-client traffic before measuring")
+    parser.add_argument("--cooldown", type=float, default=1.0, help="Pause between levels")
+    parser.add_argument("--max-in-flight", type=int, default=64, help="Open-loop cap on concurrent requests")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"kind=weight list over {', '.join(CLIP_KINDS)}")
+    parser.add_argument("--variants", type=int, default=16, help="Distinct clips per kind")
+    parser.add_argument("--cache-hits", action="store_true",
+                        help="Resend identical bodies so repeats are answered from the result cache")
+    parser.add_argument("--send-command-ratio", type=float, default=0.0,
+                        help="Fraction of requests sent to /send-command instead of /predict")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--slo-ms", type=float, help="p95 latency above this counts as saturated")
+    parser.add_argument("--max-error-rate", type=float, default=0.01, help="5xx rate counted as saturated")
+    parser.add_argument("--keep-going", action="store_true", help="Run every level even after saturation")
+    parser.add_argument("--url", help="Test an already running server instead of starting one")
+    parser.add_argument("--serve-workers", type=int, default=0, help="Start serve.py with N workers instead of uvicorn")
+    parser.add_argument("--esp32-latency-ms", type=float, default=30.0)
+    parser.add_argument("--esp32-jitter-ms", type=float, default=10.0)
+    parser.add_argument("--esp32-failure-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="Write the JSON report here (default: stdout)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    report = run(args)
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,260 @@
+"""Minimal in-process metrics rendered in the Prometheus text format.
+
+Instrumentation is a no-op when METRICS_ENABLED=false. Metrics are per
+process: with INFERENCE_EXECUTOR=process the pipeline stage timings are
+recorded in the pool workers and do not show up on /metrics. In shared
+mode (serve.py) each worker merges the inference process's families() into
+its own, telling the two apart with a `process` label.
+"""
+import os
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+
+ENABLED = os.getenv("METRICS_ENABLED", "true").lower() != "false"
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values)) + (extra or [])
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self, extra=None):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self._samples(extra))
+        return lines
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        if not ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self, extra=None):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k, extra)} {_format_value(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    """Gauge set explicitly or read from a callback at scrape time"""
+    type = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def _samples(self, extra=None):
+        if self.callback is not None:
+            value = self.callback()
+            return [] if value is None else [f"{self.name}{_format_labels((), (), extra)} {_format_value(value)}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k, extra)} {_format_value(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        if not ENABLED:
+            return
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def _samples(self, extra=None):
+        extra = extra or []
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1], v[2])) for k, v in self._values.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, extra + [("le", _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key, extra)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._metrics.get(name) or self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=(), callback=None):
+        if name in self._metrics:
+            self._metrics[name].callback = callback
+            return self._metrics[name]
+        return self.register(Gauge(name, documentation, labelnames, callback))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._metrics.get(name) or self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def families(self, extra=None):
+        """{name: (documentation, type, sample lines)}; `extra` label pairs are added to every sample"""
+        return {metric.name: (metric.documentation, metric.type, metric._samples(extra))
+                for metric in self._metrics.values()}
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def render_families(*sources):
+    """Text exposition of several families() dicts, merging families with the same name"""
+    merged = {}
+    for families in sources:
+        for name, (documentation, type_, samples) in families.items():
+            merged.setdefault(name, (documentation, type_, []))[2].extend(samples)
+    lines = []
+    for name, (documentation, type_, samples) in merged.items():
+        lines.extend([f"# HELP {name} {documentation}", f"# TYPE {name} {type_}", *samples])
+    return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def resident_memory_bytes():
+    """Current RSS of this process (Linux /proc, falling back to peak RSS elsewhere)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+        import sys
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def process_memory(pid="self"):
+    """RSS, PSS and unique (private) bytes of a process from /proc/<pid>/smaps_rollup; None elsewhere.
+
+    PSS splits each shared page between the processes mapping it, so the
+    PSS of a group of processes adds up to what they really occupy.
+    """
+    fields = {"Rss": "rss", "Pss": "pss", "Private_Clean": "private", "Private_Dirty": "private"}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            lines = f.readlines()
+    except OSError:
+        return None
+    memory = {"rss": 0, "pss": 0, "private": 0}
+    for line in lines:
+        parts = line.split()
+        key = fields.get(parts[0].rstrip(":")) if parts else None
+        if key is not None:
+            memory[key] += int(parts[1]) * 1024
+    return memory
+
+
+STAGE_LATENCY = REGISTRY.histogram(
+    "audio_stage_duration_seconds", "Time spent in each pipeline stage", ("stage",))
+BATCH_SIZE = REGISTRY.histogram(
+    "inference_batch_size", "Number of clips per model forward pass", buckets=(1, 2, 4, 8, 16, 32, 64))
+REQUESTS = REGISTRY.counter(
+    "http_requests_total", "HTTP requests by path and status code", ("path", "status"))
+PREDICTIONS = REGISTRY.counter(
+    "predictions_total", "Predictions by predicted class", ("predicted_class",))
+CONFIDENCE = REGISTRY.histogram(
+    "prediction_confidence", "Confidence of the top prediction",
+    buckets=(0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 0.99))
+REJECTIONS = REGISTRY.counter(
+    "rejections_total", "Requests or predictions not turned into a device command, by reason", ("reason",))
+ESP32_COMMANDS = REGISTRY.counter(
+    "esp32_commands_total", "Commands delivered to the ESP32 by outcome", ("status",))
+REGISTRY.gauge("process_resident_memory_bytes", "Resident memory size in bytes", callback=resident_memory_bytes)
+
+
+def timer(stage):
+    """Context manager recording the duration of `stage` (no-op when metrics are disabled)"""
+    if not ENABLED:
+        return nullcontext()
+    return _timer(stage)
+
+
+@contextmanager
+def _timer(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_LATENCY.observe(time.perf_counter() - start, stage=stage)
+
+
+def timed(stage):
+    """Decorator form of timer()"""
+    def decorator(fn):
+        if not ENABLED:
+            return fn
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _timer(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def render():
+    return REGISTRY.render()
@@ -0,0 +1,327 @@
+"""Inference runtimes for the ConvMixer classifier.
+
+Runtimes: "eager" (the PyTorch module as built), "torchscript" (final
+BatchNorm folded into the classifier, traced and frozen), "onnx" (ONNX
+Runtime CPU; needs the optional onnx and onnxruntime packages) and int8
+"int8-dynamic" / "int8-static" (pointwise convs and the Linear layer
+quantized, everything else in float).
+
+    python model_runtime.py check                      # parity + latency of every runtime
+    python model_runtime.py export --runtime onnx --out exported/model.onnx
+"""
+import sys
+import copy
+import json
+import time
+import argparse
+import tempfile
+import logging
+import warnings
+from pathlib import Path
+import numpy as np
+import torch
+import torch.nn as nn
+
+logger = logging.getLogger(__name__)
+
+# torch.jit still works but warns on every trace/freeze call
+warnings.filterwarnings("ignore", category=FutureWarning, module=r"torch\.jit")
+
+# Everything except eager runs on CPU
+RUNTIMES = ("eager", "torchscript", "onnx", "int8-dynamic", "int8-static")
+
+# (minimum top-1 agreement with eager, maximum absolute probability delta)
+PARITY_TOLERANCE = {
+    "eager": (1.0, 0.0),
+    "torchscript": (1.0, 1e-4),
+    "onnx": (1.0, 1e-4),
+    "int8-dynamic": (0.95, 0.05),
+    "int8-static": (0.9, 0.1),
+}
+
+INPUT_SHAPE = (1, 128, 32)
+SAMPLE_AUDIO = Path(__file__).parent / "temp_audio.wav"
+
+
+class PointwiseLinear(nn.Module):
+    """1x1 Conv2d expressed as a Linear over the channel axis (dynamic quantization only covers Linear)"""
+
+    def __init__(self, conv):
+        super().__init__()
+        self.linear = nn.Linear(conv.in_channels, conv.out_channels, bias=conv.bias is not None)
+        with torch.no_grad():
+            self.linear.weight.copy_(conv.weight[:, :, 0, 0])
+            if conv.bias is not None:
+                self.linear.bias.copy_(conv.bias)
+
+    def forward(self, x):
+        return self.linear(x.permute(0, 2, 3, 1)).permute(0, 3, 1, 2)
+
+
+def is_pointwise_conv(module):
+    return isinstance(module, nn.Conv2d) and module.kernel_size == (1, 1) and module.groups == 1
+
+
+def fold_final_batchnorm(model):
+    """Copy of the ConvMixer with its last BatchNorm2d folded into the classifier Linear.
+
+    Every block is Conv -> GELU -> BatchNorm, so each BatchNorm follows a
+    nonlinearity and cannot be folded into the conv before it. The last one
+    only feeds average pooling and the Linear layer, which are both linear,
+    so it folds into the Linear exactly.
+    """
+    model = copy.deepcopy(model).eval()
+    batchnorm = model[-4][-1]
+    linear = model[-1]
+    if not (isinstance(batchnorm, nn.BatchNorm2d) and isinstance(linear, nn.Linear)):
+        raise ValueError("Unexpected model layout; expected ... BatchNorm2d, AdaptiveAvgPool2d, Flatten, Linear")
+
+    with torch.no_grad():
+        scale = batchnorm.weight / torch.sqrt(batchnorm.running_var + batchnorm.eps)
+        shift = batchnorm.bias - batchnorm.running_mean * scale
+        linear.bias.add_(linear.weight @ shift)
+        linear.weight.mul_(scale)
+    model[-4][-1] = nn.Identity()
+    return model
+
+
+def build_torchscript(model):
+    example = torch.zeros(1, *INPUT_SHAPE)
+    with torch.inference_mode():
+        # Plain freeze; optimize_for_inference converts to MKLDNN, which is slower on these small tensors
+        return torch.jit.freeze(torch.jit.trace(fold_final_batchnorm(model), example))
+
+
+def build_int8_dynamic(model):
+    """Dynamic int8: weights quantized ahead of time, activations per batch"""
+    model = fold_final_batchnorm(model)
+    for name, module in list(model.named_modules()):
+        for child_name, child in list(module.named_children()):
+            if is_pointwise_conv(child):
+                setattr(module, child_name, PointwiseLinear(child))
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+
+def build_int8_static(model, calibration):
+    """Static int8 of the pointwise convs and Linear, calibrated on `calibration` features"""
+    from torch.ao.quantization import QConfigMapping, get_default_qconfig
+    from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+    model = fold_final_batchnorm(model)
+    qconfig = get_default_qconfig(torch.backends.quantized.engine)
+    mapping = QConfigMapping().set_object_type(nn.Linear, qconfig)
+    for name, module in model.named_modules():
+        if is_pointwise_conv(module):
+            mapping = mapping.set_module_name(name, qconfig)
+
+    example = (torch.zeros(1, *INPUT_SHAPE),)
+    prepared = prepare_fx(model, mapping, example)
+    with torch.inference_mode():
+        for batch in np.array_split(calibration, max(1, len(calibration) // 16)):
+            prepared(torch.as_tensor(batch))
+    quantized = convert_fx(prepared)
+    with torch.inference_mode():
+        return torch.jit.freeze(torch.jit.trace(quantized, example))
+
+
+def export_onnx(model, path, opset=17):
+    """Export with a dynamic batch axis (needs the onnx package)"""
+    try:
+        import onnx  # noqa: F401
+    except ImportError as e:
+        raise ImportError("ONNX export needs the onnx package (pip install onnx onnxruntime)") from e
+    torch.onnx.export(
+        fold_final_batchnorm(model), (torch.zeros(1, *INPUT_SHAPE),), str(path),
+        input_names=["mel"], output_names=["logits"],
+        dynamic_axes={"mel": {0: "batch"}, "logits": {0: "batch"}},
+        opset_version=opset, dynamo=False,
+    )
+
+
+class OnnxRuntimeModel:
+    """Callable with the same contract as the torch model: (B, 1, 128, 32) tensor -> logits tensor"""
+
+    def __init__(self, path, intra_op_threads=None):
+        ort = self.check_available()
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = intra_op_threads or torch.get_num_threads()
+        self.session = ort.InferenceSession(str(path), options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    @staticmethod
+    def check_available():
+        try:
+            import onnxruntime
+        except ImportError as e:
+            raise ImportError("The onnx runtime needs the onnxruntime package (pip install onnxruntime)") from e
+        return onnxruntime
+
+    def __call__(self, batch):
+        logits = self.session.run(None, {self.input_name: batch.detach().cpu().numpy()})[0]
+        return torch.from_numpy(logits)
+
+
+def build_runtime(runtime, model, artifact=None, calibration=None):
+    """Return a callable classifier for `runtime`.
+
+    `model` is the eager ConvMixer with weights loaded. With `artifact` the
+    runtime is loaded from a file written by export(); otherwise it is built
+    in memory (int8-static then needs `calibration` features).
+    """
+    if runtime not in RUNTIMES:
+        raise ValueError(f"Unknown model runtime: {runtime} (expected one of {RUNTIMES})")
+    if runtime == "eager":
+        return model
+    if runtime == "onnx":
+        OnnxRuntimeModel.check_available()
+        if artifact is None:
+            # The session reads the whole model at creation, so the export can go right after
+            with tempfile.TemporaryDirectory(prefix="convmixer-") as directory:
+                artifact = Path(directory) / "model.onnx"
+                export_onnx(model, artifact)
+                return OnnxRuntimeModel(artifact)
+        return OnnxRuntimeModel(artifact)
+    if artifact is not None:
+        return torch.jit.load(str(artifact), map_location="cpu").eval()
+    if runtime == "torchscript":
+        return build_torchscript(model)
+    if runtime == "int8-dynamic":
+        return build_int8_dynamic(model)
+    if calibration is None:
+        raise ValueError("int8-static needs calibration features when built without an artifact")
+    return build_int8_static(model, calibration)
+
+
+def export(runtime, model, path, calibration=None):
+    """Write `runtime` to `path` so build_runtime(runtime, model, artifact=path) can load it"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if runtime == "onnx":
+        export_onnx(model, path)
+        return path
+    if runtime == "eager":
+        raise ValueError("Nothing to export for the eager runtime; use audio_classifier_best.pth")
+    compiled = build_runtime(runtime, model, calibration=calibration)
+    if not isinstance(compiled, torch.jit.ScriptModule):
+        compiled = torch.jit.trace(compiled, torch.zeros(1, *INPUT_SHAPE))
+    torch.jit.save(compiled, str(path))
+    return path
+
+
+def reference_clips(n_clips=48, seed=0):
+    """Deterministic 1 s int16 clips: windows of the sample recording, speech-like tones and noise"""
+    import synthetic_audio
+    from audio_io import decode_wav_bytes, read_audio_source
+
+    rng = np.random.default_rng(seed)
+    clips = []
+    if SAMPLE_AUDIO.exists():
+        recording, _ = decode_wav_bytes(read_audio_source(SAMPLE_AUDIO))
+        if len(recording) > 16000:
+            for offset in rng.integers(0, len(recording) - 16000, n_clips // 4):
+                clips.append(recording[offset:offset + 16000])
+    while len(clips) < n_clips * 3 // 4:
+        clips.append(synthetic_audio.speech_like(1.0, seed=int(rng.integers(1 << 31)), speech_sec=0.8))
+    while len(clips) < n_clips:
+        clips.append(synthetic_audio.noise(1.0, seed=int(rng.integers(1 << 31)), level=float(rng.uniform(300, 6000))))
+
+    clips = np.stack(clips).astype(np.float64)
+    # Same peak normalization as AudioPreprocessor.normalize_audio
+    peaks = np.max(np.abs(clips), axis=1, keepdims=True)
+    clips = clips / np.maximum(peaks, 1) * 0.99
+    return (clips * 32767).astype(np.int16)
+
+
+def reference_features(mel_batch, n_clips=48, seed=0):
+    """(N, 1, 128, 32) features of reference_clips() through `mel_batch`"""
+    return np.asarray(mel_batch(reference_clips(n_clips, seed)), dtype=np.float32)
+
+
+def probabilities(model, features, batch_size=16):
+    outputs = []
+    with torch.inference_mode():
+        for start in range(0, len(features), batch_size):
+            logits = model(torch.as_tensor(features[start:start + batch_size]))
+            outputs.append(torch.softmax(logits, dim=1).numpy())
+    return np.concatenate(outputs)
+
+
+def check_parity(runtime, candidate, reference_model, features, tolerance=None):
+    """Compare `candidate` against the eager model on reference features.
+
+    Returns {"top1_agreement", "max_prob_delta", "ok"}; tolerance defaults
+    to PARITY_TOLERANCE[runtime].
+    """
+    min_agreement, max_delta = tolerance or PARITY_TOLERANCE[runtime]
+    expected = probabilities(reference_model, features)
+    actual = probabilities(candidate, features)
+    agreement = float(np.mean(expected.argmax(axis=1) == actual.argmax(axis=1)))
+    delta = float(np.max(np.abs(expected - actual)))
+    return {
+        "top1_agreement": agreement,
+        "max_prob_delta": delta,
+        "ok": agreement >= min_agreement and delta <= max_delta,
+    }
+
+
+def measure_latency(model, batch_size=1, repeats=50, warmup=10):
+    batch = torch.zeros(batch_size, *INPUT_SHAPE)
+    with torch.inference_mode():
+        # TorchScript specializes the graph during the first few calls
+        for _ in range(warmup):
+            model(batch)
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            model(batch)
+            times.append((time.perf_counter() - start) * 1000)
+    return {"p50_ms": float(np.percentile(times, 50)), "mean_ms": float(np.mean(times))}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export and compare ConvMixer runtimes")
+    sub = parser.add_subparsers(dest="command", required=True)
+    check = sub.add_parser("check", help="Parity and latency of each runtime against eager")
+    check.add_argument("--runtimes", nargs="+", default=list(RUNTIMES), choices=RUNTIMES)
+    check.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8])
+    check.add_argument("--repeats", type=int, default=50)
+    exp = sub.add_parser("export", help="Write a runtime artifact for MODEL_ARTIFACT")
+    exp.add_argument("--runtime", required=True, choices=[r for r in RUNTIMES if r != "eager"])
+    exp.add_argument("--out", required=True)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    from audio_command_detector import AudioCommandDetector
+    detector = AudioCommandDetector(max_batch_size=1, cache_size=0)
+    try:
+        model = detector.eager_model
+        calibration = reference_features(detector.extract_mel_batch, seed=1)
+        features = reference_features(detector.extract_mel_batch)
+
+        if args.command == "export":
+            path = export(args.runtime, model, args.out, calibration=calibration)
+            compiled = build_runtime(args.runtime, model, artifact=path)
+            parity = check_parity(args.runtime, compiled, model, features)
+            print(json.dumps({"runtime": args.runtime, "artifact": str(path), "parity": parity}, indent=2))
+            return 0 if parity["ok"] else 1
+
+        report = {}
+        for runtime in args.runtimes:
+            try:
+                compiled = build_runtime(runtime, model, calibration=calibration)
+            except ImportError as e:
+                report[runtime] = {"error": str(e)}
+                continue
+            report[runtime] = {
+                "parity": check_parity(runtime, compiled, model, features),
+                **{f"batch={size}": measure_latency(compiled, size, args.repeats) for size in args.batch_sizes},
+            }
+        print(json.dumps(report, indent=2))
+        return 0 if all(entry.get("parity", {}).get("ok", True) for entry in report.values()) else 1
+    finally:
+        detector.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
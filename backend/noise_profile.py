@@ -0,0 +1,175 @@
+"""Per-device noise profiles for stationary spectral gating.
+
+Without a profile, noisereduce's non-stationary gate re-estimates the noise
+floor from every clip. Devices sit in the same room with the same microphone,
+so the noise statistics are learned from the non-speech frames VAD finds and
+reused: later clips from that device are denoised with a stationary gate
+(the algorithm of noisereduce's stationary mode) against the cached profile.
+"""
+import time
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+import numpy as np
+
+# noisereduce defaults
+N_FFT = 1024
+HOP_LENGTH = N_FFT // 4
+N_STD_THRESH = 1.5
+FREQ_MASK_SMOOTH_HZ = 500
+TIME_MASK_SMOOTH_MS = 50
+
+
+def spectrum(audio, n_fft=N_FFT, hop_length=HOP_LENGTH):
+    """STFT with the same framing as noisereduce"""
+    from scipy.signal import stft
+    _, _, spec = stft(np.asarray(audio, dtype=np.float32), nfft=n_fft, nperseg=n_fft,
+                      noverlap=n_fft - hop_length, padded=False)
+    return spec
+
+
+def amp_to_db(spec, top_db=80.0):
+    db = 20 * np.log10(np.abs(spec) + np.finfo(np.float64).eps)
+    if db.shape[-1] == 0:
+        return db
+    return np.maximum(db, np.max(db, axis=-1, keepdims=True) - top_db)
+
+
+@lru_cache(maxsize=8)
+def smoothing_filter(sr, n_fft=N_FFT, hop_length=HOP_LENGTH,
+                     freq_mask_smooth_hz=FREQ_MASK_SMOOTH_HZ, time_mask_smooth_ms=TIME_MASK_SMOOTH_MS):
+    """Triangular (frequency x time) kernel used to soften the gate mask"""
+    n_freq = max(1, int(freq_mask_smooth_hz / (sr / (n_fft / 2))))
+    n_time = max(1, int(time_mask_smooth_ms / (hop_length / sr * 1000)))
+
+    def ramp(n):
+        return np.concatenate([np.linspace(0, 1, n + 1, endpoint=False), np.linspace(1, 0, n + 2)])[1:-1]
+
+    kernel = np.outer(ramp(n_freq), ramp(n_time))
+    kernel = kernel / kernel.sum()
+    kernel.setflags(write=False)
+    return kernel
+
+
+def stationary_gate(audio, sr, noise_thresh_db, spec=None, prop_decrease=1.0,
+                    n_fft=N_FFT, hop_length=HOP_LENGTH):
+    """Attenuate time-frequency bins below the per-frequency noise threshold.
+
+    `spec` may be passed when the caller already computed spectrum(audio).
+    Unlike noisereduce this does not zero-pad the clip by 30000 samples on
+    each side first; scipy's own boundary padding covers the edges.
+    """
+    from scipy.signal import istft, fftconvolve
+    if spec is None:
+        spec = spectrum(audio, n_fft, hop_length)
+    mask = amp_to_db(spec) > noise_thresh_db[:, np.newaxis]
+    mask = mask * prop_decrease + (1.0 - prop_decrease)
+    mask = fftconvolve(mask, smoothing_filter(sr, n_fft, hop_length), mode="same")
+    _, denoised = istft(spec * mask, nfft=n_fft, nperseg=n_fft, noverlap=n_fft - hop_length)
+    out = np.zeros(len(audio), dtype=np.float32)
+    out[:min(len(out), len(denoised))] = denoised[:len(out)]
+    return out
+
+
+def noise_columns(noise_flags, frame_length, n_samples, n_frames, n_fft=N_FFT, hop_length=HOP_LENGTH):
+    """STFT columns whose central half-window lies in frames flagged as noise"""
+    speech = np.ones(n_samples, dtype=bool)
+    covered = min(n_samples, len(noise_flags) * frame_length)
+    speech[:covered] = ~np.repeat(noise_flags, frame_length)[:covered]
+    # scipy centers column j on sample j * hop_length (zero boundary padding)
+    counts = np.concatenate([[0], np.cumsum(speech)])
+    centers = np.arange(n_frames) * hop_length
+    start = np.clip(centers - n_fft // 4, 0, n_samples)
+    end = np.clip(centers + n_fft // 4, 0, n_samples)
+    return (counts[end] - counts[start] == 0) & (end - start >= n_fft // 4)
+
+
+class NoiseProfile:
+    """Running per-frequency mean/std of the noise spectrum in dB.
+
+    Each update decays the previous statistics by `decay`, so the profile
+    follows slow changes in the room (a fan switched on) within a few clips.
+    """
+
+    def __init__(self, decay=0.8, min_frames=30):
+        self.decay = decay
+        self.min_frames = min_frames
+        self._weight = 0.0
+        self._sum = None
+        self._sum_sq = None
+        self._lock = threading.Lock()
+        self.updates = 0
+        self.updated_at = None
+
+    @property
+    def ready(self):
+        return self._weight >= self.min_frames
+
+    def update(self, noise_db):
+        """Fold in (n_freq, n_frames) dB columns of noise-only audio"""
+        if noise_db.shape[1] == 0:
+            return
+        with self._lock:
+            if self._sum is None:
+                self._sum = np.zeros(noise_db.shape[0])
+                self._sum_sq = np.zeros(noise_db.shape[0])
+            self._weight = self._weight * self.decay + noise_db.shape[1]
+            self._sum = self._sum * self.decay + noise_db.sum(axis=1)
+            self._sum_sq = self._sum_sq * self.decay + np.square(noise_db).sum(axis=1)
+            self.updates += 1
+            self.updated_at = time.time()
+
+    def update_from_clip(self, spec, noise_flags, frame_length, n_samples):
+        """Update from the STFT of a clip and per-frame noise flags"""
+        columns = noise_columns(noise_flags, frame_length, n_samples, spec.shape[1])
+        self.update(amp_to_db(spec[:, columns]))
+
+    def threshold(self, n_std=N_STD_THRESH):
+        with self._lock:
+            mean = self._sum / self._weight
+            std = np.sqrt(np.maximum(self._sum_sq / self._weight - np.square(mean), 0.0))
+        return mean + n_std * std
+
+    def stats(self):
+        return {"ready": self.ready, "frames": round(self._weight, 1), "updates": self.updates,
+                "updated_at": self.updated_at}
+
+
+class NoiseProfileCache:
+    """Thread-safe LRU of NoiseProfile by device id"""
+
+    def __init__(self, max_devices=64, decay=0.8, min_frames=30):
+        self.max_devices = max(0, int(max_devices))
+        self.decay = decay
+        self.min_frames = min_frames
+        self._profiles = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    @property
+    def enabled(self):
+        return self.max_devices > 0
+
+    def get(self, device_id):
+        """Profile for device_id, created empty on first sight; None without an id or when disabled"""
+        if not self.enabled or not device_id:
+            return None
+        with self._lock:
+            profile = self._profiles.get(device_id)
+            if profile is None:
+                profile = self._profiles[device_id] = NoiseProfile(self.decay, self.min_frames)
+                while len(self._profiles) > self.max_devices:
+                    self._profiles.popitem(last=False)
+                    self.evictions += 1
+            self._profiles.move_to_end(device_id)
+            return profile
+
+    def stats(self):
+        with self._lock:
+            profiles = list(self._profiles.values())
+            return {
+                "devices": len(profiles),
+                "ready": sum(profile.ready for profile in profiles),
+                "max_devices": self.max_devices,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,72 @@
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+def audio_cache_key(samples, sr, namespace=""):
+    """Fast content hash of decoded PCM plus anything that changes the result (model, config)"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{namespace}|{sr}|{np.asarray(samples).dtype.str}|".encode())
+    digest.update(memoryview(np.ascontiguousarray(samples)).cast("B"))
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """Thread-safe LRU cache whose entries also expire after `ttl_seconds`"""
+
+    def __init__(self, max_entries=256, ttl_seconds=300.0):
+        self.max_entries = max(0, int(max_entries))
+        self.ttl = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0 and self.ttl > 0
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,175 @@
+"""Multi-worker launcher with one shared inference process.
+
+    python serve.py --workers 4 --port 8000
+
+Starts the inference process (the only one that imports torch and loads
+the model), then forks `--workers` uvicorn workers that accept on the same
+listening socket and run app.py with INFERENCE_EXECUTOR=shared. PCM goes to
+the inference process through shared memory (see shared_inference.py).
+Device commands are queued and sent from the inference process too, so each
+device has one queue whatever the worker count. /stats reports the RSS/PSS
+of every process. Dead workers are restarted; if the inference process dies
+the server shuts down.
+"""
+import os
+import sys
+import time
+import signal
+import socket
+import argparse
+import logging
+import multiprocessing
+
+os.environ["INFERENCE_EXECUTOR"] = "shared"
+
+logger = logging.getLogger("serve")
+
+
+def bind_socket(host, port, backlog=2048):
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(index, channels, sock, log_level):
+    import uvicorn
+    import shared_inference
+    import app
+
+    shared_inference.attach(channels, index)
+    config = uvicorn.Config(app.app, log_level=log_level, lifespan="on")
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def fork_worker(index, channels, sock, log_level):
+    # Hold signals across fork so the child never runs the supervisor's handler
+    signals = {signal.SIGINT, signal.SIGTERM}
+    signal.pthread_sigmask(signal.SIG_BLOCK, signals)
+    pid = os.fork()
+    if pid == 0:
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, signals)
+        code = 0
+        try:
+            run_worker(index, channels, sock, log_level)
+        except BaseException:
+            logger.exception(f"Worker {index} crashed")
+            code = 1
+        finally:
+            os._exit(code)
+    signal.pthread_sigmask(signal.SIG_UNBLOCK, signals)
+    return pid
+
+
+def stop_workers(pids, timeout=15.0):
+    """SIGTERM the workers (uvicorn shuts down gracefully), SIGKILL whatever is left after `timeout`"""
+    for pid in pids:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    deadline = time.monotonic() + timeout
+    remaining = set(pids)
+    while remaining:
+        for pid in list(remaining):
+            try:
+                done, _ = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                done = pid
+            if done:
+                remaining.discard(pid)
+        if remaining and time.monotonic() > deadline:
+            for pid in remaining:
+                logger.warning(f"⚠️ Worker pid {pid} did not stop, killing it")
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            break
+        time.sleep(0.05)
+
+
+def log_memory(channels):
+    memory = channels.memory()
+    for name, entry in memory.items():
+        if isinstance(entry, dict) and "rss" in entry:
+            logger.info(f"📊 {name:<10} pid {entry['pid']:<7} RSS {entry['rss'] / 2**20:7.1f} MiB  "
+                        f"PSS {entry['pss'] / 2**20:7.1f} MiB  private {entry['private'] / 2**20:7.1f} MiB")
+    if memory["total_pss"]:
+        logger.info(f"📊 total PSS {memory['total_pss'] / 2**20:.1f} MiB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve app.py from several workers sharing one model")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=int(os.getenv("SERVE_WORKERS", str(os.cpu_count() or 1))))
+    parser.add_argument("--slot-seconds", type=float, default=float(os.getenv("SHARED_SLOT_SECONDS", "10")),
+                        help="Longest clip passed through shared memory; longer ones are pickled")
+    parser.add_argument("--inference-threads", type=int, default=None,
+                        help="torch threads in the inference process (default: all cores)")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    # Pipeline threads in the inference process, and so its batch size: two per HTTP worker
+    os.environ.setdefault("INFERENCE_WORKERS", str(2 * args.workers))
+    # Light imports only: workers are forked from this process and must not inherit torch
+    import app
+    from shared_inference import Channels, run_inference_server
+
+    context = multiprocessing.get_context("spawn")
+    channels = Channels(args.workers, slots_per_worker=app.INFERENCE_MAX_PENDING, slot_seconds=args.slot_seconds,
+                        context=context)
+    inference = context.Process(target=run_inference_server, name="inference",
+                                args=(channels, app.detector_kwargs, args.inference_threads, app.WARMUP_ENABLED,
+                                      app.router_kwargs))
+    inference.start()
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    sock = bind_socket(args.host, args.port)
+    logger.info(f"🚀 Listening on {args.host}:{args.port} with {args.workers} workers")
+    workers = {fork_worker(i, channels, sock, args.log_level): i for i in range(args.workers)}
+
+    reported = False
+    try:
+        while not stopping:
+            time.sleep(0.5)
+            if not inference.is_alive():
+                logger.error(f"❌ Inference process exited with code {inference.exitcode}, shutting down")
+                break
+            for pid, index in list(workers.items()):
+                done, status = os.waitpid(pid, os.WNOHANG)
+                if done and not stopping:
+                    logger.warning(f"⚠️ Worker {index} (pid {pid}) exited with status {status}, restarting")
+                    del workers[pid]
+                    workers[fork_worker(index, channels, sock, args.log_level)] = index
+            if not reported and channels.ready.is_set():
+                # Workers need a moment after the model is ready to finish their own startup
+                time.sleep(1.0)
+                log_memory(channels)
+                reported = True
+    finally:
+        stop_workers(list(workers))
+        if inference.is_alive():
+            channels.requests.put(None)
+            inference.join(timeout=10)
+            if inference.is_alive():
+                inference.kill()
+        sock.close()
+        channels.close(unlink=True)
+    return 0 if stopping else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,375 @@
+"""One inference process serving several HTTP worker processes.
+
+serve.py starts a single inference process that owns the detector (model
+weights, mel filterbank, result cache, noise profiles and the batching
+engine), then forks the uvicorn workers. Workers decode uploads themselves
+and hand the int16 PCM over through a shared-memory block split into
+fixed-size slots: each worker owns `slots_per_worker` slots, so no locking
+is needed between workers, and a worker with no free slot answers 503 like
+the other pool modes. Only the small request/response messages go through
+multiprocessing queues.
+
+Because every prediction runs in the same process, the batching engine
+batches concurrent requests from all workers, and adding a worker adds an
+interpreter without another copy of torch and the weights.
+
+The inference process also owns the CommandRouter, on an event loop thread of
+its own, so there is one queue per device however many workers submit to it;
+the workers reach it through SharedCommandRouter over the same channels.
+"""
+import os
+import uuid
+import time
+import queue
+import signal
+import asyncio
+import logging
+import threading
+import multiprocessing
+from multiprocessing.shared_memory import SharedMemory
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import metrics
+from worker_pool import PoolSaturatedError, configure_threads
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+# CommandRouter coroutines a worker may call in the inference process
+ROUTER_METHODS = ("submit", "send", "result", "stats")
+
+
+class Channels:
+    """Everything the inference process and the workers share; created by serve.py before forking"""
+
+    def __init__(self, workers, slots_per_worker=8, slot_seconds=10.0, context=None):
+        context = context or multiprocessing.get_context("spawn")
+        self.workers = workers
+        self.slots_per_worker = slots_per_worker
+        self.slot_samples = int(SAMPLE_RATE * slot_seconds)
+        self.shm = SharedMemory(create=True, size=workers * slots_per_worker * self.slot_samples * 2)
+        self.requests = context.Queue()
+        self.responses = [context.Queue() for _ in range(workers)]
+        self.ready = context.Event()
+        # pids[0] is the inference process, pids[1 + i] HTTP worker i
+        self.pids = context.Array("i", workers + 1, lock=False)
+
+    def __getstate__(self):
+        # The spawned inference process re-attaches to the block by name
+        state = self.__dict__.copy()
+        state["shm"] = self.shm.name
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.shm = SharedMemory(name=state["shm"])
+
+    def slots(self):
+        return np.ndarray((self.workers * self.slots_per_worker, self.slot_samples), dtype=np.int16,
+                          buffer=self.shm.buf)
+
+    def memory(self):
+        """Per-process memory of the inference process and every HTTP worker"""
+        processes = [("inference", self.pids[0])] + [(f"worker-{i}", pid) for i, pid in enumerate(self.pids[1:])]
+        report = {}
+        for name, pid in processes:
+            usage = metrics.process_memory(pid) if pid else None
+            report[name] = {"pid": pid, **usage} if usage else {"pid": pid}
+        totals = [entry["pss"] for entry in report.values() if "pss" in entry]
+        report["total_pss"] = sum(totals) if totals else None
+        return report
+
+    def close(self, unlink=False):
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+async def _build_router(router_kwargs):
+    from command_router import CommandRouter
+    return CommandRouter(**router_kwargs)
+
+
+def run_inference_server(channels, detector_kwargs, num_threads=None, warm_up=True, router_kwargs=None):
+    """Inference process main loop: load the detector, then serve requests until a None arrives.
+
+    With `router_kwargs`, device commands from every worker go through one
+    CommandRouter running on an event loop thread here.
+
+    Ctrl+C and SIGTERM sent to the whole process group are ignored: serve.py
+    stops this process after the workers have drained. It also exits if
+    serve.py disappears without doing so.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    parent = os.getppid()
+    channels.pids[0] = os.getpid()
+    configure_threads(num_threads or os.cpu_count() or 1)
+    from audio_command_detector import AudioCommandDetector
+    detector = AudioCommandDetector(**detector_kwargs)
+    if warm_up:
+        detector.warm_up()
+    metrics.REGISTRY.gauge("inference_batch_queue_depth", "Spectrograms waiting for the batching engine",
+                           callback=lambda: detector.inference_engine.stats()["queue_depth"])
+    slots = channels.slots()
+    # One pipeline thread per batch slot (INFERENCE_WORKERS, see serve.py)
+    executor = ThreadPoolExecutor(max_workers=detector.inference_engine.max_batch_size,
+                                  thread_name_prefix="shared-inference")
+    router = router_loop = None
+    if router_kwargs is not None:
+        router_loop = asyncio.new_event_loop()
+        threading.Thread(target=router_loop.run_forever, name="command-router", daemon=True).start()
+        router = asyncio.run_coroutine_threadsafe(_build_router(router_kwargs), router_loop).result()
+    channels.ready.set()
+    logger.info(f"🧠 Inference process {os.getpid()} ready for {channels.workers} workers")
+
+    def reply(request_id, worker, ok, payload):
+        try:
+            channels.responses[worker].put((request_id, ok, payload))
+        except Exception as e:
+            # Unpicklable exception: send its text instead
+            channels.responses[worker].put((request_id, False, RuntimeError(str(e))))
+
+    def route(request_id, worker, method, args):
+        """Run a CommandRouter coroutine on the router loop; answer when it finishes, not from the executor"""
+        if router is None or method not in ROUTER_METHODS:
+            return reply(request_id, worker, False, ValueError(f"Unsupported command router method: {method}"))
+        future = asyncio.run_coroutine_threadsafe(getattr(router, method)(*args), router_loop)
+
+        def done(future):
+            error = future.exception()
+            reply(request_id, worker, error is None, future.result() if error is None else error)
+        future.add_done_callback(done)
+
+    def handle(request_id, worker, method, slot, n_samples, inline, args):
+        try:
+            if method == "predict_samples":
+                samples = inline if inline is not None else slots[slot, :n_samples].copy()
+                result = detector.predict_samples(samples, *args)
+            elif method == "stats":
+                result = detector.stats()
+            elif method == "metrics":
+                # Stage timers, batch sizes and cache metrics are recorded here, not in the workers
+                result = metrics.REGISTRY.families([("process", "inference")])
+            else:
+                raise ValueError(f"Unsupported shared inference method: {method}")
+        except Exception as e:
+            return reply(request_id, worker, False, e)
+        reply(request_id, worker, True, result)
+
+    try:
+        while True:
+            try:
+                message = channels.requests.get(timeout=1.0)
+            except queue.Empty:
+                if os.getppid() != parent:
+                    break
+                continue
+            if message is None:
+                break
+            request_id, worker, method = message[:3]
+            if method.startswith("router."):
+                route(request_id, worker, method[len("router."):], message[-1])
+            else:
+                executor.submit(handle, *message)
+    finally:
+        executor.shutdown(wait=True)
+        if router is not None:
+            # Deliver what the workers queued before the shutdown
+            try:
+                asyncio.run_coroutine_threadsafe(router.close(), router_loop).result(timeout=30)
+            except Exception as e:
+                logger.warning(f"⚠️ Command router did not close cleanly: {e}")
+            router_loop.call_soon_threadsafe(router_loop.stop)
+        detector.close()
+        del slots
+        channels.close()
+
+
+class SharedInferencePool:
+    """Client side used by an HTTP worker; same call()/stats() interface as InferencePool"""
+
+    mode = "shared"
+
+    def __init__(self, channels, worker, retry_after=1, ready_timeout=300.0):
+        self.channels = channels
+        self.worker = worker
+        self.retry_after = retry_after
+        self.ready_timeout = ready_timeout
+        self.max_pending = channels.slots_per_worker
+        self.slots = channels.slots()
+        first = worker * channels.slots_per_worker
+        self._free = list(range(first, first + channels.slots_per_worker))
+        self._futures = {}
+        self._loop = None
+        self._reader = None
+        self._completed = 0
+        self._rejected = 0
+        self._inline = 0
+
+    async def call(self, method, *args):
+        """Decode here, run detector.<method> in the inference process"""
+        loop = asyncio.get_running_loop()
+        if method == "predict":
+            audio_source, *args = args
+            samples, sr = await loop.run_in_executor(None, self._decode_wav, audio_source)
+        elif method == "predict_encoded":
+            data, content_type, sample_rate, channels, *args = args
+            samples, sr = await loop.run_in_executor(None, self._decode, data, content_type, sample_rate, channels)
+        elif method == "predict_samples":
+            samples, sr, *args = args
+        else:
+            return await self._request(method, None, ())
+        return await self._request("predict_samples", np.asarray(samples, dtype=np.int16), (sr, *args))
+
+    @staticmethod
+    def _decode_wav(audio_source):
+        from audio_io import decode_wav_bytes, read_audio_source
+        with metrics.timer("decode"):
+            return decode_wav_bytes(read_audio_source(audio_source), SAMPLE_RATE)
+
+    @staticmethod
+    def _decode(data, content_type, sample_rate, channels):
+        from audio_io import decode_audio_bytes
+        with metrics.timer("decode"):
+            return decode_audio_bytes(data, content_type, sample_rate, channels, SAMPLE_RATE)
+
+    async def _request(self, method, samples, args):
+        slot = None
+        if samples is not None:
+            if not self._free:
+                self._rejected += 1
+                raise PoolSaturatedError(self.retry_after)
+            slot = self._free.pop()
+        self._ensure_reader()
+        inline = None
+        n_samples = 0
+        if samples is not None:
+            if len(samples) <= self.channels.slot_samples:
+                n_samples = len(samples)
+                self.slots[slot, :n_samples] = samples
+            else:
+                # Longer than a slot: pickle it into the message instead
+                self._inline += 1
+                inline = samples
+        request_id = uuid.uuid4().hex
+        future = self._loop.create_future()
+        # The slot stays taken until the inference process answers, even if this call is
+        # cancelled: it may not have copied the samples out yet
+        self._futures[request_id] = (future, slot)
+        try:
+            self.channels.requests.put((request_id, self.worker, method, slot, n_samples, inline, args))
+        except BaseException:
+            self._release(request_id)
+            raise
+        ok, payload = await future
+        if not ok:
+            raise payload
+        self._completed += 1
+        return payload
+
+    async def route(self, method, *args):
+        """Run CommandRouter.<method> in the inference process"""
+        return await self._request(f"router.{method}", None, args)
+
+    def _ensure_reader(self):
+        if self._reader is None:
+            self._loop = asyncio.get_running_loop()
+            self._reader = threading.Thread(target=self._read_responses, name="shared-inference-responses",
+                                            daemon=True)
+            self._reader.start()
+
+    def _read_responses(self):
+        responses = self.channels.responses[self.worker]
+        while True:
+            message = responses.get()
+            if message is None:
+                return
+            request_id, ok, payload = message
+            self._loop.call_soon_threadsafe(self._resolve, request_id, ok, payload)
+
+    def _release(self, request_id):
+        future, slot = self._futures.pop(request_id)
+        if slot is not None:
+            self._free.append(slot)
+        return future
+
+    def _resolve(self, request_id, ok, payload):
+        if request_id not in self._futures:
+            return
+        future = self._release(request_id)
+        # Already done: the caller was cancelled (client went away); only the slot mattered
+        if not future.done():
+            future.set_result((ok, payload))
+
+    def warm_up(self):
+        """Block until the inference process has loaded and warmed up the model"""
+        start = time.perf_counter()
+        if not self.channels.ready.wait(self.ready_timeout):
+            raise RuntimeError(f"Inference process not ready after {self.ready_timeout:.0f}s")
+        logger.info(f"🔗 Worker {self.worker} connected to inference process {self.channels.pids[0]} "
+                    f"after {time.perf_counter() - start:.1f}s")
+
+    def stats(self):
+        return {
+            "mode": self.mode,
+            "worker": self.worker,
+            "workers": self.channels.workers,
+            "pending": self.max_pending - len(self._free),
+            "max_pending": self.max_pending,
+            "completed": self._completed,
+            "rejected": self._rejected,
+            "inline_transfers": self._inline,
+            "memory": self.channels.memory(),
+        }
+
+    def shutdown(self):
+        if self._reader is not None:
+            self.channels.responses[self.worker].put(None)
+
+
+class SharedCommandRouter:
+    """Worker side of the inference process's CommandRouter; same coroutines as CommandRouter"""
+
+    def __init__(self, table):
+        # Kept locally to validate device names without a round trip
+        self.table = table
+
+    async def submit(self, command, client=None, device=None):
+        return await connect().route("submit", command, client, device)
+
+    async def send(self, command, client=None, device=None):
+        return await connect().route("send", command, client, device)
+
+    async def result(self, dispatch_id):
+        return await connect().route("result", dispatch_id)
+
+    async def stats(self):
+        return await connect().route("stats")
+
+    async def close(self):
+        """The inference process drains and closes the router when serve.py stops it"""
+
+
+# Set in each forked HTTP worker by serve.py
+_channels = None
+_worker = None
+_pool = None
+
+
+def attach(channels, worker):
+    global _channels, _worker
+    _channels, _worker = channels, worker
+    channels.pids[1 + worker] = os.getpid()
+
+
+def connect(retry_after=None):
+    """This worker's pool, shared by predictions and commands; only available in processes started by serve.py"""
+    global _pool
+    if _channels is None:
+        raise RuntimeError("INFERENCE_EXECUTOR=shared needs the workers started by serve.py")
+    if _pool is None:
+        _pool = SharedInferencePool(_channels, _worker)
+    if retry_after is not None:
+        _pool.retry_after = retry_after
+    return _pool
@@ -0,0 +1,161 @@
+import logging
+import numpy as np
+import webrtcvad
+
+logger = logging.getLogger(__name__)
+
+
+class RingBuffer:
+    """Fixed-size int16 ring buffer addressed by absolute sample index"""
+
+    def __init__(self, capacity):
+        self.capacity = int(capacity)
+        self.buffer = np.zeros(self.capacity, dtype=np.int16)
+        self.total = 0  # samples written since the start of the stream
+
+    @property
+    def oldest(self):
+        return max(0, self.total - self.capacity)
+
+    def write(self, samples):
+        samples = np.asarray(samples, dtype=np.int16)
+        if len(samples) >= self.capacity:
+            self.total += len(samples) - self.capacity
+            samples = samples[-self.capacity:]
+        pos = self.total % self.capacity
+        first = min(len(samples), self.capacity - pos)
+        self.buffer[pos:pos + first] = samples[:first]
+        self.buffer[:len(samples) - first] = samples[first:]
+        self.total += len(samples)
+
+    def read(self, start, end):
+        """Copy samples [start, end) out of the buffer; start is clamped to what is still held"""
+        start = max(start, self.oldest)
+        end = min(end, self.total)
+        if end <= start:
+            return np.zeros(0, dtype=np.int16)
+        first, last = start % self.capacity, end % self.capacity
+        if first < last or last == 0:
+            return self.buffer[first:last or self.capacity].copy()
+        return np.concatenate([self.buffer[first:], self.buffer[:last]])
+
+
+class StreamingSegmenter:
+    """Incremental VAD endpointing over a stream of 16 kHz int16 PCM chunks.
+
+    Chunks of any size go into a ring buffer; complete 30 ms frames are run
+    through webrtcvad as they arrive (frames below `silence_rms` are treated
+    as silence without a VAD call). An utterance starts after `start_frames`
+    consecutive speech frames and ends after `end_silence_ms` of silence or
+    `max_utterance_sec` of audio; feed() returns the finished utterances,
+    feed_events() every start / end in stream order.
+    """
+
+    def __init__(self, sr=16000, vad_mode=2, frame_ms=30, start_frames=3, end_silence_ms=700,
+                 pre_roll_ms=300, min_speech_ms=200, max_utterance_sec=3.0, silence_rms=50.0,
+                 buffer_sec=10.0):
+        if sr not in (8000, 16000, 32000, 48000):
+            raise ValueError(f"Unsupported sample rate for VAD: {sr}")
+        self.sr = sr
+        self.vad = webrtcvad.Vad(vad_mode)
+        self.frame_length = int(sr * frame_ms / 1000)
+        self.start_frames = start_frames
+        self.end_frames = max(1, int(end_silence_ms / frame_ms))
+        self.pre_roll = int(sr * pre_roll_ms / 1000)
+        self.min_speech = int(sr * min_speech_ms / 1000)
+        self.max_utterance = int(sr * max_utterance_sec)
+        self.silence_energy = silence_rms ** 2
+        self.ring = RingBuffer(int(sr * max(buffer_sec, max_utterance_sec + pre_roll_ms / 1000 + 1)))
+
+        self._leftover = b""
+        self._next_frame = 0      # absolute index of the next frame to classify
+        self._speech_run = 0      # consecutive speech frames while idle
+        self._silence_run = 0     # consecutive silent frames inside an utterance
+        self._utterance_start = None
+        self._speech_start = 0
+        self._last_speech_end = 0
+
+    @property
+    def in_speech(self):
+        return self._utterance_start is not None
+
+    def feed(self, chunk):
+        """Add raw little-endian int16 bytes; returns a list of finished utterances"""
+        return [samples for kind, samples in self.feed_events(chunk) if kind == "end"]
+
+    def feed_events(self, chunk):
+        """Like feed(), but returns (kind, samples) events in stream order.
+
+        kind is "start" (samples None) when an utterance begins, "end" with
+        the utterance, or "discarded" with the audio of an utterance that had
+        less than `min_speech_ms` of speech.
+        """
+        data = self._leftover + bytes(chunk)
+        usable = len(data) - len(data) % 2
+        self._leftover = data[usable:]
+        if usable:
+            self.ring.write(np.frombuffer(data, dtype="<i2", count=usable // 2))
+
+        events = []
+        # A chunk larger than the ring overwrote unclassified audio; skip ahead
+        self._next_frame = max(self._next_frame, self.ring.oldest)
+        while self._next_frame + self.frame_length <= self.ring.total:
+            start = self._next_frame
+            frame = self.ring.read(start, start + self.frame_length)
+            self._next_frame += self.frame_length
+            event = self._step(start, frame)
+            if event is not None:
+                events.append(event)
+        return events
+
+    def _is_speech(self, frame):
+        if np.mean(np.square(frame, dtype=np.float64)) < self.silence_energy:
+            return False
+        return self.vad.is_speech(frame.tobytes(), self.sr)
+
+    def _step(self, start, frame):
+        end = start + self.frame_length
+        speech = self._is_speech(frame)
+
+        if not self.in_speech:
+            self._speech_run = self._speech_run + 1 if speech else 0
+            if self._speech_run >= self.start_frames:
+                first_speech = end - self._speech_run * self.frame_length
+                self._speech_start = first_speech
+                self._utterance_start = max(self.ring.oldest, first_speech - self.pre_roll)
+                self._last_speech_end = end
+                self._silence_run = 0
+                return ("start", None)
+            return None
+
+        if speech:
+            self._silence_run = 0
+            self._last_speech_end = end
+        else:
+            self._silence_run += 1
+
+        if self._silence_run >= self.end_frames or end - self._utterance_start >= self.max_utterance:
+            return self._finish(end)
+        return None
+
+    def _finish(self, end):
+        start = self._utterance_start
+        speech_length = self._last_speech_end - self._speech_start
+        self._utterance_start = None
+        self._speech_run = 0
+        self._silence_run = 0
+        if speech_length < self.min_speech:
+            logger.debug("Dropping utterance shorter than min_speech_ms")
+            return ("discarded", self.ring.read(start, end))
+        return ("end", self.ring.read(start, end))
+
+    def flush(self):
+        """End the stream: return the utterance in progress, if any"""
+        event = self.flush_event()
+        return event[1] if event is not None and event[0] == "end" else None
+
+    def flush_event(self):
+        """End the stream: the "end" or "discarded" event of the utterance in progress, if any"""
+        if not self.in_speech:
+            return None
+        return self._finish(self.ring.total)
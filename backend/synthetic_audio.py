@@ -0,0 +1,51 @@
+"""Deterministic synthetic clips for benchmarks, warm-up and load tests.
+
+All generators return mono int16 samples at 16 kHz and depend only on
+their arguments, so the same seed always gives the same clip.
+"""
+import numpy as np
+
+SAMPLE_RATE = 16000
+KINDS = ("speech", "noise", "silence")
+
+
+def speech_like(duration=3.0, seed=0, sr=SAMPLE_RATE, speech_sec=0.8, level=8000):
+    """Voiced, syllable-modulated harmonic tone (rough stand-in for a spoken command) in low noise"""
+    rng = np.random.default_rng(seed)
+    n = int(duration * sr)
+    clip = rng.normal(0, 30, n)
+
+    length = min(n, int(speech_sec * sr))
+    start = int(rng.integers(0, n - length + 1))
+    t = np.arange(length) / sr
+    # Gliding pitch with a handful of decaying harmonics
+    f0 = rng.uniform(110, 220) * (1 + 0.15 * np.sin(2 * np.pi * rng.uniform(1, 3) * t))
+    phase = 2 * np.pi * np.cumsum(f0) / sr
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 9))
+    # Two "syllables" and a smooth attack/release
+    syllables = np.clip(np.sin(np.pi * t * 2 / speech_sec), 0, None) ** 0.5
+    envelope = syllables * np.hanning(length)
+    clip[start:start + length] += level * envelope * voiced / np.max(np.abs(voiced))
+    return np.clip(clip, -32768, 32767).astype(np.int16)
+
+
+def noise(duration=3.0, seed=0, sr=SAMPLE_RATE, level=3000):
+    """Stationary white noise"""
+    rng = np.random.default_rng(seed)
+    return np.clip(rng.normal(0, level, int(duration * sr)), -32768, 32767).astype(np.int16)
+
+
+def silence(duration=3.0, seed=0, sr=SAMPLE_RATE, level=2):
+    """Near-digital silence with a little dither"""
+    rng = np.random.default_rng(seed)
+    return rng.integers(-level, level + 1, int(duration * sr)).astype(np.int16)
+
+
+def make_clip(kind, duration=3.0, seed=0):
+    if kind == "speech":
+        return speech_like(duration, seed)
+    if kind == "noise":
+        return noise(duration, seed)
+    if kind == "silence":
+        return silence(duration, seed)
+    raise ValueError(f"Unknown clip kind: {kind} (expected one of {KINDS})")
@@ -8,11 +8,8 @@ from pydub import AudioSegment
 import librosa
 import torch
 import torch.nn as nn
-import tensorflow as tf
-from tqdm import tqdm
-import sounddevice as sd
-from pynput import keyboard
 import time
+import argparse
 
 class AudioCommandDetector:
     def __init__(self, model_path='audio_classifier_best.pth'):
@@ -158,6 +155,7 @@ class AudioCommandDetector:
         mel_spec_norm = (mel_spec_db - mel_spec_db.min()) / (mel_spec_db.max() - mel_spec_db.min())
         
         # Resize về kích thước cố định (128, 32)
+        import tensorflow as tf
         mel_spec_norm = tf.image.resize(mel_spec_norm[..., np.newaxis], (128, 32))
         mel_spec_norm = mel_spec_norm.numpy()
         mel_spec_norm = mel_spec_norm[..., 0]
@@ -201,6 +199,7 @@ def record_audio(duration=3, sample_rate=16000):
     
     try:
         # Ghi âm
+        import sounddevice as sd
         recording = sd.rec(int(duration * sample_rate), samplerate=sample_rate, channels=1, dtype='int16')
         sd.wait()
         
@@ -213,7 +212,59 @@ def record_audio(duration=3, sample_rate=16000):
         print(f"Lỗi khi ghi âm: {str(e)}")
         return None
 
+def print_result(result):
+    print("\nKết quả dự đoán:")
+    print(f"Lệnh: {result['predicted_class']}")
+    print(f"Độ tin cậy: {result['confidence']:.2%}")
+    print("\nTop 3 dự đoán:")
+    for class_name, prob in result['top3_predictions']:
+        print(f"{class_name}: {prob:.2%}")
+
+def listen_continuously(args):
+    """Nghe liên tục: VAD tách từng câu lệnh và phân loại ngay trong bộ nhớ"""
+    from audio_command_detector import AudioCommandDetector as StreamingDetector
+    from listener import open_source, listen
+
+    detector = StreamingDetector(runtime=args.runtime)
+    source = open_source(args.source, realtime=args.speed == "realtime", device=args.input_device,
+                         loop=args.loop)
+    print("Đang nghe... Nhấn Ctrl+C để thoát." if args.source == "mic" else f"Đang phát lại {args.source}...")
+
+    latencies = []
+    start = time.perf_counter()
+    try:
+        for event in listen(detector, source, device_id=args.device_id):
+            latencies.append(event["latency_ms"])
+            data = event["result"]["data"]
+            status = event["result"].get("rejected") or f"{data['confidence']:.2%}"
+            print(f"[{event['stream_sec']:7.2f}s] {data['predicted_class']:<14} {status:<10} "
+                  f"{event['duration_sec']:.2f}s audio, {event['latency_ms']:.0f} ms  ({event['source']})")
+    except KeyboardInterrupt:
+        print("\nĐã thoát chương trình.")
+    finally:
+        detector.close()
+
+    if latencies:
+        elapsed = time.perf_counter() - start
+        print(f"\n{len(latencies)} câu lệnh trong {elapsed:.1f}s, độ trễ trung bình {np.mean(latencies):.0f} ms, "
+              f"p95 {np.percentile(latencies, 95):.0f} ms")
+
 def main():
+    parser = argparse.ArgumentParser(description="Thử nhận dạng lệnh giọng nói")
+    parser.add_argument("--continuous", action="store_true",
+                        help="nghe liên tục thay vì nhấn Enter để ghi âm 3 giây")
+    parser.add_argument("--source", default="mic", help="'mic' hoặc file/thư mục WAV để phát lại")
+    parser.add_argument("--speed", choices=("realtime", "max"), default="realtime",
+                        help="tốc độ phát lại file WAV")
+    parser.add_argument("--loop", action="store_true", help="phát lại lặp vô hạn")
+    parser.add_argument("--input-device", default=None, help="thiết bị ghi âm của sounddevice")
+    parser.add_argument("--device-id", default="local-cli", help="id cho noise profile")
+    parser.add_argument("--runtime", default="eager", help="eager, torchscript, onnx, int8-dynamic, int8-static")
+    args = parser.parse_args()
+
+    if args.continuous:
+        return listen_continuously(args)
+
     # Khởi tạo detector
     detector = AudioCommandDetector()
     while True:
@@ -227,13 +278,7 @@ def main():
             
             # Dự đoán lệnh
             result = detector.predict(audio_file)
-            
-            print("\nKết quả dự đoán:")
-            print(f"Lệnh: {result['predicted_class']}")
-            print(f"Độ tin cậy: {result['confidence']:.2%}")
-            print("\nTop 3 dự đoán:")
-            for class_name, prob in result['top3_predictions']:
-                print(f"{class_name}: {prob:.2%}")
+            print_result(result)
             
             print("\nNhấn Ctrl+C để thoát hoặc Enter để ghi âm tiếp...")
             
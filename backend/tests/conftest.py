@@ -0,0 +1,15 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# The backend modules are imported as top-level modules, as app.py does
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from esp32_stub import StubESP32Server  # noqa: E402
+
+
+@pytest.fixture
+def stub():
+    with StubESP32Server(seed=0) as server:
+        yield server
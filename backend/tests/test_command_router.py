@@ -0,0 +1,91 @@
+import asyncio
+
+from command_router import CommandRouter, RoutingTable
+
+
+def run(stub, scenario, **kwargs):
+    """Run scenario(router) against the stub and return its result once everything is delivered"""
+    async def main():
+        router = CommandRouter(RoutingTable.single(stub.url), retries=0, **kwargs)
+        try:
+            result = await scenario(router)
+            await router.drain()
+            return result
+        finally:
+            await router.close()
+    return asyncio.run(main())
+
+
+def received(stub):
+    return [cmd for _, cmd in stub.commands]
+
+
+def test_newer_command_supersedes_queued_one_of_any_age(stub):
+    stub.latency_ms = 300
+
+    async def scenario(router):
+        await router.submit("bat_quat")
+        stale = await router.submit("bat_den")
+        # Older than the coalesce window by the time tat_den arrives
+        await asyncio.sleep(0.15)
+        latest = await router.submit("tat_den")
+        return await router.result(stale), latest
+
+    stale, latest = run(stub, scenario, coalesce_window=0.05)
+
+    assert received(stub) == ["bat_quat", "tat_den"]
+    assert stale["status"] == "coalesced"
+    assert stale["superseded_by"] == latest
+
+
+def test_repeat_of_in_flight_command_is_dropped(stub):
+    stub.latency_ms = 300
+
+    async def scenario(router):
+        first = await asyncio.gather(router.send("bat_tv"), router.send("bat_tv"))
+        return first, (await router.stats())["devices"]["esp32"]
+
+    (sent, repeat), stats = run(stub, scenario)
+
+    assert received(stub) == ["bat_tv"]
+    assert sent["status"] == "sent"
+    assert repeat["status"] == "duplicate"
+    assert repeat["superseded_by"] == sent["id"]
+    assert stats["duplicates"] == 1
+
+
+def test_repeat_after_coalesce_window_is_delivered(stub):
+    async def scenario(router):
+        await router.send("bat_tv")
+        within = await router.send("bat_tv")
+        await asyncio.sleep(0.15)
+        after = await router.send("bat_tv")
+        return within, after
+
+    within, after = run(stub, scenario, coalesce_window=0.1)
+
+    assert within["status"] == "duplicate"
+    assert after["status"] == "sent"
+    assert received(stub) == ["bat_tv", "bat_tv"]
+
+
+def test_full_queue_rejects_new_targets_only(stub):
+    stub.latency_ms = 300
+
+    async def scenario(router):
+        await router.submit("bat_quat")
+        await asyncio.sleep(0.05)
+        await router.submit("bat_den")
+        await router.submit("bat_tv")
+        rejected = await router.send("bat_dieu_hoa")
+        # Replacing a queued command frees its slot
+        replacement = await router.submit("tat_den")
+        return rejected, await router.result(replacement), (await router.stats())["devices"]["esp32"]
+
+    rejected, replacement, stats = run(stub, scenario, max_queue=2)
+
+    assert rejected["status"] == "error"
+    assert "full" in rejected["error"]
+    assert replacement["status"] == "queued"
+    assert stats["dropped"] == 1
+    assert received(stub) == ["bat_quat", "bat_tv", "tat_den"]
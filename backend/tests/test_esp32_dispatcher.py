@@ -0,0 +1,103 @@
+import time
+import socket
+import asyncio
+
+import pytest
+
+from esp32_dispatcher import ESP32Dispatcher, DispatchError
+from command_router import CommandRouter, RoutingTable
+
+
+def send(dispatcher, command):
+    async def run():
+        try:
+            return await dispatcher.send(command)
+        finally:
+            await dispatcher.close()
+    return asyncio.run(run())
+
+
+def unused_url():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return f"http://127.0.0.1:{sock.getsockname()[1]}"
+
+
+def test_delivers_command(stub):
+    assert send(ESP32Dispatcher(stub.url), "bat_den") == 1
+    assert [cmd for _, cmd in stub.commands] == ["bat_den"]
+
+
+def test_retries_5xx_with_backoff(stub):
+    stub.failure_rate = 1.0
+    dispatcher = ESP32Dispatcher(stub.url, retries=2, backoff=0.05)
+    start = time.perf_counter()
+    with pytest.raises(DispatchError) as excinfo:
+        send(dispatcher, "bat_den")
+    elapsed = time.perf_counter() - start
+
+    assert excinfo.value.attempts == 3
+    assert "500" in str(excinfo.value)
+    assert len(stub.commands) == 3
+    # Jittered 0.05 s then 0.1 s, each at least half its nominal delay
+    assert elapsed >= 0.075
+    assert dispatcher.stats()["retries"] == 2
+
+
+def test_retries_connection_errors():
+    dispatcher = ESP32Dispatcher(unused_url(), retries=1, backoff=0.01)
+    with pytest.raises(DispatchError) as excinfo:
+        send(dispatcher, "bat_den")
+    assert excinfo.value.attempts == 2
+    assert "ConnectError" in str(excinfo.value)
+
+
+def test_does_not_retry_4xx(stub):
+    stub.failure_rate = 1.0
+    stub.failure_status = 404
+    with pytest.raises(DispatchError) as excinfo:
+        send(ESP32Dispatcher(stub.url, retries=2, backoff=0.01), "bat_den")
+    assert excinfo.value.attempts == 1
+    assert "404" in str(excinfo.value)
+    assert len(stub.commands) == 1
+
+
+def test_times_out_slow_device(stub):
+    stub.latency_ms = 500
+    dispatcher = ESP32Dispatcher(stub.url, timeout=0.1, retries=0)
+    start = time.perf_counter()
+    with pytest.raises(DispatchError) as excinfo:
+        send(dispatcher, "bat_den")
+    assert "Timeout" in str(excinfo.value)
+    assert time.perf_counter() - start < 0.4
+
+
+def test_command_status_lifecycle(stub, monkeypatch):
+    """/send-command then /commands/{id}: queued -> sending -> sent, or error"""
+    from fastapi.testclient import TestClient
+    import app
+
+    stub.latency_ms = 300
+    # No model needed for the command endpoints
+    monkeypatch.setattr(app, "load_models", lambda: None)
+    monkeypatch.setattr(app, "ESP32_DISPATCH_MODE", "background")
+
+    with TestClient(app.app) as client:
+        router = CommandRouter(RoutingTable.single(stub.url), retries=0)
+        monkeypatch.setattr(app, "esp32", router)
+        # Queue on the app's event loop, behind a command the device is still busy with
+        client.portal.call(router.submit, "bat_quat")
+        command_id = client.portal.call(router.submit, "bat_den")
+        assert client.get(f"/commands/{command_id}").json()["status"] == "queued"
+        time.sleep(0.45)
+        assert client.get(f"/commands/{command_id}").json()["status"] == "sending"
+        client.portal.call(router.drain)
+        record = client.get(f"/commands/{command_id}").json()
+        assert record["status"] == "sent"
+        assert record["attempts"] == 1
+        assert record["latency_ms"] >= 300
+
+        stub.failure_rate = 1.0
+        response = client.post("/send-command", json={"command": "tat_den"})
+        assert response.status_code == 500
+        assert client.get("/commands/unknown-id").status_code == 404
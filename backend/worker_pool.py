@@ -0,0 +1,142 @@
+import os
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class PoolSaturatedError(RuntimeError):
+    """Raised when the admission queue is full and the request should be retried later"""
+
+    def __init__(self, retry_after):
+        super().__init__("Inference queue is full")
+        self.retry_after = retry_after
+
+
+def intra_op_threads(workers):
+    """Split the available cores between pool workers"""
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+
+def batch_size_for(mode, workers):
+    """Largest batch one detector can see: one request per thread that can call it at once.
+
+    Thread mode shares one detector between `workers` threads; in process
+    mode each process serves a single call at a time, so batching is off.
+    """
+    return 1 if mode == "process" else max(1, int(workers))
+
+
+def configure_threads(num_threads):
+    """Size torch and BLAS/OpenMP thread pools for the current process"""
+    import torch
+    torch.set_num_threads(num_threads)
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(num_threads)
+    except ImportError:
+        pass
+
+
+# Process mode: each worker process owns its own detector
+_process_detector = None
+
+
+def _init_process_worker(num_threads, detector_kwargs):
+    global _process_detector
+    os.environ["OMP_NUM_THREADS"] = str(num_threads)
+    configure_threads(num_threads)
+    from audio_command_detector import AudioCommandDetector
+    _process_detector = AudioCommandDetector(**detector_kwargs)
+    _process_detector.warm_up()
+
+
+def _worker_pid():
+    return os.getpid()
+
+
+def process_call(method, *args):
+    """Run an AudioCommandDetector method inside a process-pool worker"""
+    return getattr(_process_detector, method)(*args)
+
+
+class InferencePool:
+    """Runs blocking inference off the event loop with bounded admission.
+
+    At most `max_pending` calls may be running or waiting for a worker; past
+    that, run() raises PoolSaturatedError instead of queueing more latency.
+    """
+
+    def __init__(self, workers=2, mode="thread", max_pending=None, retry_after=1, detector=None,
+                 detector_kwargs=None):
+        self.detector = detector
+        self.workers = max(1, int(workers))
+        self.mode = mode
+        self.max_pending = max_pending or self.workers * 4
+        self.retry_after = retry_after
+        # Thread mode: one batching thread runs every forward pass, so it gets all the cores
+        self.num_threads = intra_op_threads(self.workers) if mode == "process" else (os.cpu_count() or 1)
+        self._pending = 0
+        self._rejected = 0
+        self._completed = 0
+
+        if mode == "process":
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_process_worker,
+                initargs=(self.num_threads, detector_kwargs or {}),
+            )
+        elif mode == "thread":
+            configure_threads(self.num_threads)
+            self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inference")
+        else:
+            raise ValueError(f"Unknown worker pool mode: {mode}")
+        logger.info(f"🧵 Inference pool: {self.workers} {mode} workers, "
+                    f"{self.num_threads} intra-op threads, max {self.max_pending} pending")
+
+    async def run(self, fn, *args):
+        """Run fn(*args) on the pool, rejecting immediately when the queue is full"""
+        if self._pending >= self.max_pending:
+            self._rejected += 1
+            raise PoolSaturatedError(self.retry_after)
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self.executor, fn, *args)
+            self._completed += 1
+            return result
+        finally:
+            self._pending -= 1
+
+    async def call(self, method, *args):
+        """Run detector.<method>(*args) on the pool (the worker's own detector in process mode)"""
+        if self.mode == "process":
+            return await self.run(process_call, method, *args)
+        return await self.run(getattr(self.detector, method), *args)
+
+    def warm_up(self):
+        """Block until every worker has a loaded and warmed-up detector"""
+        if self.mode == "process":
+            # Workers spawn on demand and warm up in their initializer
+            futures = [self.executor.submit(_worker_pid) for _ in range(self.workers)]
+            pids = {future.result() for future in futures}
+            logger.info(f"🔥 {len(pids)} inference processes ready")
+        else:
+            self.detector.warm_up()
+
+    def stats(self):
+        return {
+            "mode": self.mode,
+            "workers": self.workers,
+            "intra_op_threads": self.num_threads,
+            "pending": self._pending,
+            "max_pending": self.max_pending,
+            "completed": self._completed,
+            "rejected": self._rejected,
+        }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -5,6 +5,7 @@ import ControlPanel from './components/ControlPanel';
 import Results from './components/Results';
 import WakewordListener from './components/WakewordListener';
 import { AUDIO_CONFIG } from './constants/audio';
+import { COMMAND_POLL, COMMAND_STATUS } from './constants/commands';
 import { createAudioContext, convertToWav } from './utils/audio';
 import { getErrorMessage } from './utils/helpers';
 import './App.css';
@@ -29,6 +30,30 @@ function App() {
   const countdownTimerRef = useRef(null);
   const startTimeRef = useRef(null);
 
+  // The API answers before the device does; follow a queued command until it is sent, fails or is replaced
+  const pollCommand = async (commandId) => {
+    for (let attempt = 0; attempt < COMMAND_POLL.MAX_ATTEMPTS; attempt++) {
+      await new Promise((resolve) => setTimeout(resolve, COMMAND_POLL.INTERVAL_MS));
+      let record;
+      try {
+        const res = await axios.get(`http://localhost:8000/commands/${commandId}`);
+        record = res.data;
+      } catch (err) {
+        console.error('❌ Command status error:', getErrorMessage(err));
+        return;
+      }
+      setResult((current) =>
+        current?.data?.command_id === commandId
+          ? {
+              ...current,
+              data: { ...current.data, command_status: record.status, command_error: record.error },
+            }
+          : current
+      );
+      if (record.status !== COMMAND_STATUS.QUEUED && record.status !== COMMAND_STATUS.SENDING) return;
+    }
+  };
+
   const handleUpload = async (blob = audioState.blob) => {
     if (!blob) return;
     setLoading(true);
@@ -45,6 +70,10 @@ function App() {
       });
       console.log('✅ Command result:', res.data);
       setResult(res.data);
+      const { command_id: commandId, command_status: commandStatus } = res.data.data;
+      if (commandId && (commandStatus === COMMAND_STATUS.QUEUED || commandStatus === COMMAND_STATUS.SENDING)) {
+        pollCommand(commandId);
+      }
     } catch (err) {
       console.error('❌ Command error:', getErrorMessage(err));
       setResult({
@@ -20,6 +20,14 @@ const Results = ({ result, loading }) => {
     switch (result.data.command_status) {
       case COMMAND_STATUS.SENT:
         return '✅ Command sent successfully';
+      case COMMAND_STATUS.QUEUED:
+        return '📨 Command queued';
+      case COMMAND_STATUS.SENDING:
+        return '📨 Sending command to device...';
+      case COMMAND_STATUS.COALESCED:
+        return '🔀 Replaced by a newer command for the same device';
+      case COMMAND_STATUS.DUPLICATE:
+        return '🔀 Same command was just sent to the device';
       case COMMAND_STATUS.ERROR:
         if (result.data.command_error) {
           if (result.data.command_error.includes('Connection to') && result.data.command_error.includes('timed out')) {
@@ -119,6 +127,7 @@ Results.propTypes = {
       command_status: PropTypes.string,
       command_error: PropTypes.string,
       command_reason: PropTypes.string,
+      command_id: PropTypes.string,
       top3_predictions: PropTypes.arrayOf(PropTypes.array),
     }),
   }),
@@ -16,6 +16,16 @@ export const COMMAND_MAPPING = {
 
 export const COMMAND_STATUS = {
   SENT: 'sent',
+  QUEUED: 'queued',
+  SENDING: 'sending',
+  COALESCED: 'coalesced',
+  DUPLICATE: 'duplicate',
   ERROR: 'error',
   NOT_SENT: 'not_sent',
 };
+
+// Queued commands are polled on /commands/{id} until the device answers
+export const COMMAND_POLL = {
+  INTERVAL_MS: 500,
+  MAX_ATTEMPTS: 20,
+};